@@ -0,0 +1,315 @@
+"""Character abilities compiled from characters.json into resolver objects.
+
+Each character template yields a basic, skill and ultimate Ability whose
+range, damage, pattern and effects are read from the template once when the
+catalog loads. attack() then runs a fixed pipeline: validate costs, call the
+resolver registered for the ability's pattern, and apply SP/energy changes.
+New patterns are added by registering a resolver in RESOLVERS or HEAL_RESOLVERS.
+Resolvers work on a battle.Battle: targets are looked up in its unit
+registries and area patterns query its OccupancyGrid.
+"""
+
+from units import element_name
+
+HEAL_PATTERNS = ('healing', 'mass-heal', 'buff-heal', 'revive-heal')
+# Patterns that deal no damage and so grant no energy
+NON_DAMAGE_PATTERNS = HEAL_PATTERNS + ('buff', 'debuff')
+
+
+class AbilityError(Exception):
+    """An ability cannot be used as requested; raised before anything is changed"""
+
+
+def calculate_element_effectiveness(attacker_element, defender_element):
+    """Calculate damage multiplier based on element effectiveness"""
+    return 1.0  # Normal damage
+
+
+_MULTIPLIERS = {}
+
+
+def element_multiplier(attacker_element, defender_element):
+    """calculate_element_effectiveness for interned element ids (see units.py), cached per pair"""
+    pair = (attacker_element, defender_element)
+    multiplier = _MULTIPLIERS.get(pair)
+    if multiplier is None:
+        multiplier = _MULTIPLIERS[pair] = calculate_element_effectiveness(
+            element_name(attacker_element), element_name(defender_element))
+    return multiplier
+
+
+class Ability:
+    """One attack of one character, with every template lookup already resolved"""
+
+    __slots__ = ('char_id', 'attack_type', 'pattern', 'target_pattern', 'damage', 'area_range',
+                 'fixed_range', 'energy_cost', 'status_effect', 'self_damage',
+                 'is_heal', 'energy_targets', 'resolver')
+
+    def __init__(self, template, attack_type):
+        self.char_id = template['id']
+        self.attack_type = attack_type
+        self.energy_cost = 0
+        self.status_effect = None
+        self.fixed_range = None
+        if attack_type == 'ultimate':
+            self.fixed_range = template.get('ultimate_attack_range', 99)
+            self.damage = template.get('ultimate_attack_damage', 100)
+            self.pattern = template.get('ultimate_attack_type', 'single')
+            self.target_pattern = template.get('ultimate_attack_pattern', self.pattern)
+            self.area_range = template.get('ultimate_attack_area_range', 2)
+            self.energy_cost = template.get('ultimate_energy_cost', 100)
+            self.status_effect = template.get('ultimate_status_effect') or None
+        elif attack_type == 'skill':
+            self.damage = template.get('skill_attack_damage', 25)
+            self.pattern = template.get('skill_attack_type', 'single')
+            # Additional pattern details for healing and area attacks
+            self.target_pattern = template.get('skill_attack_pattern', self.pattern)
+            self.area_range = template.get('skill_attack_area_range', 2)
+        else:
+            self.damage = template.get('basic_attack_damage', 25)
+            self.pattern = template.get('basic_attack_type', 'single')
+            self.target_pattern = template.get('basic_attack_pattern', self.pattern)
+            self.area_range = template.get('basic_attack_area_range', 1)
+
+        # Rex the Berserker's skill costs him 10 HP (Berserker Rage)
+        self.self_damage = 10 if self.char_id == 5 and attack_type == 'skill' else 0
+
+        self.is_heal = self.pattern in HEAL_PATTERNS
+        if self.is_heal:
+            self.resolver = HEAL_RESOLVERS.get(self.target_pattern, _resolve_nothing)
+        else:
+            self.resolver = RESOLVERS.get(self.pattern, _resolve_nothing)
+
+        # How many enemies the energy gain assumes were hit (see energy_gain)
+        if self.pattern in NON_DAMAGE_PATTERNS:
+            self.energy_targets = None
+        elif self.pattern == 'single':
+            self.energy_targets = 'one'
+        elif self.pattern in ('area', 'lifesteal-area', 'poison-area', 'chaos-area'):
+            self.energy_targets = 'area'
+        elif self.pattern in ('full-area', 'shield-break', 'all-enemies'):
+            self.energy_targets = 'all'
+        else:
+            self.energy_targets = None
+
+    def attack_range(self, attacker):
+        """Range for this use; basic and skill ranges come from the battle unit"""
+        if self.fixed_range is not None:
+            return self.fixed_range
+        if self.attack_type == 'skill' and attacker.skill_attack_range is not None:
+            return attacker.skill_attack_range
+        return attacker.attack_range
+
+    def resolve(self, battle, attacker, target_id=None, target_x=None, target_y=None):
+        """Apply the ability's effect to the battle; raises AbilityError if the target is invalid"""
+        self.resolver(self, battle, attacker, self.attack_range(attacker), target_id, target_x, target_y)
+        remove_defeated_enemies(battle)
+
+    def energy_gain(self, enemies_left):
+        """Approximate energy earned from the damage dealt (10% of damage, 5-20 per attack)"""
+        if self.energy_targets == 'one':
+            damage_dealt = self.damage
+        elif self.energy_targets == 'area':
+            damage_dealt = self.damage * min(2, enemies_left)  # Estimate based on enemies hit
+        elif self.energy_targets == 'all':
+            damage_dealt = self.damage * enemies_left
+        else:
+            return 0
+        if damage_dealt <= 0:
+            return 0
+        return min(20, max(5, int(damage_dealt * 0.1)))
+
+
+def compile_abilities(characters):
+    """Build {char_id: {'basic'|'skill'|'ultimate': Ability}} for a catalog's characters"""
+    return {
+        template['id']: {attack_type: Ability(template, attack_type) for attack_type in ('basic', 'skill', 'ultimate')}
+        for template in characters
+    }
+
+
+# --- Shared steps ---
+
+def _distance(x1, y1, x2, y2):
+    return abs(x1 - x2) + abs(y1 - y2)
+
+
+def _check_area_target(attacker, attack_range, target_x, target_y, what='area'):
+    if target_x is None or target_y is None:
+        raise AbilityError(f'No target coordinates specified{" for area heal" if what == "heal" else ""}')
+    if _distance(target_x, target_y, attacker.x, attacker.y) > attack_range:
+        raise AbilityError('Target area is out of range')
+
+
+def strike(attacker_element, enemy, damage, ignore_shield=False):
+    """Hit an enemy through its shield; returns the HP damage dealt.
+
+    A shield blocks 90% of a hit (at least 1 damage gets through) and only
+    loses shield HP to the elements it is weak to.
+    """
+    modified_damage = int(damage * element_multiplier(attacker_element, enemy.element))
+    shield_hp = enemy.shield_hp
+    if shield_hp > 0 and not ignore_shield:
+        if attacker_element in enemy.shield_weak_to:
+            enemy.shield_hp = max(0, shield_hp - min(modified_damage, shield_hp))
+        dealt = max(1, int(modified_damage * 0.1))
+    else:
+        dealt = modified_damage
+    enemy.hp -= dealt
+    return dealt
+
+
+def apply_status(battle, side, unit, effect, duration):
+    if effect:
+        battle.apply_status(side, unit, effect, duration)
+
+
+def heal(unit, amount):
+    unit.hp = min(unit.max_hp, unit.hp + amount)
+
+
+def remove_defeated_enemies(battle):
+    """Drop every defeated enemy in one pass once an ability has resolved"""
+    for enemy in battle.enemies:
+        if enemy.hp <= 0:
+            battle.enemies.kill(enemy)
+    battle.end_step()
+
+
+# --- Damage resolvers ---
+
+def _resolve_nothing(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    pass
+
+
+def _resolve_single(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    if not target_id:
+        raise AbilityError('No target specified')
+    target = battle.enemies.get(target_id)
+    if not target:
+        raise AbilityError('Invalid target')
+    if _distance(target.x, target.y, attacker.x, attacker.y) > attack_range:
+        raise AbilityError('Target is out of range')
+    strike(attacker.element, target, ability.damage)
+
+
+def _resolve_area(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Area attack around a target point
+    _check_area_target(attacker, attack_range, target_x, target_y)
+    element = attacker.element
+    for enemy in battle.grid.within('enemies', target_x, target_y, ability.area_range):
+        strike(element, enemy, ability.damage)
+
+
+def _resolve_full_area(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Attack all enemies within the attacker's range
+    element = attacker.element
+    for enemy in battle.grid.within('enemies', attacker.x, attacker.y, attack_range):
+        strike(element, enemy, ability.damage)
+
+
+def _resolve_shield_break(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Shield-breaking attack that destroys all shields in range, then hits unshielded
+    element = attacker.element
+    if attack_range == 99:
+        targets = battle.enemies
+    else:
+        targets = battle.grid.within('enemies', attacker.x, attacker.y, attack_range)
+    for enemy in targets:
+        enemy.shield_hp = 0
+        strike(element, enemy, ability.damage, ignore_shield=True)
+
+
+def _resolve_all_enemies(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Damage all enemies regardless of range
+    element = attacker.element
+    for enemy in battle.enemies:
+        strike(element, enemy, ability.damage)
+        apply_status(battle, 'enemies', enemy, ability.status_effect, 3)  # 3 turns for ultimate status effects
+
+
+def _resolve_debuff(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Apply debuff without damage (like vulnerability) to all enemies
+    for enemy in battle.enemies:
+        apply_status(battle, 'enemies', enemy, ability.status_effect, 2)  # 2 turns for debuffs
+
+
+def _resolve_special_area(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Lifesteal, poison and chaos area attacks; chaos ignores and strips shields
+    _check_area_target(attacker, attack_range, target_x, target_y)
+    element = attacker.element
+    chaos = ability.pattern == 'chaos-area'
+    total_damage_dealt = 0
+    for enemy in battle.grid.within('enemies', target_x, target_y, ability.area_range):
+        total_damage_dealt += strike(element, enemy, ability.damage, ignore_shield=chaos)
+        if chaos:
+            enemy.shield_hp = 0
+        apply_status(battle, 'enemies', enemy, ability.status_effect, 4)  # Longer duration for ultimate effects
+    if ability.pattern == 'lifesteal-area':
+        heal(attacker, int(total_damage_dealt * 0.25))  # 25% lifesteal
+
+
+def _resolve_buff(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Team-wide buffs
+    for ally in battle.characters:
+        apply_status(battle, 'characters', ally, ability.status_effect, 3)  # 3 turns for team buffs
+
+
+RESOLVERS = {
+    'single': _resolve_single,
+    'area': _resolve_area,
+    'full-area': _resolve_full_area,
+    'shield-break': _resolve_shield_break,
+    'all-enemies': _resolve_all_enemies,
+    'debuff': _resolve_debuff,
+    'lifesteal-area': _resolve_special_area,
+    'poison-area': _resolve_special_area,
+    'chaos-area': _resolve_special_area,
+    'buff': _resolve_buff,
+}
+
+
+# --- Heal resolvers, keyed by target pattern ---
+
+def _heal_single(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    if not target_id:
+        # If no target specified for single heal, heal self
+        heal(attacker, ability.damage)
+        return
+    target = battle.characters.get(target_id)
+    if not target:
+        raise AbilityError('Invalid healing target')
+    if _distance(target.x, target.y, attacker.x, attacker.y) > attack_range:
+        raise AbilityError('Target is out of range')
+    heal(target, ability.damage)
+
+
+def _heal_area(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Heal all allies within area_range tiles of the target point
+    _check_area_target(attacker, attack_range, target_x, target_y, what='heal')
+    for ally in battle.grid.within('characters', target_x, target_y, ability.area_range):
+        heal(ally, ability.damage)
+
+
+def _heal_team(ability, battle, attacker, attack_range, target_id, target_x, target_y):
+    # Heal all allies within the attacker's range, or the whole team for team-wide
+    if ability.target_pattern == 'team-wide':
+        allies = battle.characters
+    else:
+        allies = [ally for ally in battle.grid.within('characters', attacker.x, attacker.y, attack_range)
+                  if ally.id != attacker.id]
+    for ally in allies:
+        if ability.pattern == 'revive-heal':
+            ally.hp = ally.max_hp  # Full heal for revive-heal ultimates
+        else:
+            heal(ally, ability.damage)
+        if ability.attack_type == 'ultimate':
+            apply_status(battle, 'characters', ally, ability.status_effect, 3)  # 3 turns duration
+
+
+HEAL_RESOLVERS = {
+    'single': _heal_single,
+    'area': _heal_area,
+    'full-area': _heal_team,
+    'team-wide': _heal_team,
+}
@@ -1,138 +1,191 @@
 import random
-from flask import Flask, jsonify, request, session, redirect, url_for
-from pathlib import Path
+import click
+from flask import Flask, Response, abort, g, jsonify, request, session, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import safe_join
 import hashlib
 import os
 import json
+import threading
+import time
+from contextlib import ExitStack
+import engine
+import metrics
+from assets import AssetCache
+from battlelog import BattleLog, apply_action, apply_round
+from catalog import Catalog
+from delta import capture, diff_state
+from engine import ActionError, check_mission_complete
+from events import BattleEventBroker, enemy_phase_executor
+from gacha import MAX_PULLS, GachaError
+from locking import locked_for_user, user_lock
+from progression import apply_character_xp, xp_to_next_level
+from storage import StaleStateError, UserUnitOfWork, open_account_store
+from tracing import Tracer
+from units import Unit
+
+# Pages and static files are served from memory with ETags and gzip/brotli variants
+asset_cache = AssetCache()
+STATIC_CACHE_CONTROL = 'public, max-age=300'
 
 def retfromdir(fpath):
-    return Path(fpath).read_text()
+    return asset_cache.response(fpath)
 
-app = Flask(__name__)
+# Static files go through asset_cache instead of Flask's default handler
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.urandom(24)
 
-ACCOUNTS_FILE = 'accounts.json'
+class BattleJSONProvider(DefaultJSONProvider):
+    """Writes in-memory battle units (see units.py) as their wire dicts"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Unit):
+            return o.to_wire()
+        return DefaultJSONProvider.default(o)
 
-def load_accounts_data():
-    if not Path(ACCOUNTS_FILE).exists():
-        with open(ACCOUNTS_FILE, 'w') as f:
-            json.dump({"users": {}, "player_states": {}}, f)
-    with open(ACCOUNTS_FILE, 'r') as f:
-        return json.load(f)
+app.json = BattleJSONProvider(app)
 
-def save_accounts_data(data):
-    with open(ACCOUNTS_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+@app.route('/static/<path:filename>')
+def static_files(filename):
+    path = safe_join('static', filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return asset_cache.response(path, cache_control=STATIC_CACHE_CONTROL)
+
+# 'json' keeps the resident accounts.json store for dev; 'sqlite' is the deployment backend.
+# The JSON store lives in one process's memory, so multi-worker servers need sqlite.
+ACCOUNTS_BACKEND = os.environ.get('ACCOUNTS_BACKEND', 'json')
+ACCOUNTS_FILE = 'accounts.json'
+ACCOUNTS_JOURNAL_FILE = 'accounts.journal'
+ACCOUNTS_DB = os.environ.get('ACCOUNTS_DB', 'accounts.db')
+
+_account_store = None
+_account_store_lock = threading.Lock()
+
+def get_account_store():
+    """Return the resident account store, loading it on first use"""
+    global _account_store
+    if _account_store is None:
+        with _account_store_lock:
+            if _account_store is None:
+                _account_store = open_account_store(ACCOUNTS_BACKEND, ACCOUNTS_FILE, ACCOUNTS_JOURNAL_FILE, ACCOUNTS_DB)
+    return _account_store
+
+metrics.REGISTRY.gauge('open_battles', 'Battles currently in progress',
+                       lambda: get_account_store().count_player_states())
+
+# Per-endpoint request counts and latencies for /metrics
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method)
+        metrics.HTTP_REQUESTS.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+# Opt-in slow-request traces and sampled cProfile dumps; see tracing.py for the settings
+tracer = Tracer.from_env()
+
+@app.before_request
+def start_trace():
+    g.trace = tracer.start(request.endpoint or 'unmatched')
+
+@app.after_request
+def finish_trace(response):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        tracer.finish(trace, method=request.method, path=request.path, status=response.status_code)
+    return response
+
+# Parsed characters/missions/elements, refreshed when the files change on disk
+catalog = Catalog()
+
+# Battles are stored as a seeded snapshot plus a log of the actions since
+battle_log = BattleLog(get_account_store)
 
 def load_missions_data():
-    with open('missions.json', 'r') as f:
-        return json.load(f)
+    return catalog.snapshot().missions
 
 def load_characters_data():
-    with open('characters.json', 'r') as f:
-        return json.load(f)
-
-def calculate_character_stats(base_hp, base_damage, level):
-    """Calculate character stats based on level (current stats are level 20 stats, max level 100)"""
-    # The current stats in characters.json are level 20 stats
-    # Level 1 = 1/20th of level 20 stats, Level 20 = level 20 stats, Level 100 = 5x level 20 stats
-    if level <= 20:
-        multiplier = level / 20.0
-    else:
-        # After level 20, stats continue to grow to 5x base at level 100
-        multiplier = 1.0 + (4.0 * (level - 20) / 80.0)
-    
-    return {
-        'hp': int(base_hp * multiplier),
-        'max_hp': int(base_hp * multiplier),
-        'damage': int(base_damage * multiplier)
-    }
+    return catalog.snapshot().characters
 
-def calculate_level_up_cost(current_level):
-    """Calculate XP needed to level up from current level"""
-    return 100 + current_level
+# Users locked and written per store commit by award_character_xp_bulk
+BULK_XP_CHUNK = 256
 
-def award_character_xp(user_id, char_id, xp_amount):
-    """Award XP to a specific character and handle level ups"""
-    accounts_data = load_accounts_data()
-    
-    # Find user data
-    user_data = None
-    for username, udata in accounts_data['users'].items():
-        if udata['id'] == user_id:
-            user_data = udata
-            break
-    
-    if not user_data:
-        return False
-    
-    # Initialize player_characters if not exists
-    if 'player_characters' not in user_data:
-        user_data['player_characters'] = {}
-    
-    # Initialize character if not exists (start at level 1)
-    if str(char_id) not in user_data['player_characters']:
-        user_data['player_characters'][str(char_id)] = {
-            'level': 1,
-            'xp': 0
-        }
-    
-    char_data = user_data['player_characters'][str(char_id)]
-    char_data['xp'] += xp_amount
-    
-    # Check for level ups
-    level_ups = 0
-    while char_data['level'] < 100:  # Max level 100
-        xp_needed = calculate_level_up_cost(char_data['level'])
-        if char_data['xp'] >= xp_needed:
-            char_data['xp'] -= xp_needed
-            char_data['level'] += 1
-            level_ups += 1
-        else:
-            break
-    
-    save_accounts_data(accounts_data)
-    return level_ups
+def award_character_xp_bulk(grants):
+    """Award XP to many characters of many players in one call.
 
-def get_player_character_data(user_id, char_id):
-    """Get player's character data including level and XP"""
-    accounts_data = load_accounts_data()
-    
-    # Find user data
-    user_data = None
-    for username, udata in accounts_data['users'].items():
-        if udata['id'] == user_id:
-            user_data = udata
-            break
-    
-    if not user_data:
-        return None
-    
-    # Initialize player_characters if not exists
-    if 'player_characters' not in user_data:
-        user_data['player_characters'] = {}
+    `grants` maps user id -> {char_id: xp_amount}. Users are locked and
+    written in chunks with one store commit per chunk. Returns
+    {user_id: {char_id: levels gained}} for the users that exist. Event
+    payouts run it with `flask --app app grant-xp payout.json`.
+    """
+    store = get_account_store()
+    grants = {str(user_id): char_grants for user_id, char_grants in grants.items()}
+    # Sorted so that concurrent bulk grants take the user locks in the same order
+    user_ids = sorted(grants)
+    results = {}
+    for start in range(0, len(user_ids), BULK_XP_CHUNK):
+        chunk = user_ids[start:start + BULK_XP_CHUNK]
+        with ExitStack() as locks:
+            for user_id in chunk:
+                locks.enter_context(user_lock(user_id))
+            updated = []
+            for user_id in chunk:
+                unit = UserUnitOfWork(store, user_id)
+                if not unit:
+                    continue
+                results[user_id] = unit.grant_character_xp(grants[user_id])
+                updated.append((unit.username, unit.user))
+            store.commit_users(updated)
+    return results
+
+def resolve_player_roster(user_id, characters):
+    """Resolve level, XP and level-scaled stats for a list of character templates.
+
+    The player's progress is read from storage once for the whole list, so a
+    roster view or team setup costs one lookup however many characters it has.
+    Returns a dict keyed by character id.
+    """
+    username, user_data = get_account_store().find_user_by_id(user_id)
+    progress = user_data.get('player_characters', {}) if user_data else {}
     
-    # Return character data (default to level 1 if not found)
-    return user_data['player_characters'].get(str(char_id), {'level': 1, 'xp': 0})
+    roster = {}
+    for char in characters:
+        # Default to level 1 if the player has no progress for this character
+        char_progress = progress.get(str(char['id']), {'level': 1, 'xp': 0})
+        level = char_progress['level']
+        roster[char['id']] = {
+            'level': level,
+            'xp': char_progress['xp'],
+            'xp_needed': xp_to_next_level(level),  # XP needed for next level
+            **engine.scaled_stats(char, level),
+        }
+    return roster
 
-def calculate_mission_rewards(stage_id):
+def calculate_mission_rewards(stage_id, rng=random):
     """Calculate XP and material rewards for completing a mission"""
-    missions = load_missions_data()
-    mission = next((m for m in missions if m['id'] == stage_id), None)
+    mission = catalog.snapshot().missions_by_id.get(stage_id)
     if not mission:
         return None
     
     # Calculate XP reward
     xp_reward = mission['xp']['base']
-    if random.random() < mission['xp']['extra_chance']:
-        xp_reward += int(mission['xp']['extra'] * random.random())
+    if rng.random() < mission['xp']['extra_chance']:
+        xp_reward += int(mission['xp']['extra'] * rng.random())
     
     # Calculate material rewards
     material_rewards = {}
     for material_type, material_data in mission['materials'].items():
         amount = material_data['base']
-        if random.random() < material_data['extra_chance']:
-            amount += int(material_data['extra'] * random.random())
+        if rng.random() < material_data['extra_chance']:
+            amount += int(material_data['extra'] * rng.random())
         material_rewards[material_type] = amount
     
     return {
@@ -140,170 +193,69 @@ def calculate_mission_rewards(stage_id):
         'materials': material_rewards
     }
 
-def check_mission_complete(game_state):
-    """Check if the mission is complete (all enemies defeated)"""
-    return len(game_state.get('enemies', [])) == 0
+def award_mission_rewards(user_id, stage_id, game_state, rng=random):
+    """Award mission rewards and close the battle in a single storage commit.
 
-def award_mission_rewards(user_id, stage_id):
-    """Award rewards to player and update their inventory"""
-    accounts_data = load_accounts_data()
-    
-    # Find the user by user_id
-    user_data = None
-    username = None
-    for uname, udata in accounts_data['users'].items():
-        if udata['id'] == user_id:
-            user_data = udata
-            username = uname
-            break
-    
-    if not user_data:
-        return None
-    
-    # Initialize inventory and stats if not exists
-    if 'inventory' not in user_data:
-        user_data['inventory'] = {}
-    if 'total_xp' not in user_data:
-        user_data['total_xp'] = 0
-    
-    # Calculate rewards
-    rewards = calculate_mission_rewards(stage_id)
-    if not rewards:
-        return None
-    
-    # Award XP to player
-    user_data['total_xp'] += rewards['xp']
-    
-    # Award XP to characters used in the mission
-    if user_id in accounts_data['player_states']:
-        game_data = accounts_data['player_states'][user_id]['game_data']
-        if 'characters' in game_data:
-            for character in game_data['characters']:
-                if 'char_id' in character:
-                    char_id = character['char_id']
-                    level_ups = award_character_xp(user_id, char_id, rewards['xp'])
-                    # You could track level ups here if needed for notifications
-    
-    # Award materials
-    for material_type, amount in rewards['materials'].items():
-        if material_type not in user_data['inventory']:
-            user_data['inventory'][material_type] = 0
-        user_data['inventory'][material_type] += amount
-    
-    save_accounts_data(accounts_data)
-    return rewards
+    Player XP, materials, XP and level ups for every character in the battle,
+    and removal of the finished battle are all applied to one unit of work.
+    """
+    with user_lock(user_id):
+        unit = UserUnitOfWork(get_account_store(), user_id)
+        if not unit:
+            return None
+        
+        # Calculate rewards
+        rewards = calculate_mission_rewards(stage_id, rng)
+        if not rewards:
+            return None
+        
+        # Award XP to player
+        unit.add_total_xp(rewards['xp'])
+        
+        # Award XP to characters used in the mission, through the same path as bulk grants
+        team_xp = {}
+        for character in game_state.get('characters', []):
+            if character.char_id is not None:
+                team_xp[character.char_id] = team_xp.get(character.char_id, 0) + rewards['xp']
+        level_ups = unit.grant_character_xp(team_xp)
+        # You could track level ups here if needed for notifications
+        
+        # Award materials
+        unit.add_materials(rewards['materials'])
+        
+        # Reset game state after mission completion
+        unit.clear_battle()
+        unit.commit()
+        battle_log.discard(user_id)
+        return rewards
 
-def reset_game_state(user_id):
-    """Reset the game state after mission completion"""
-    accounts_data = load_accounts_data()
-    
-    if user_id in accounts_data['player_states']:
-        # Clear the player state completely
-        del accounts_data['player_states'][user_id]
-    
-    save_accounts_data(accounts_data)
-    return True
+def pull_banner(user_id, banner, count, rng=random):
+    """Pull `count` times on a banner and apply the results in a single storage commit.
 
-# Define element effectiveness system
-# ELEMENT_EFFECTIVENESS = {
-#     'fire': {'weak_to': ['water'], 'strong_vs': ['grass', 'ice']},
-#     'water': {'weak_to': ['grass', 'lightning'], 'strong_vs': ['fire', 'earth']},
-#     'earth': {'weak_to': ['grass', 'water'], 'strong_vs': ['lightning', 'fire']},
-#     'air': {'weak_to': ['lightning'], 'strong_vs': ['earth']},
-#     'lightning': {'weak_to': ['earth'], 'strong_vs': ['water', 'air']},
-#     'grass': {'weak_to': ['fire', 'ice'], 'strong_vs': ['water', 'earth']},
-#     'ice': {'weak_to': ['fire'], 'strong_vs': ['grass', 'air']},
-#     'dark': {'weak_to': ['grass'], 'strong_vs': ['air']}
-# }
-
-def calculate_element_effectiveness(attacker_element, defender_element):
-    """Calculate damage multiplier based on element effectiveness"""
-    return 1.0  # Normal damage
-
-def calculate_damage_with_status_effects(base_damage, attacker, defender):
-    """Calculate final damage considering status effects"""
-    damage = base_damage
-    
-    # Apply attacker status effects
-    if hasattr(attacker, 'get') and 'status_effects' in attacker:
-        if 'adrenaline' in attacker['status_effects']:
-            damage *= 2  # Double damage from adrenaline
-    
-    # Apply defender status effects
-    if hasattr(defender, 'get') and 'status_effects' in defender:
-        if 'vulnerability' in defender['status_effects']:
-            damage = int(damage * 1.5)  # 1.5x damage from vulnerability
-        elif 'blessed' in defender['status_effects']:
-            damage = int(damage * 0.5)  # 50% damage reduction from blessed
-        elif 'immunity' in defender['status_effects']:
-            damage = 0  # Immunity negates all damage
-        elif 'divine_shield' in defender['status_effects']:
-            damage = max(0, damage - 50)  # Divine shield absorbs 50 damage
-    
-    return max(0, int(damage))
-
-# Stage configurations with more detailed stats
-STAGE_CONFIGS = {
-    1: {
-        'enemies': [
-            {
-                'id': 1, 'x': 8, 'y': 4, 'hp': 50, 'max_hp': 50, 'attack_range': 1, 'move_range': 2, 'damage': 10,
-                'element': 'fire', 'shield_hp': 30, 'max_shield_hp': 30, 'shield_weak_to': ['water', 'ice'],
-                'status_effects': {}
-            },
-        ],
-        'grid_size': {'width': 15, 'height': 15},
-        'characters': [
-            {'id': 1, 'x': 1, 'y': 1, 'hp': 100, 'max_hp': 100, 'attack_range': 2, 'move_range': 3, 'has_acted': False, 'damage': 25},
-            {'id': 2, 'x': 1, 'y': 3, 'hp': 100, 'max_hp': 100, 'attack_range': 2, 'move_range': 3, 'has_acted': False, 'damage': 25},
-            {'id': 3, 'x': 1, 'y': 5, 'hp': 100, 'max_hp': 100, 'attack_range': 2, 'move_range': 3, 'has_acted': False, 'damage': 25},
-            {'id': 4, 'x': 1, 'y': 7, 'hp': 100, 'max_hp': 100, 'attack_range': 2, 'move_range': 3, 'has_acted': False, 'damage': 25},
-        ],
-        'team_sp': 3,
-        'max_team_sp': 5
-    },
-    2: {
-        'enemies': [
-            {
-                'id': 1, 'x': 7, 'y': 3, 'hp': 60, 'max_hp': 60, 'attack_range': 2, 'move_range': 2, 'damage': 15,
-                'element': 'earth', 'shield_hp': 40, 'max_shield_hp': 40, 'shield_weak_to': ['grass', 'water'],
-                'status_effects': {}
-            },
-            {
-                'id': 2, 'x': 9, 'y': 5, 'hp': 45, 'max_hp': 45, 'attack_range': 1, 'move_range': 3, 'damage': 12,
-                'element': 'lightning', 'shield_hp': 25, 'max_shield_hp': 25, 'shield_weak_to': ['earth'],
-                'status_effects': {}
-            },
-        ],
-        'grid_size': {'width': 15, 'height': 15},
-        'characters': [],  # Will be filled with selected team
-        'team_sp': 2,
-        'max_team_sp': 5
-    },
-    3: {
-        'enemies': [
-            {
-                'id': 1, 'x': 8, 'y': 4, 'hp': 80, 'max_hp': 80, 'attack_range': 3, 'move_range': 1, 'damage': 20,
-                'element': 'dark', 'shield_hp': 60, 'max_shield_hp': 60, 'shield_weak_to': ['grass'],
-                'status_effects': {}
-            },
-            {
-                'id': 2, 'x': 6, 'y': 6, 'hp': 50, 'max_hp': 50, 'attack_range': 2, 'move_range': 2, 'damage': 14,
-                'element': 'ice', 'shield_hp': 35, 'max_shield_hp': 35, 'shield_weak_to': ['fire'],
-                'status_effects': {}
-            },
-            {
-                'id': 3, 'x': 10, 'y': 2, 'hp': 40, 'max_hp': 40, 'attack_range': 1, 'move_range': 3, 'damage': 10,
-                'element': 'air', 'shield_hp': 20, 'max_shield_hp': 20, 'shield_weak_to': ['lightning'],
-                'status_effects': {}
-            },
-        ],
-        'grid_size': {'width': 15, 'height': 15},
-        'characters': [],  # Will be filled with selected team
-        'team_sp': 1,
-        'max_team_sp': 5
-    },
-}
+    The currency debit, the banner's pity counter and every character granted
+    (or the duplicate XP for a character already owned) go into one unit of work.
+    """
+    with user_lock(user_id):
+        unit = UserUnitOfWork(get_account_store(), user_id)
+        if not unit:
+            raise GachaError('User not found')
+        if not unit.spend_materials(banner.cost(count)):
+            raise GachaError('Not enough materials')
+
+        picks, pity = banner.pull(count, unit.banner_pity(banner.id), rng)
+        unit.set_banner_pity(banner.id, pity)
+        results = []
+        for char_id, rarity in picks:
+            result = {'char_id': char_id, 'rarity': rarity, 'new': not unit.has_character(char_id)}
+            progress = unit.character_progress(char_id)
+            if not result['new']:
+                # Duplicates turn into XP for the copy the player already has
+                result['xp'] = banner.duplicate_xp.get(rarity, 0)
+                result['level_ups'] = apply_character_xp(progress, result['xp'])
+            results.append(result)
+
+        unit.commit()
+        return {'results': results, 'pity': pity, 'inventory': unit.user.get('inventory', {})}
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -319,121 +271,149 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def process_status_effects(game_state):
-    """Process status effects for all characters and enemies"""
-    
-    # Process character status effects
-    for char in game_state['characters']:
-        if 'status_effects' not in char:
-            char['status_effects'] = {}
-            continue
-            
-        effects_to_remove = []
-        for effect, duration in char['status_effects'].items():
-            if effect == 'regeneration':
-                # Heal 15 HP per turn
-                char['hp'] = min(char['max_hp'], char['hp'] + 15)
-            elif effect == 'adrenaline':
-                # Double damage and movement (handled in attack/movement logic)
-                pass
-            elif effect == 'blessed':
-                # 50% damage reduction (handled in damage calculation)
-                pass
-            elif effect == 'immunity':
-                # Immunity to damage (handled in damage calculation)
-                pass
-            elif effect == 'divine_shield':
-                # Shield that absorbs damage (handled in damage calculation)
-                pass
-            
-            # Decrease duration
-            char['status_effects'][effect] = duration - 1
-            if char['status_effects'][effect] <= 0:
-                effects_to_remove.append(effect)
-        
-        # Remove expired effects
-        for effect in effects_to_remove:
-            del char['status_effects'][effect]
-    
-    # Process enemy status effects
-    for enemy in game_state['enemies']:
-        if 'status_effects' not in enemy:
-            enemy['status_effects'] = {}
-            continue
-            
-        effects_to_remove = []
-        for effect, duration in enemy['status_effects'].items():
-            if effect == 'burn':
-                # Take 10 damage per turn
-                enemy['hp'] -= 10
-            elif effect == 'poison':
-                # Take 8 damage per turn
-                enemy['hp'] -= 8
-            elif effect == 'vulnerability':
-                # Take 1.5x damage (handled in damage calculation)
-                pass
-            elif effect == 'frozen':
-                # Cannot act (handled in enemy turn logic)
-                pass
-            elif effect == 'chaos':
-                # Random effects each turn
-                import random
-                random_effect = random.choice(['burn', 'poison', 'vulnerability'])
-                enemy['status_effects'][random_effect] = 1
-            
-            # Decrease duration
-            enemy['status_effects'][effect] = duration - 1
-            if enemy['status_effects'][effect] <= 0:
-                effects_to_remove.append(effect)
-        
-        # Remove expired effects
-        for effect in effects_to_remove:
-            del enemy['status_effects'][effect]
-        
-        # Remove dead enemies
-        if enemy['hp'] <= 0:
-            game_state['enemies'] = [e for e in game_state['enemies'] if e['id'] != enemy['id']]
+def current_user_key():
+    return str(session['user_id'])
+
+def capture_client_base(player_state):
+    """Copy the battle before an action when the client says it holds the current version.
 
-def _advance_turn(game_state):
+    Returns (copy, version), or (None, None) when the client will need a full snapshot.
     """
-    Advances the turn to the next character or triggers the enemy turn.
+    known_version = (request.get_json(silent=True) or {}).get('known_version')
+    if known_version is not None and known_version == player_state.get('version', 0):
+        return capture(player_state['game_data']), known_version
+    return None, None
+
+def battle_payload(player_state, base_state=None, base_version=None):
+    """A patch against the client's copy if one was captured, otherwise the full battle"""
+    if base_state is not None:
+        return {'patch': diff_state(base_state, player_state['game_data'], base_version, player_state['version'])}
+    return {**player_state['game_data'], 'version': player_state.get('version', 0)}
+
+def battle_response(player_state, base_state=None, base_version=None):
+    return jsonify(battle_payload(player_state, base_state, base_version))
+
+def parse_player_action(data):
+    """The logged form of one move, attack or end_turn submitted in a round"""
+    if not isinstance(data, dict):
+        raise ActionError('Each action must be an object')
+    kind = data.get('type')
+    try:
+        if kind == 'move':
+            return {'type': 'move', 'character_id': data['character_id'], 'x': data['x'], 'y': data['y']}
+        if kind == 'attack':
+            return {'type': 'attack', 'attacker_id': data['attacker_id'],
+                    'attack_type': data.get('attack_type', 'basic'), 'target_id': data.get('target_id'),
+                    'target_x': data.get('target_x'), 'target_y': data.get('target_y')}
+    except KeyError as e:
+        raise ActionError(f'Missing {e.args[0]} for {kind}') from e
+    if kind == 'end_turn':
+        return {'type': 'end_turn'}
+    raise ActionError(f'Unknown action type: {kind}')
+
+@app.errorhandler(ActionError)
+def handle_action_error(error):
+    return jsonify({'error': str(error)}), 400
+
+@app.errorhandler(GachaError)
+def handle_gacha_error(error):
+    return jsonify({'error': str(error)}), 400
+
+@app.errorhandler(StaleStateError)
+def handle_stale_state(error):
+    # Another request advanced this battle since it was loaded; the client should refetch
+    return jsonify({'error': 'Game state changed, please reload', 'version': error.current_version}), 409
+
+# Deferred enemy phases stream their actions to /battle/events once each phase is recorded
+battle_events = BattleEventBroker()
+
+# A failing enemy phase is retried with a doubling delay, then reported instead of rescheduled
+ENEMY_PHASE_ATTEMPTS = 3
+ENEMY_PHASE_RETRY_DELAY = 1.0  # Seconds before the first retry
+
+# user_id -> failure of the pending enemy phase of one battle (seed and version); per process
+enemy_phase_failures = {}
+
+def schedule_enemy_phase(user_id):
+    enemy_phase_executor.submit(resolve_enemy_phase, user_id)
+
+def resolve_enemy_phase(user_id):
+    """Background job: run a battle's pending enemy phase and publish each action.
+
+    The actions and the resulting battle are published once the phase is
+    recorded, so a stream never shows a phase that was not committed. A
+    failure is counted and published as an enemy_phase_error event.
     """
-    active_char_id = game_state.get('active_character_id')
-    if not active_char_id:
-        return
+    with user_lock(user_id):
+        player_state = None
+        try:
+            player_state = battle_log.load(user_id, catalog.snapshot())
+            if not player_state or player_state['game_data'].get('turn') != 'enemy':
+                return
+            game_state = player_state['game_data']
+            battle_events.publish(user_id, 'enemy_phase_start', {'version': player_state['version']})
+            action = {'type': 'enemy_phase'}
+            enemy_actions = []
+            apply_action(player_state['battle'], catalog.snapshot(), action, battle_log.rng(player_state),
+                         on_action=enemy_actions.append)
+            battle_log.record(user_id, player_state, action)
+            enemy_phase_failures.pop(user_id, None)
+            for enemy_action in enemy_actions:
+                battle_events.publish(user_id, 'enemy_action', enemy_action)
+            # A wire-form copy: the stream serializes it later, after other requests may have moved the units
+            battle_events.publish(user_id, 'battle_state', {**capture(game_state), 'version': player_state['version']})
+        except Exception:
+            # The cached battle may hold a phase that was never recorded
+            battle_log.discard(user_id)
+            app.logger.exception('Enemy phase failed for user %s', user_id)
+            if player_state:
+                failure = record_enemy_phase_failure(user_id, player_state)
+                battle_events.publish(user_id, 'enemy_phase_error',
+                                      {**enemy_phase_report(failure), 'version': player_state['version']})
+
+def record_enemy_phase_failure(user_id, player_state):
+    battle = (player_state['seed'], player_state['version'])
+    failure = enemy_phase_failures.get(user_id)
+    attempts = failure['attempts'] + 1 if failure and failure['battle'] == battle else 1
+    failure = enemy_phase_failures[user_id] = {
+        'battle': battle,
+        'attempts': attempts,
+        'retry_at': time.monotonic() + ENEMY_PHASE_RETRY_DELAY * 2 ** (attempts - 1),
+    }
+    return failure
 
-    char_ids = [c['id'] for c in game_state['characters']]
-    if not char_ids:
-        enemy_turn(game_state) # No characters left, just run enemy turn
-        return
+def enemy_phase_failure(user_id, player_state):
+    """The recorded failure of this battle's pending enemy phase, or None"""
+    failure = enemy_phase_failures.get(user_id)
+    if failure is None or failure['battle'] != (player_state['seed'], player_state['version']):
+        return None
+    return failure
 
-    try:
-        current_index = char_ids.index(active_char_id)
-    except ValueError:
-        current_index = -1
-
-    # Find the next character who hasn't acted
-    next_char_found = False
-    for i in range(1, len(char_ids) + 1):
-        check_index = (current_index + i) % len(char_ids)
-        if not game_state['characters'][check_index]['has_acted']:
-            game_state['active_character_id'] = char_ids[check_index]
-            next_char_found = True
-            break
-    
-    if not next_char_found:
-        # All characters have acted, start enemy turn
-        game_state['turn'] = 'enemy'
-        enemy_turn(game_state)
-        # Process status effects at the end of the round
-        process_status_effects(game_state)
-        game_state['turn'] = 'player'
-        # Reset all characters for the next round
-        for char in game_state['characters']:
-            char['has_acted'] = False
-        # Set active character to the first one
-        if game_state['characters']:
-            game_state['active_character_id'] = game_state['characters'][0]['id']
+def enemy_phase_report(failure):
+    retrying = failure['attempts'] < ENEMY_PHASE_ATTEMPTS
+    return {'error': 'Enemy turn failed' + (', retrying' if retrying else '; start the mission again'),
+            'attempts': failure['attempts'], 'retrying': retrying}
+
+def enemy_phase_in_progress(user_id, player_state):
+    """True while a deferred enemy phase has not finished.
+
+    Reschedules it in case its job was lost; after a failure, only once its
+    retry delay has passed and while attempts remain.
+    """
+    if player_state['game_data'].get('turn') != 'enemy':
+        return False
+    failure = enemy_phase_failure(user_id, player_state)
+    if failure is None or (failure['attempts'] < ENEMY_PHASE_ATTEMPTS and time.monotonic() >= failure['retry_at']):
+        schedule_enemy_phase(user_id)
+    return True
+
+def enemy_phase_conflict(user_id, player_state):
+    """The 409 for an action sent while the enemy phase is pending, with its failure if it failed"""
+    failure = enemy_phase_failure(user_id, player_state)
+    if failure is not None:
+        report = enemy_phase_report(failure)
+        return jsonify({'error': report['error'], 'enemy_phase_error': report}), 409
+    return jsonify({'error': 'Enemy turn in progress'}), 409
 
 @app.route('/')
 @login_required
@@ -457,9 +437,7 @@ def team_formation_page():
 @app.route('/missions')
 @login_required
 def get_missions():
-    with open('missions.json', 'r') as f:
-        missions = json.load(f)
-    return jsonify(missions)
+    return jsonify(load_missions_data())
 
 @app.route('/characters')
 @login_required
@@ -475,29 +453,21 @@ def get_player_characters():
     
     # Load base character data
     characters = load_characters_data()
+    roster = resolve_player_roster(user_id, characters)
     
     # Enhance with player data
     player_characters = []
     for char in characters:
-        player_char_data = get_player_character_data(user_id, char['id'])
-        level = player_char_data['level'] if player_char_data else 1
-        xp = player_char_data['xp'] if player_char_data else 0
-        
-        # Calculate current stats based on level
-        calculated_stats = calculate_character_stats(char['max_hp'], char['basic_attack_damage'], level)
-        
-        # Calculate XP needed for next level
-        xp_needed = calculate_level_up_cost(level) if level < 100 else 0
-        
+        resolved = roster[char['id']]
         player_char = {
             **char,
-            'level': level,
-            'xp': xp,
-            'xp_needed': xp_needed,
-            'current_hp': calculated_stats['hp'],
-            'current_max_hp': calculated_stats['max_hp'],
-            'current_damage': calculated_stats['damage'],
-            'current_skill_damage': int(char['skill_attack_damage'] * (calculated_stats['damage'] / char['basic_attack_damage']))
+            'level': resolved['level'],
+            'xp': resolved['xp'],
+            'xp_needed': resolved['xp_needed'],
+            'current_hp': resolved['hp'],
+            'current_max_hp': resolved['max_hp'],
+            'current_damage': resolved['damage'],
+            'current_skill_damage': resolved['skill_damage']
         }
         player_characters.append(player_char)
     
@@ -507,14 +477,7 @@ def get_player_characters():
 @login_required
 def get_inventory():
     user_id = str(session['user_id'])
-    accounts_data = load_accounts_data()
-    
-    # Find the user by user_id
-    user_data = None
-    for username, udata in accounts_data['users'].items():
-        if udata['id'] == user_id:
-            user_data = udata
-            break
+    username, user_data = get_account_store().find_user_by_id(user_id)
     
     if not user_data:
         return jsonify({'inventory': {}, 'total_xp': 0})
@@ -524,8 +487,33 @@ def get_inventory():
         'total_xp': user_data.get('total_xp', 0)
     })
 
+@app.route('/banners')
+@login_required
+def get_banners():
+    """Banners with their rates and pools, and the player's pity count on each"""
+    user_id = str(session['user_id'])
+    username, user_data = get_account_store().find_user_by_id(user_id)
+    pity = (user_data or {}).get('pity', {})
+    return jsonify([{**banner.to_dict(), 'pity_count': pity.get(str(banner_id), 0)}
+                    for banner_id, banner in catalog.snapshot().banners_by_id.items()])
+
+@app.route('/pull', methods=['POST'])
+@login_required
+@locked_for_user(current_user_key)
+def pull():
+    user_id = str(session['user_id'])
+    data = request.json
+    banner = catalog.snapshot().banners_by_id.get(data.get('banner_id'))
+    if banner is None:
+        return jsonify({'error': 'Unknown banner'}), 400
+    count = data.get('count', 1)
+    if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= MAX_PULLS:
+        return jsonify({'error': f'Pull count must be between 1 and {MAX_PULLS}'}), 400
+    return jsonify(pull_banner(user_id, banner, count))
+
 # ... (registration, login, logout routes remain the same)
 @app.route('/register', methods=['POST'])
+@locked_for_user(lambda: 'register')
 def register():
     data = request.json
     username = data.get('username')
@@ -534,16 +522,10 @@ def register():
     if not username or not password:
         return jsonify({'error': 'Username and password are required'}), 400
 
-    accounts_data = load_accounts_data()
-    if username in accounts_data['users']:
-        return jsonify({'error': 'Username already exists'}), 409
-
     hashed_password = hash_password(password)
     
-    next_user_id = str(max([int(uid) for uid in accounts_data['users'].keys()] or [0]) + 1)
-    
-    accounts_data['users'][username] = {'id': next_user_id, 'password': hashed_password}
-    save_accounts_data(accounts_data)
+    if get_account_store().create_user(username, hashed_password) is None:
+        return jsonify({'error': 'Username already exists'}), 409
     return jsonify({'message': 'Registration successful'}), 201
 
 @app.route('/login', methods=['POST'])
@@ -555,8 +537,7 @@ def login():
     if not username or not password:
         return jsonify({'error': 'Username and password are required'}), 400
 
-    accounts_data = load_accounts_data()
-    user_info = accounts_data['users'].get(username)
+    user_info = get_account_store().get_user(username)
 
     if user_info and user_info['password'] == hash_password(password):
         session['user_id'] = user_info['id']
@@ -572,713 +553,205 @@ def logout():
 
 @app.route('/select_stage', methods=['POST'])
 @login_required
+@locked_for_user(current_user_key)
 def select_stage():
     user_id = str(session['user_id'])
     data = request.json
     stage_id = int(data.get('stage_id'))
     selected_team = data.get('team', [])
 
-    if stage_id not in STAGE_CONFIGS:
-        return jsonify({'error': 'Invalid stage ID'}), 400
-
-    # Load character data and create team characters
-    available_characters = load_characters_data()
-    team_characters = []
-    
+    # Load character data and pick the team's templates
+    characters = catalog.snapshot()
+    available_characters = characters.characters
     if selected_team:
         # Use selected team with their stats based on player's character levels
-        for i, selected_char in enumerate(selected_team):
-            char_template = next((c for c in available_characters if c['id'] == selected_char['id']), None)
-            if char_template:
-                # Get player's character data (level, xp)
-                player_char_data = get_player_character_data(user_id, char_template['id'])
-                level = player_char_data['level'] if player_char_data else 1
-                
-                # Calculate stats based on level
-                base_hp = char_template['max_hp']
-                base_damage = char_template['basic_attack_damage']
-                calculated_stats = calculate_character_stats(base_hp, base_damage, level)
-                
-                team_char = {
-                    'id': i + 1,  # Use sequential IDs for the game
-                    'char_id': char_template['id'],  # Keep reference to original character
-                    'name': char_template['name'],
-                    'x': 1, 'y': 1 + (i * 2),  # Position characters in starting positions
-                    'hp': calculated_stats['hp'],
-                    'max_hp': calculated_stats['max_hp'],
-                    'attack_range': char_template['basic_attack_range'],
-                    'skill_attack_range': char_template['skill_attack_range'],
-                    'move_range': char_template['move_range'],
-                    'has_acted': False,
-                    'damage': calculated_stats['damage'],
-                    'skill_damage': int(char_template['skill_attack_damage'] * (calculated_stats['damage'] / base_damage)),
-                    'element': char_template.get('element', 'air'),  # Add element
-                    'level': level,  # Track level for display and reference
-                    'energy': 0,  # Start with 0 energy
-                    'max_energy': 100,  # All characters have 100 max energy
-                    'status_effects': {}  # Track status effects
-                }
-                team_characters.append(team_char)
+        templates_by_id = characters.characters_by_id
+        team_templates = [templates_by_id[c['id']] for c in selected_team if c.get('id') in templates_by_id]
     else:
         # Fallback to default team if no team selected
-        default_chars = available_characters[:4]  # Take first 4 characters
-        for i, char_template in enumerate(default_chars):
-            # Get player's character data (level, xp)
-            player_char_data = get_player_character_data(user_id, char_template['id'])
-            level = player_char_data['level'] if player_char_data else 1
-            
-            # Calculate stats based on level
-            base_hp = char_template['max_hp']
-            base_damage = char_template['basic_attack_damage']
-            calculated_stats = calculate_character_stats(base_hp, base_damage, level)
-            
-            team_char = {
-                'id': i + 1,
-                'char_id': char_template['id'],
-                'name': char_template['name'],
-                'x': 1, 'y': 1 + (i * 2),
-                'hp': calculated_stats['hp'],
-                'max_hp': calculated_stats['max_hp'],
-                'attack_range': char_template['basic_attack_range'],
-                'skill_attack_range': char_template['skill_attack_range'],
-                'move_range': char_template['move_range'],
-                'has_acted': False,
-                'damage': calculated_stats['damage'],
-                'skill_damage': int(char_template['skill_attack_damage'] * (calculated_stats['damage'] / base_damage)),
-                'element': char_template.get('element', 'air'),  # Add element
-                'energy': 0,  # Start with 0 energy
-                'max_energy': 100,  # All characters have 100 max energy
-                'status_effects': {}  # Track status effects
-            }
-            team_characters.append(team_char)
-
-    initial_game_data = json.loads(json.dumps(STAGE_CONFIGS[stage_id]))
-    initial_game_data['characters'] = team_characters  # Replace with selected team
-    initial_game_data['turn'] = 'player'
-    if team_characters:
-        initial_game_data['active_character_id'] = team_characters[0]['id']
+        team_templates = available_characters[:4]  # Take first 4 characters
     
-    # Ensure team SP is initialized
-    if 'team_sp' not in initial_game_data:
-        initial_game_data['team_sp'] = 0
-    if 'max_team_sp' not in initial_game_data:
-        initial_game_data['max_team_sp'] = 5
-
-    accounts_data = load_accounts_data()
-    accounts_data['player_states'][user_id] = {
-        'current_stage': stage_id,
-        'game_data': initial_game_data
-    }
-    save_accounts_data(accounts_data)
+    # Resolve levels and stats for the whole team in one pass
+    roster = resolve_player_roster(user_id, team_templates)
+    
+    initial_game_data = engine.new_battle(stage_id, team_templates, roster)
+
+    battle_log.start(user_id, stage_id, initial_game_data)
     return jsonify({'message': f'Stage {stage_id} selected', 'game_data': initial_game_data}), 200
 
 @app.route('/game_state', methods=['GET'])
 @login_required
+@locked_for_user(current_user_key)
 def get_current_game_state():
     user_id = str(session['user_id'])
-    accounts_data = load_accounts_data()
-    player_state = accounts_data['player_states'].get(user_id)
+    player_state = battle_log.load(user_id, catalog.snapshot())
 
     if player_state and player_state.get('game_data'):
-        return jsonify(player_state['game_data'])
+        payload = battle_payload(player_state)
+        if enemy_phase_in_progress(user_id, player_state):
+            failure = enemy_phase_failure(user_id, player_state)
+            if failure is not None:
+                payload['enemy_phase_error'] = enemy_phase_report(failure)
+        return jsonify(payload)
     
     return redirect(url_for('mission_select_page'))
 
 @app.route('/move', methods=['POST'])
 @login_required
+@locked_for_user(current_user_key)
 def move():
     user_id = str(session['user_id'])
-    accounts_data = load_accounts_data()
-    game_state = accounts_data['player_states'][user_id]['game_data']
+    characters = catalog.snapshot()
+    player_state = battle_log.load(user_id, characters)
+    if not player_state:
+        return jsonify({'error': 'No active battle'}), 400
+    game_state = player_state['game_data']
+    if enemy_phase_in_progress(user_id, player_state):
+        return enemy_phase_conflict(user_id, player_state)
+    stream_enemy_phase = bool((request.get_json(silent=True) or {}).get('stream_enemy_phase'))
     
     data = request.json
-    char_id = data['character_id']
-    new_x, new_y = data['x'], data['y']
-
-    char = next((c for c in game_state['characters'] if c['id'] == char_id), None)
+    action = {'type': 'move', 'character_id': data['character_id'], 'x': data['x'], 'y': data['y'],
+              'defer': stream_enemy_phase}
 
-    if not char or char['has_acted'] or char['id'] != game_state.get('active_character_id'):
-        return jsonify({'error': 'Character cannot move now'}), 400
+    base_state, base_version = capture_client_base(player_state)
+    enemy_phase_deferred = apply_action(player_state['battle'], characters, action, battle_log.rng(player_state))
 
-    if abs(new_x - char['x']) + abs(new_y - char['y']) > char['move_range']:
-        return jsonify({'error': 'Move is out of range'}), 400
-
-    # Check if the destination tile is occupied
-    all_positions = {(c['x'], c['y']) for c in game_state['characters']} | \
-                    {(e['x'], e['y']) for e in game_state['enemies']}
-    if (new_x, new_y) in all_positions:
-        return jsonify({'error': 'Tile is occupied'}), 400
-
-    char['x'], char['y'] = new_x, new_y
-    char['has_acted'] = True
-    
-    # ensure no enemy actions sent on player move
-    game_state.pop('enemy_actions', None)
-
-    _advance_turn(game_state)
-
-    save_accounts_data(accounts_data)
-    return jsonify(game_state)
+    battle_log.record(user_id, player_state, action)
+    if enemy_phase_deferred:
+        schedule_enemy_phase(user_id)
+    return battle_response(player_state, base_state, base_version)
 
 @app.route('/attack', methods=['POST'])
 @login_required
+@locked_for_user(current_user_key)
 def attack():
     user_id = str(session['user_id'])
-    accounts_data = load_accounts_data()
-    game_state = accounts_data['player_states'][user_id]['game_data']
-    character_data = load_characters_data()
+    characters = catalog.snapshot()
+    player_state = battle_log.load(user_id, characters)
+    if not player_state:
+        return jsonify({'error': 'No active battle'}), 400
+    game_state = player_state['game_data']
+    if enemy_phase_in_progress(user_id, player_state):
+        return enemy_phase_conflict(user_id, player_state)
+    stream_enemy_phase = bool((request.get_json(silent=True) or {}).get('stream_enemy_phase'))
 
     data = request.json
-    attacker_id = data['attacker_id']
-    target_id = data.get('target_id')  # For healing, this might be an ally
-    attack_type = data.get('attack_type', 'basic')
-    target_x = data.get('target_x')  # For area/full-area attacks
-    target_y = data.get('target_y')
-    
-    attacker = next((c for c in game_state['characters'] if c['id'] == attacker_id), None)
-    
-    if not attacker or attacker['has_acted'] or attacker['id'] != game_state.get('active_character_id'):
-        return jsonify({'error': 'Invalid action'}), 400
-
-    # Get character template to determine attack type
-    print(character_data)
-    print(target_id)
-    char_template = next((c for c in character_data if c['id'] == attacker.get('char_id', attacker_id)), None)
-    if not char_template:
-        return jsonify({'error': 'Character template not found'}), 400
-
-    # Get attack type and damage
-    if attack_type == 'ultimate':
-        attack_range = char_template.get('ultimate_attack_range', 99)
-        damage = char_template.get('ultimate_attack_damage', 100)
-        attack_pattern = char_template.get('ultimate_attack_type', 'single')
-        skill_pattern = char_template.get('ultimate_attack_pattern', attack_pattern)
-        area_range = char_template.get('ultimate_attack_area_range', 2)
-        energy_cost = char_template.get('ultimate_energy_cost', 100)
-    elif attack_type == 'skill':
-        attack_range = attacker.get('skill_attack_range', attacker.get('attack_range', 2))
-        damage = char_template.get('skill_attack_damage', 25)
-        attack_pattern = char_template.get('skill_attack_type', 'single')
-        # Get additional pattern details for healing and area attacks
-        skill_pattern = char_template.get('skill_attack_pattern', attack_pattern)
-        area_range = char_template.get('skill_attack_area_range', 2)
-    else:
-        attack_range = attacker.get('attack_range', 2)
-        damage = char_template.get('basic_attack_damage', 25)
-        attack_pattern = char_template.get('basic_attack_type', 'single')
-        # Get basic attack pattern details
-        skill_pattern = char_template.get('basic_attack_pattern', attack_pattern)
-        area_range = char_template.get('basic_attack_area_range', 1)
-
-    # Initialize team SP if not present
-    if 'team_sp' not in game_state:
-        game_state['team_sp'] = 0
-    if 'max_team_sp' not in game_state:
-        game_state['max_team_sp'] = 5
-
-    # Initialize character energy if not present
-    if 'energy' not in attacker:
-        attacker['energy'] = 0
-    if 'max_energy' not in attacker:
-        attacker['max_energy'] = 100
-
-    # Check energy requirement for ultimate attacks
-    if attack_type == 'ultimate':
-        if attacker['energy'] < energy_cost:
-            return jsonify({'error': 'Not enough energy for ultimate attack'}), 400
-
-    # Check skill point requirement
-    if attack_type == 'skill':
-        if game_state['team_sp'] <= 0:
-            return jsonify({'error': 'Not enough skill points'}), 400
-
-    # Handle different attack patterns
-    status_effect = None
-    if attack_type == 'ultimate':
-        status_effect = char_template.get('ultimate_status_effect')
-    
-    if attack_pattern == 'healing' or attack_pattern == 'mass-heal' or attack_pattern == 'buff-heal' or attack_pattern == 'revive-heal':
-        # Healing attacks target allies instead of enemies
-        heal_amount = damage
-        
-        if skill_pattern == 'single':
-            # Single target heal
-            if target_id:
-                target = next((c for c in game_state['characters'] if c['id'] == target_id), None)
-                if not target:
-                    return jsonify({'error': 'Invalid healing target'}), 400
-                
-                if abs(target['x'] - attacker['x']) + abs(target['y'] - attacker['y']) > attack_range:
-                    return jsonify({'error': 'Target is out of range'}), 400
-                
-                # Heal the target
-                target['hp'] = min(target['max_hp'], target['hp'] + heal_amount)
-            else:
-                # If no target specified for single heal, heal self
-                attacker['hp'] = min(attacker['max_hp'], attacker['hp'] + heal_amount)
-                
-        elif skill_pattern == 'area':
-            # Area heal around a target point
-            if target_x is None or target_y is None:
-                return jsonify({'error': 'No target coordinates specified for area heal'}), 400
-            
-            if abs(target_x - attacker['x']) + abs(target_y - attacker['y']) > attack_range:
-                return jsonify({'error': 'Target area is out of range'}), 400
-            
-            # Heal all allies within area_range tiles of the target point
-            for ally in game_state['characters']:
-                distance_to_target = abs(ally['x'] - target_x) + abs(ally['y'] - target_y)
-                if distance_to_target <= area_range:
-                    ally['hp'] = min(ally['max_hp'], ally['hp'] + heal_amount)
-                    
-        elif skill_pattern == 'full-area' or skill_pattern == 'team-wide':
-            # Heal all allies within the attacker's range or team-wide
-            for ally in game_state['characters']:
-                if skill_pattern == 'team-wide' or (ally['id'] != attacker_id and abs(ally['x'] - attacker['x']) + abs(ally['y'] - attacker['y']) <= attack_range):
-                    if attack_pattern == 'revive-heal':
-                        # Full heal for revive-heal ultimates
-                        ally['hp'] = ally['max_hp']
-                    else:
-                        ally['hp'] = min(ally['max_hp'], ally['hp'] + heal_amount)
-                    
-                    # Apply status effects for ultimate heals
-                    if status_effect and attack_type == 'ultimate':
-                        if 'status_effects' not in ally:
-                            ally['status_effects'] = {}
-                        ally['status_effects'][status_effect] = 3  # 3 turns duration
-    
-    elif attack_pattern == 'single':
-        # Single target attack
-        if not target_id:
-            return jsonify({'error': 'No target specified'}), 400
-        
-        target = next((e for e in game_state['enemies'] if e['id'] == target_id), None)
-        if not target:
-            return jsonify({'error': 'Invalid target'}), 400
-        
-        if abs(target['x'] - attacker['x']) + abs(target['y'] - attacker['y']) > attack_range:
-            return jsonify({'error': 'Target is out of range'}), 400
-        
-        # Get attacker element
-        attacker_element = attacker.get('element', 'air')
-        target_element = target.get('element', 'fire')
-        
-        # Calculate element effectiveness
-        element_multiplier = calculate_element_effectiveness(attacker_element, target_element)
-        modified_damage = int(damage * element_multiplier)
-        
-        # Apply shield mechanics
-        shield_hp = target.get('shield_hp', 0)
-        shield_weak_to = target.get('shield_weak_to', [])
-        
-        if shield_hp > 0:
-            # Check if attack is effective against shield
-            if attacker_element in shield_weak_to:
-                # Deal full damage to shield and 10% to main HP
-                shield_damage = min(modified_damage, shield_hp)
-                target['shield_hp'] = max(0, shield_hp - shield_damage)
-                target['hp'] -= max(1, int(modified_damage * 0.1))
-            else:
-                # Shield blocks 90% damage, only 10% goes through
-                target['hp'] -= max(1, int(modified_damage * 0.1))
-        else:
-            # No shield, apply full damage
-            target['hp'] -= modified_damage
-        
-        # Remove enemy if defeated
-        if target['hp'] <= 0:
-            game_state['enemies'] = [e for e in game_state['enemies'] if e['id'] != target_id]
-    
-    elif attack_pattern == 'area':
-        # Area attack around a target point
-        if target_x is None or target_y is None:
-            return jsonify({'error': 'No target coordinates specified'}), 400
-        
-        if abs(target_x - attacker['x']) + abs(target_y - attacker['y']) > attack_range:
-            return jsonify({'error': 'Target area is out of range'}), 400
-        
-        # Get attacker element
-        attacker_element = attacker.get('element', 'air')
-        
-        # Attack all enemies within area_range tiles of the target point
-        for enemy in game_state['enemies'][:]:  # Use slice to avoid issues with list modification
-            distance_to_target = abs(enemy['x'] - target_x) + abs(enemy['y'] - target_y)
-            if distance_to_target <= area_range:
-                # Calculate element effectiveness for each enemy
-                target_element = enemy.get('element', 'fire')
-                element_multiplier = calculate_element_effectiveness(attacker_element, target_element)
-                modified_damage = int(damage * element_multiplier)
-                
-                # Apply shield mechanics
-                shield_hp = enemy.get('shield_hp', 0)
-                shield_weak_to = enemy.get('shield_weak_to', [])
-                
-                if shield_hp > 0:
-                    # Check if attack is effective against shield
-                    if attacker_element in shield_weak_to:
-                        # Deal full damage to shield and 10% to main HP
-                        shield_damage = min(modified_damage, shield_hp)
-                        enemy['shield_hp'] = max(0, shield_hp - shield_damage)
-                        enemy['hp'] -= max(1, int(modified_damage * 0.1))
-                    else:
-                        # Shield blocks 90% damage, only 10% goes through
-                        enemy['hp'] -= max(1, int(modified_damage * 0.1))
-                else:
-                    # No shield, apply full damage
-                    enemy['hp'] -= modified_damage
-                
-                if enemy['hp'] <= 0:
-                    game_state['enemies'] = [e for e in game_state['enemies'] if e['id'] != enemy['id']]
-    
-    elif attack_pattern == 'full-area':
-        # Attack all enemies within the attacker's range
-        attacker_element = attacker.get('element', 'air')
-        
-        for enemy in game_state['enemies'][:]:  # Use slice to avoid issues with list modification
-            distance = abs(enemy['x'] - attacker['x']) + abs(enemy['y'] - attacker['y'])
-            if distance <= attack_range:
-                # Calculate element effectiveness for each enemy
-                target_element = enemy.get('element', 'fire')
-                element_multiplier = calculate_element_effectiveness(attacker_element, target_element)
-                modified_damage = int(damage * element_multiplier)
-                
-                # Apply shield mechanics
-                shield_hp = enemy.get('shield_hp', 0)
-                shield_weak_to = enemy.get('shield_weak_to', [])
-                
-                if shield_hp > 0:
-                    # Check if attack is effective against shield
-                    if attacker_element in shield_weak_to:
-                        # Deal full damage to shield and 10% to main HP
-                        shield_damage = min(modified_damage, shield_hp)
-                        enemy['shield_hp'] = max(0, shield_hp - shield_damage)
-                        enemy['hp'] -= max(1, int(modified_damage * 0.1))
-                    else:
-                        # Shield blocks 90% damage, only 10% goes through
-                        enemy['hp'] -= max(1, int(modified_damage * 0.1))
-                else:
-                    # No shield, apply full damage
-                    enemy['hp'] -= modified_damage
-                
-                if enemy['hp'] <= 0:
-                    game_state['enemies'] = [e for e in game_state['enemies'] if e['id'] != enemy['id']]
-
-    elif attack_pattern == 'shield-break':
-        # Shield-breaking attack that destroys all shields
-        attacker_element = attacker.get('element', 'air')
-        
-        for enemy in game_state['enemies'][:]:
-            distance = abs(enemy['x'] - attacker['x']) + abs(enemy['y'] - attacker['y'])
-            if attack_range == 99 or distance <= attack_range:
-                # Break all shields instantly
-                enemy['shield_hp'] = 0
-                
-                # Apply damage
-                target_element = enemy.get('element', 'fire')
-                element_multiplier = calculate_element_effectiveness(attacker_element, target_element)
-                modified_damage = int(damage * element_multiplier)
-                enemy['hp'] -= modified_damage
-                
-                if enemy['hp'] <= 0:
-                    game_state['enemies'] = [e for e in game_state['enemies'] if e['id'] != enemy['id']]
-
-    elif attack_pattern == 'all-enemies' or attack_pattern == 'debuff':
-        # Attack or debuff all enemies regardless of range
-        for enemy in game_state['enemies'][:]:
-            if attack_pattern == 'debuff':
-                # Apply debuff without damage (like vulnerability)
-                if 'status_effects' not in enemy:
-                    enemy['status_effects'] = {}
-                if status_effect:
-                    enemy['status_effects'][status_effect] = 2  # 2 turns for debuffs
-            else:
-                # Damage all enemies
-                attacker_element = attacker.get('element', 'air')
-                target_element = enemy.get('element', 'fire')
-                element_multiplier = calculate_element_effectiveness(attacker_element, target_element)
-                modified_damage = int(damage * element_multiplier)
-                
-                # Apply shield mechanics
-                shield_hp = enemy.get('shield_hp', 0)
-                shield_weak_to = enemy.get('shield_weak_to', [])
-                
-                if shield_hp > 0:
-                    if attacker_element in shield_weak_to:
-                        shield_damage = min(modified_damage, shield_hp)
-                        enemy['shield_hp'] = max(0, shield_hp - shield_damage)
-                        enemy['hp'] -= max(1, int(modified_damage * 0.1))
-                    else:
-                        enemy['hp'] -= max(1, int(modified_damage * 0.1))
-                else:
-                    enemy['hp'] -= modified_damage
-                
-                # Apply status effects
-                if status_effect:
-                    if 'status_effects' not in enemy:
-                        enemy['status_effects'] = {}
-                    enemy['status_effects'][status_effect] = 3  # 3 turns for ultimate status effects
-                
-                if enemy['hp'] <= 0:
-                    game_state['enemies'] = [e for e in game_state['enemies'] if e['id'] != enemy['id']]
-
-    elif attack_pattern == 'lifesteal-area' or attack_pattern == 'poison-area' or attack_pattern == 'chaos-area':
-        # Special area attacks with unique effects
-        if target_x is None or target_y is None:
-            return jsonify({'error': 'No target coordinates specified'}), 400
-        
-        if abs(target_x - attacker['x']) + abs(target_y - attacker['y']) > attack_range:
-            return jsonify({'error': 'Target area is out of range'}), 400
-        
-        attacker_element = attacker.get('element', 'air')
-        total_damage_dealt = 0
-        
-        for enemy in game_state['enemies'][:]:
-            distance_to_target = abs(enemy['x'] - target_x) + abs(enemy['y'] - target_y)
-            if distance_to_target <= area_range:
-                target_element = enemy.get('element', 'fire')
-                element_multiplier = calculate_element_effectiveness(attacker_element, target_element)
-                modified_damage = int(damage * element_multiplier)
-                
-                # Apply shield mechanics
-                shield_hp = enemy.get('shield_hp', 0)
-                shield_weak_to = enemy.get('shield_weak_to', [])
-                actual_damage = 0
-                
-                if shield_hp > 0 and attack_pattern != 'chaos-area':
-                    if attacker_element in shield_weak_to:
-                        shield_damage = min(modified_damage, shield_hp)
-                        enemy['shield_hp'] = max(0, shield_hp - shield_damage)
-                        actual_damage = max(1, int(modified_damage * 0.1))
-                        enemy['hp'] -= actual_damage
-                    else:
-                        actual_damage = max(1, int(modified_damage * 0.1))
-                        enemy['hp'] -= actual_damage
-                else:
-                    # No shield or chaos attack ignores shields
-                    actual_damage = modified_damage
-                    enemy['hp'] -= actual_damage
-                    if attack_pattern == 'chaos-area':
-                        enemy['shield_hp'] = 0  # Chaos ignores shields
-                
-                total_damage_dealt += actual_damage
-                
-                # Apply status effects
-                if status_effect:
-                    if 'status_effects' not in enemy:
-                        enemy['status_effects'] = {}
-                    enemy['status_effects'][status_effect] = 4  # Longer duration for ultimate effects
-                
-                if enemy['hp'] <= 0:
-                    game_state['enemies'] = [e for e in game_state['enemies'] if e['id'] != enemy['id']]
-        
-        # Lifesteal effect
-        if attack_pattern == 'lifesteal-area':
-            heal_amount = int(total_damage_dealt * 0.25)  # 25% lifesteal
-            attacker['hp'] = min(attacker['max_hp'], attacker['hp'] + heal_amount)
-
-    elif attack_pattern == 'buff':
-        # Team-wide buffs
-        for ally in game_state['characters']:
-            if status_effect:
-                if 'status_effects' not in ally:
-                    ally['status_effects'] = {}
-                ally['status_effects'][status_effect] = 3  # 3 turns for team buffs
-
-    # Handle energy and SP changes
-    if attack_type == 'ultimate':
-        attacker['energy'] -= energy_cost
-    elif attack_type == 'skill':
-        game_state['team_sp'] -= 1
-    else:
-        # Increase team SP for basic attacks (up to max), but only for non-healing attacks
-        if attack_pattern not in ['healing', 'mass-heal', 'buff-heal', 'revive-heal'] and game_state['team_sp'] < game_state['max_team_sp']:
-            game_state['team_sp'] += 1
-
-    # Energy gain from dealing/receiving damage
-    damage_dealt = 0
-    if attack_pattern not in ['healing', 'mass-heal', 'buff-heal', 'revive-heal', 'buff', 'debuff']:
-        # Calculate approximate damage dealt for energy gain
-        if attack_pattern == 'single':
-            damage_dealt = damage
-        elif attack_pattern in ['area', 'lifesteal-area', 'poison-area', 'chaos-area']:
-            damage_dealt = damage * min(2, len(game_state['enemies']))  # Estimate based on enemies hit
-        elif attack_pattern in ['full-area', 'shield-break', 'all-enemies']:
-            damage_dealt = damage * len(game_state['enemies'])
+    action = {
+        'type': 'attack',
+        'attacker_id': data['attacker_id'],
+        'attack_type': data.get('attack_type', 'basic'),
+        'target_id': data.get('target_id'),  # For healing, this might be an ally
+        'target_x': data.get('target_x'),  # For area/full-area attacks
+        'target_y': data.get('target_y'),
+        'defer': stream_enemy_phase,
+    }
     
-    # Gain energy based on damage dealt (10% of damage as energy)
-    if damage_dealt > 0:
-        energy_gain = min(20, max(5, int(damage_dealt * 0.1)))  # 5-20 energy per attack
-        attacker['energy'] = min(attacker['max_energy'], attacker['energy'] + energy_gain)
-
-    # Special character effects
-    if char_template['id'] == 5 and attack_type == 'skill':  # Rex the Berserker
-        # Berserker Rage: reduce own HP by 10
-        attacker['hp'] = max(1, attacker['hp'] - 10)
-
-    attacker['has_acted'] = True
+    base_state, base_version = capture_client_base(player_state)
+    enemy_phase_deferred = apply_action(player_state['battle'], characters, action, battle_log.rng(player_state))
 
     # Check for mission completion
     if check_mission_complete(game_state):
-        stage_id = accounts_data['player_states'][user_id]['current_stage']
-        rewards = award_mission_rewards(user_id, stage_id)
+        stage_id = player_state['current_stage']
+        rewards = award_mission_rewards(user_id, stage_id, game_state, battle_log.reward_rng(player_state))
+        # Without rewards the battle stays stored and the winning action unrecorded; drop the cached copy either way
+        battle_log.discard(user_id)
         game_state['mission_complete'] = True
         game_state['rewards'] = rewards
-        # Reset game state after mission completion
-        reset_game_state(user_id)
-        return jsonify(game_state)
-
-    _advance_turn(game_state)
-    # ensure no enemy actions sent on player attack
-    game_state.pop('enemy_actions', None)
+        return battle_response(player_state)
 
-    save_accounts_data(accounts_data)
-    return jsonify(game_state)
+    battle_log.record(user_id, player_state, action)
+    if enemy_phase_deferred:
+        schedule_enemy_phase(user_id)
+    return battle_response(player_state, base_state, base_version)
 
 @app.route('/end_turn', methods=['POST'])
 @login_required
+@locked_for_user(current_user_key)
 def end_turn():
     user_id = str(session['user_id'])
-    accounts_data = load_accounts_data()
-    game_state = accounts_data['player_states'][user_id]['game_data']
+    characters = catalog.snapshot()
+    player_state = battle_log.load(user_id, characters)
+    if not player_state:
+        return jsonify({'error': 'No active battle'}), 400
+    game_state = player_state['game_data']
+    if enemy_phase_in_progress(user_id, player_state):
+        return enemy_phase_conflict(user_id, player_state)
+    stream_enemy_phase = bool((request.get_json(silent=True) or {}).get('stream_enemy_phase'))
+    base_state, base_version = capture_client_base(player_state)
+
+    action = {'type': 'end_turn', 'defer': stream_enemy_phase}
+    enemy_phase_deferred = apply_action(player_state['battle'], characters, action, battle_log.rng(player_state))
+    
+    battle_log.record(user_id, player_state, action)
+    if enemy_phase_deferred:
+        schedule_enemy_phase(user_id)
+    return battle_response(player_state, base_state, base_version)
+
+@app.route('/round', methods=['POST'])
+@login_required
+@locked_for_user(current_user_key)
+def submit_round():
+    """Apply an ordered list of player actions, then the enemy phase, with a single commit.
 
-    active_char = next((c for c in game_state['characters'] if c['id'] == game_state.get('active_character_id')), None)
-    if active_char:
-        active_char['has_acted'] = True
+    Responds with a result per submitted action and the final battle (or a
+    patch against known_version). If any action is rejected, none of them are kept.
+    """
+    user_id = str(session['user_id'])
+    characters = catalog.snapshot()
+    player_state = battle_log.load(user_id, characters)
+    if not player_state:
+        return jsonify({'error': 'No active battle'}), 400
+    game_state = player_state['game_data']
+    if enemy_phase_in_progress(user_id, player_state):
+        return enemy_phase_conflict(user_id, player_state)
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('actions'), list):
+        return jsonify({'error': 'actions must be a list'}), 400
+    action = {'type': 'round', 'actions': [parse_player_action(entry) for entry in data['actions']],
+              'defer': bool(data.get('stream_enemy_phase'))}
+
+    base_state, base_version = capture_client_base(player_state)
+    results = [{'type': step['type'], 'status': 'skipped'} for step in action['actions']]
+
+    def step_applied(index):
+        results[index].update(status='ok', active_character_id=game_state.get('active_character_id'),
+                              turn=game_state.get('turn'))
 
-    _advance_turn(game_state)
-    
-    save_accounts_data(accounts_data)
-    return jsonify(game_state)
-
-def enemy_turn(game_state):
-    actions = []  # collect enemy move/attack actions
-    if not game_state.get('enemies') or not game_state.get('characters'):
-        game_state['enemy_actions'] = actions
-        return
-
-    all_unit_positions = {(c['x'], c['y']) for c in game_state['characters']} | \
-                         {(e['x'], e['y']) for e in game_state['enemies']}
-
-    for enemy in game_state['enemies']:
-        # Skip if enemy is frozen
-        if 'status_effects' in enemy and 'frozen' in enemy['status_effects']:
-            continue
-            
-        # Find the closest character(s)
-        min_dist = float('inf')
-        closest_chars = []
-        for char in game_state['characters']:
-            dist = abs(char['x'] - enemy['x']) + abs(char['y'] - enemy['y'])
-            if dist < min_dist:
-                min_dist = dist
-                closest_chars = [char]
-            elif dist == min_dist:
-                closest_chars.append(char)
-        
-        if not closest_chars:
-            continue
-
-        target_char = random.choice(closest_chars)
-
-        # Attack if in range
-        if min_dist <= enemy['attack_range']:
-            # Calculate element effectiveness for enemy attack
-            enemy_element = enemy.get('element', 'fire')
-            target_element = target_char.get('element', 'air')
-            element_multiplier = calculate_element_effectiveness(enemy_element, target_element)
-            base_damage = int(enemy.get('damage', 10) * element_multiplier)
-            
-            # Apply status effect modifications
-            final_damage = calculate_damage_with_status_effects(base_damage, enemy, target_char)
-            
-            target_char['hp'] -= final_damage
-            
-            # Character gains energy when taking damage
-            if 'energy' not in target_char:
-                target_char['energy'] = 0
-            if 'max_energy' not in target_char:
-                target_char['max_energy'] = 100
-            energy_gain = min(15, max(3, int(final_damage * 0.15)))  # 3-15 energy when taking damage
-            target_char['energy'] = min(target_char['max_energy'], target_char['energy'] + energy_gain)
-            
-            if target_char['hp'] <= 0:
-                game_state['characters'] = [c for c in game_state['characters'] if c['id'] != target_char['id']]
-            # record attack action
-            actions.append({
-                'type': 'attack',
-                'enemy_id': enemy['id'],
-                'target_id': target_char['id'],
-                'target_pos': {'x': target_char['x'], 'y': target_char['y']}
-            })
-        # Otherwise, move towards the target
-        else:
-            # Simple move logic: reduce the largest distance (dx or dy)
-            dx = target_char['x'] - enemy['x']
-            dy = target_char['y'] - enemy['y']
-            
-            potential_moves = []
-            
-            # Try to move horizontally
-            if abs(dx) > 0:
-                new_x = enemy['x'] + (1 if dx > 0 else -1)
-                if (new_x, enemy['y']) not in all_unit_positions:
-                    potential_moves.append((new_x, enemy['y']))
-            
-            # Try to move vertically
-            if abs(dy) > 0:
-                new_y = enemy['y'] + (1 if dy > 0 else -1)
-                if (enemy['x'], new_y) not in all_unit_positions:
-                    potential_moves.append((enemy['x'], new_y))
-
-            # Choose the move that gets it closer
-            if potential_moves:
-                potential_moves.sort(key=lambda pos: abs(target_char['x'] - pos[0]) + abs(target_char['y'] - pos[1]))
-                # record start and initialize path
-                start_x, start_y = enemy['x'], enemy['y']
-                path = []
-                # Move up to move_range
-                for _ in range(enemy['move_range']):
-                    if not potential_moves: break
-                    
-                    best_move = potential_moves[0]
-                    
-                    # Check if we can actually move there
-                    if (best_move[0], best_move[1]) in all_unit_positions:
-                        break # Path is blocked
-
-                    all_unit_positions.remove((enemy['x'], enemy['y'])) # Old position is free
-                    enemy['x'], enemy['y'] = best_move
-                    all_unit_positions.add(best_move) # New position is taken
-                    
-                    # Recalculate potential moves from new spot
-                    potential_moves = [best_move]
-                    dx = target_char['x'] - enemy['x']
-                    dy = target_char['y'] - enemy['y']
-                    if abs(dx) > 0:
-                        new_x = enemy['x'] + (1 if dx > 0 else -1)
-                        if (new_x, enemy['y']) not in all_unit_positions:
-                            potential_moves.append((new_x, enemy['y']))
-                    if abs(dy) > 0:
-                        new_y = enemy['y'] + (1 if dy > 0 else -1)
-                        if (enemy['x'], new_y) not in all_unit_positions:
-                            potential_moves.append((enemy['x'], new_y))
-                    
-                    if potential_moves:
-                        potential_moves.sort(key=lambda pos: abs(target_char['x'] - pos[0]) + abs(target_char['y'] - pos[1]))
-                        # record this step
-                        path.append(best_move)
-
-                # after movement steps, record movement action
-                if path:
-                    actions.append({
-                        'type': 'move',
-                        'enemy_id': enemy['id'],
-                        'from': {'x': start_x, 'y': start_y},
-                        'path': [{'x': pos[0], 'y': pos[1]} for pos in path]
-                    })
-
-    # attach collected actions to game state
-    game_state['enemy_actions'] = actions
+    try:
+        enemy_phase_deferred = apply_round(player_state['battle'], characters, action['actions'],
+                                           battle_log.rng(player_state), action['defer'], on_step=step_applied)
+    except ActionError:
+        # Earlier actions were applied to the cached battle; drop it so the next load replays the stored one
+        battle_log.discard(user_id)
+        raise
+
+    if check_mission_complete(game_state):
+        stage_id = player_state['current_stage']
+        rewards = award_mission_rewards(user_id, stage_id, game_state, battle_log.reward_rng(player_state))
+        # Without rewards the battle stays stored and the winning action unrecorded; drop the cached copy either way
+        battle_log.discard(user_id)
+        game_state['mission_complete'] = True
+        game_state['rewards'] = rewards
+        return jsonify({'results': results, 'state': battle_payload(player_state)})
+
+    battle_log.record(user_id, player_state, action)
+    if enemy_phase_deferred:
+        schedule_enemy_phase(user_id)
+    return jsonify({'results': results, 'state': battle_payload(player_state, base_state, base_version)})
+
+@app.route('/battle/events')
+@login_required
+def battle_event_stream():
+    """Server-sent events for the player's battle: a committed enemy phase's actions, then the new state"""
+    return Response(battle_events.stream(current_user_key()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target: request, storage, catalog and enemy phase metrics"""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/save-characters', methods=['POST'])
 @login_required
@@ -1304,9 +777,8 @@ def save_characters():
                 if field not in char:
                     return jsonify({'error': f'Character at index {i} is missing field: {field}'}), 400
         
-        # Save to characters.json
-        with open('characters.json', 'w') as f:
-            json.dump(characters_data, f, indent=4)
+        # Save to characters.json and swap the new roster into the catalog
+        catalog.replace_characters(characters_data)
         
         return jsonify({'message': 'Characters saved successfully'}), 200
         
@@ -1318,5 +790,13 @@ def save_characters():
 def character_editor_page():
     return retfromdir('character_editor.html')
 
+@app.cli.command('grant-xp')
+@click.argument('grants_file', type=click.File('r'))
+def grant_xp_command(grants_file):
+    """Grant XP from a JSON file of {user_id: {char_id: xp}}, e.g. an event payout"""
+    results = award_character_xp_bulk(json.load(grants_file))
+    level_ups = sum(levels for char_levels in results.values() for levels in char_levels.values())
+    click.echo(f'Granted XP to {len(results)} players ({level_ups} level ups)')
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
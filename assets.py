@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Only text formats are worth compressing; images are already compressed
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 512  # Bytes; smaller files are sent as-is
+
+
+class _Asset:
+    """One file's bytes plus its precompressed variants, tagged with the mtime they were read at"""
+
+    def __init__(self, path, mtime, data):
+        self.mtime = mtime
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.content_type = mimetype
+        if mimetype.startswith('text/') or mimetype == 'application/javascript':
+            self.content_type += '; charset=utf-8'
+        digest = hashlib.sha1(data).hexdigest()[:20]
+
+        # encoding -> (bytes, strong ETag); each representation gets its own ETag
+        self.variants = {'identity': (data, digest)}
+        if len(data) >= MIN_COMPRESS_SIZE and mimetype.startswith(COMPRESSIBLE_TYPES):
+            self.variants['gzip'] = (gzip.compress(data, compresslevel=9, mtime=0), f'{digest}-gz')
+            if brotli is not None:
+                self.variants['br'] = (brotli.compress(data, quality=11), f'{digest}-br')
+
+    def pick(self, accept_encodings):
+        """Return (encoding, bytes, etag) for the best variant the client accepts"""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding]:
+                return (encoding,) + self.variants[encoding]
+        return ('identity',) + self.variants['identity']
+
+
+class AssetCache:
+    """In-memory cache of pages and static files served with ETags and precompressed bodies.
+
+    Files are read and compressed once, then reused until their mtime changes.
+    Responses carry strong ETags so repeat visits get a 304, and the gzip or
+    brotli variant is chosen from Accept-Encoding.
+    """
+
+    def __init__(self, cache_control='no-cache'):
+        self.cache_control = cache_control
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        mtime = os.stat(path).st_mtime_ns
+        asset = self._assets.get(path)
+        if asset is None or asset.mtime != mtime:
+            with open(path, 'rb') as f:
+                data = f.read()
+            asset = _Asset(path, mtime, data)
+            with self._lock:
+                self._assets[path] = asset
+        return asset
+
+    def response(self, path, cache_control=None):
+        """Build a response for a file, answering 304 if the client's copy is current"""
+        asset = self.get(path)
+        encoding, body, etag = asset.pick(request.accept_encodings)
+
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': cache_control or self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(body, content_type=asset.content_type, headers=headers)
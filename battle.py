@@ -0,0 +1,114 @@
+"""In-memory model of one battle built over its stored JSON.
+
+The stored battle keeps characters and enemies as lists of unit dicts, which
+is what the client receives. Wrapping a game_state in a Battle turns those
+dicts into slotted units.Character and units.Enemy objects, in place, so a
+battle kept in memory holds the compact form. The units are also held in
+id-keyed registries, kept with the battle between requests: lookups and
+removals are O(1), and a unit that dies is only marked dead until the
+current resolution step (an attack, an enemy phase, a status tick) ends.
+end_step() then drops the dead from the registry and the occupancy grid and
+writes the lists back once.
+Status effects are indexed by a status.StatusSchedule, built on first use
+and kept for the life of the Battle.
+"""
+
+from grid import SIDES, OccupancyGrid
+from status import StatusSchedule
+from units import load_units
+
+
+class UnitRegistry:
+    """Units of one side keyed by id, kept in the order of the battle JSON"""
+
+    def __init__(self, side, units, grid):
+        self.side = side
+        self._grid = grid
+        self._units = {unit.id: unit for unit in units}
+        self._dead = {}  # id -> unit, removed at the end of the step
+        self.changed = False
+
+    def get(self, unit_id):
+        """The living unit with this id, or None"""
+        if unit_id in self._dead:
+            return None
+        return self._units.get(unit_id)
+
+    def alive(self, unit):
+        """True if the unit is in this registry and has not been killed this step"""
+        return self._units.get(unit.id) is unit and unit.id not in self._dead
+
+    def __iter__(self):
+        if not self._dead:
+            return iter(list(self._units.values()))
+        return iter([unit for unit_id, unit in self._units.items() if unit_id not in self._dead])
+
+    def __len__(self):
+        return len(self._units) - len(self._dead)
+
+    def ids(self):
+        return [unit.id for unit in self]
+
+    def first(self):
+        return next(iter(self), None)
+
+    def add(self, unit):
+        """Put a newly spawned unit into the battle"""
+        self._units[unit.id] = unit
+        self._grid.add(self.side, unit)
+        self.changed = True
+
+    def kill(self, unit):
+        """Mark a unit dead; it stays on the map until the step ends"""
+        if unit.id in self._units:
+            self._dead[unit.id] = unit
+
+    def sweep(self):
+        """Remove the units killed during this step"""
+        if not self._dead:
+            return
+        for unit_id, unit in self._dead.items():
+            del self._units[unit_id]
+            self._grid.remove(self.side, unit)
+        self._dead.clear()
+        self.changed = True
+
+    def to_list(self):
+        return list(self._units.values())
+
+
+class Battle:
+    """A battle's game_state with its unit registries and occupancy grid"""
+
+    def __init__(self, game_state):
+        load_units(game_state)
+        self.state = game_state
+        self.grid = OccupancyGrid.from_game_state(game_state)
+        self.characters = UnitRegistry('characters', game_state.get('characters', []), self.grid)
+        self.enemies = UnitRegistry('enemies', game_state.get('enemies', []), self.grid)
+        self._status = None
+
+    @property
+    def status(self):
+        if self._status is None:
+            self._status = StatusSchedule(self)
+        return self._status
+
+    def apply_status(self, side, unit, effect, rounds):
+        """Give a unit a status effect; the schedule picks it up if it has been built"""
+        if self._status is None:
+            unit.status_effects[effect] = rounds
+        else:
+            self._status.apply(side, unit, effect, rounds)
+
+    def registry(self, side):
+        return self.characters if side == 'characters' else self.enemies
+
+    def end_step(self):
+        """Apply deferred deaths and write changed unit lists back to the battle JSON"""
+        for side in SIDES:
+            registry = self.registry(side)
+            registry.sweep()
+            if registry.changed:
+                self.state[side] = registry.to_list()
+                registry.changed = False
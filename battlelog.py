@@ -0,0 +1,215 @@
+"""Event-sourced battles: a seeded RNG, an append-only action log and snapshots.
+
+A stored battle holds a `seed`, a snapshot of its game_data taken at
+`snapshot_version`, and the `log` of actions applied since then. Each
+action (a move, attack or end of turn with its parameters, or a deferred
+enemy phase) bumps the battle's version by one and draws its randomness
+from action_rng(seed, version), so replaying the log over the snapshot
+rebuilds the battle exactly. Persisting an action is one small append;
+every SNAPSHOT_INTERVAL actions the whole game_data is written instead and
+the log starts over. A round submitted in one request is logged as a single
+'round' action holding its player actions, replayed through apply_round.
+
+Replays use the current catalog, so editing a character's abilities
+mid-battle changes how that battle's earlier attacks replay.
+"""
+
+import os
+import random
+
+import engine
+from battle import Battle
+from delta import capture
+from tracing import span
+
+SNAPSHOT_INTERVAL = 20  # Actions between full game_data writes
+MAX_ROUND_ACTIONS = 32  # Largest round accepted in one request
+PLAYER_ACTIONS = ('move', 'attack', 'end_turn')
+
+
+def new_seed():
+    return os.urandom(8).hex()
+
+
+def action_rng(seed, version):
+    """The random source for the action that takes a battle to `version`"""
+    return random.Random(f'{seed}:{version}')
+
+
+def reward_rng(seed, version):
+    """The random source for mission rewards when the action to `version` wins the battle"""
+    return random.Random(f'{seed}:{version}:rewards')
+
+
+def apply_action(battle, catalog, action, rng, on_action=None):
+    """Apply one logged action to a battle.
+
+    Returns True when the round was left in the 'enemy' turn for a deferred
+    enemy phase. Raises engine.ActionError for an action the rules reject.
+    """
+    game_state = battle.state
+    kind = action['type']
+    if kind == 'move':
+        engine.move_character(battle, action['character_id'], action['x'], action['y'])
+        # ensure no enemy actions sent on player move
+        game_state.pop('enemy_actions', None)
+        return engine.advance_turn(battle, action.get('defer', False), rng)
+    if kind == 'attack':
+        engine.attack(battle, catalog, action['attacker_id'], action.get('attack_type', 'basic'),
+                      action.get('target_id'), action.get('target_x'), action.get('target_y'))
+        if engine.check_mission_complete(game_state):
+            return False
+        deferred = engine.advance_turn(battle, action.get('defer', False), rng)
+        # ensure no enemy actions sent on player attack
+        game_state.pop('enemy_actions', None)
+        return deferred
+    if kind == 'end_turn':
+        engine.end_turn(battle)
+        return engine.advance_turn(battle, action.get('defer', False), rng)
+    if kind == 'enemy_phase':
+        if game_state.get('turn') == 'enemy':
+            engine.run_enemy_phase(battle, on_action, rng)
+        return False
+    if kind == 'round':
+        return apply_round(battle, catalog, action['actions'], rng, action.get('defer', False), on_action)
+    raise engine.ActionError(f'Unknown action type: {kind}')
+
+
+def apply_round(battle, catalog, actions, rng, defer=False, on_action=None, on_step=None):
+    """Apply a round of player actions in order, then its enemy phase once.
+
+    Each action is applied as apply_action would with the enemy phase held
+    back; an action after every character has acted is rejected, and the
+    round stops early once the mission is won. on_step(index) is called
+    after each applied action. Returns True when the enemy phase was left
+    for the caller, as apply_action does.
+
+    Raises engine.ActionError naming the failing action; the actions before
+    it have already been applied to the battle.
+    """
+    if not actions:
+        raise engine.ActionError('No actions submitted')
+    if len(actions) > MAX_ROUND_ACTIONS:
+        raise engine.ActionError(f'At most {MAX_ROUND_ACTIONS} actions per round')
+    round_over = False
+    for index, action in enumerate(actions):
+        if action.get('type') not in PLAYER_ACTIONS:
+            raise engine.ActionError(f'Action {index + 1}: unknown action type')
+        if round_over:
+            raise engine.ActionError(f'Action {index + 1}: every character has already acted this round')
+        try:
+            round_over = apply_action(battle, catalog, {**action, 'defer': True}, rng)
+        except engine.ActionError as e:
+            raise engine.ActionError(f'Action {index + 1}: {e}') from e
+        if on_step:
+            on_step(index)
+        if engine.check_mission_complete(battle.state):
+            return False
+    if round_over and not defer:
+        engine.run_enemy_phase(battle, on_action, rng)
+        return False
+    return round_over
+
+
+def replay(record, catalog, upto=None):
+    """Rebuild a stored battle's game_data from its snapshot and log.
+
+    `upto` stops after the action that reached that version. The stored
+    record is not modified.
+    """
+    return replay_battle(record, catalog, upto).state
+
+
+def replay_battle(record, catalog, upto=None):
+    """As replay(), returning the Battle the log was applied to"""
+    seed = record.get('seed')
+    battle = Battle(capture(record['game_data']))
+    for version, action in enumerate(record.get('log', ()), start=record.get('snapshot_version', 0) + 1):
+        if upto is not None and version > upto:
+            break
+        apply_action(battle, catalog, action, action_rng(seed, version))
+    return battle
+
+
+class BattleLog:
+    """Loads battles as the routes see them and records their actions.
+
+    A loaded battle is a dict with current_stage, seed, version, the
+    materialized game_data and the Battle wrapping it. The last materialized
+    battle of each user is kept, with its occupancy grid, registries and
+    status schedule, so that a request neither rebuilds them nor replays
+    more than the actions another process logged since; the routes apply
+    actions to loaded['battle'] and record() moves it to the new version.
+    """
+
+    def __init__(self, get_store, snapshot_interval=SNAPSHOT_INTERVAL):
+        self._get_store = get_store
+        self.snapshot_interval = snapshot_interval
+        self._materialized = {}  # user_id -> loaded battle
+
+    def start(self, user_id, stage_id, game_data):
+        """Store a new battle with a fresh seed; game_data is its first snapshot"""
+        loaded = {'current_stage': stage_id, 'seed': new_seed(), 'game_data': game_data,
+                  'battle': Battle(game_data), 'logged': 0}
+        with span('storage.save'):
+            self._write_snapshot(user_id, loaded)
+        self._materialized[user_id] = loaded
+        return loaded
+
+    def load(self, user_id, catalog):
+        """The user's battle at its latest version, or None without one"""
+        with span('storage.load'):
+            record = self._get_store().get_player_state(user_id)
+        if not record:
+            self._materialized.pop(user_id, None)
+            return None
+        version = record.get('version', 0)
+        loaded = self._materialized.get(user_id)
+        if loaded is not None and loaded['version'] == version and loaded['seed'] == record.get('seed'):
+            return loaded
+        logged = len(record.get('log', ()))
+        if record.get('seed') is None:
+            # Battles stored before action logging get a seed, and a snapshot, on their next action
+            logged = self.snapshot_interval
+        with span('replay'):
+            battle = replay_battle(record, catalog)
+        loaded = {'current_stage': record['current_stage'], 'seed': record.get('seed') or new_seed(),
+                  'version': version, 'game_data': battle.state, 'battle': battle, 'logged': logged}
+        self._materialized[user_id] = loaded
+        return loaded
+
+    def rng(self, loaded):
+        """The random source for the next action on a loaded battle"""
+        return action_rng(loaded['seed'], loaded['version'] + 1)
+
+    def reward_rng(self, loaded):
+        return reward_rng(loaded['seed'], loaded['version'] + 1)
+
+    def record(self, user_id, loaded, action):
+        """Persist an action already applied to loaded['game_data'].
+
+        Appends it to the log, or writes a snapshot when the log is due for
+        one. Raises StaleStateError if the battle moved on since it was loaded.
+        """
+        try:
+            with span('storage.save'):
+                if loaded['logged'] + 1 >= self.snapshot_interval:
+                    self._write_snapshot(user_id, loaded, expected_version=loaded['version'])
+                else:
+                    loaded['version'] = self._get_store().append_battle_action(user_id, action, loaded['version'])
+                    loaded['logged'] += 1
+        except Exception:
+            self._materialized.pop(user_id, None)
+            raise
+        return loaded['version']
+
+    def discard(self, user_id):
+        """Forget a battle's materialized state, e.g. when it finished or an action was left half-applied"""
+        self._materialized.pop(user_id, None)
+
+    def _write_snapshot(self, user_id, loaded, expected_version=None):
+        record = {'current_stage': loaded['current_stage'], 'seed': loaded['seed'],
+                  'game_data': capture(loaded['game_data'])}
+        self._get_store().save_player_state(user_id, record, expected_version=expected_version)
+        loaded['version'] = record['version']
+        loaded['logged'] = 0
@@ -0,0 +1,426 @@
+"""Micro-benchmarks for the combat and persistence hot paths.
+
+Drives the real routes through Flask's test client (/select_stage, /move,
+/attack with every ability pattern in the catalog, /end_turn) and times the
+engine and storage paths directly: enemy_turn, process_status_effects,
+award_mission_rewards, and loading and writing back the whole account
+store. Each fixture size (10, 10,000 and 100,000 users unless --users is
+given) runs in a fresh process, in a scratch directory holding a generated
+accounts.json (or SQLite database) with that many users, a share of them in
+the middle of a battle.
+
+Every operation reports ops/sec, p50/p99 latency and the bytes read and
+written per call, taken from /proc/self/io where the platform has it. The
+JSON store's write-behind journal is flushed inside each measurement, so a
+route's journal bytes are counted against it. Results can be written as
+JSON and compared with an earlier run to catch regressions:
+
+    python benchmark.py --json bench.json
+    python benchmark.py --users 100000 --backend sqlite --iterations 50
+    python benchmark.py --json new.json --compare bench.json
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILES = ('characters.json', 'missions.json', 'elements.json', 'banners.json')
+
+DEFAULT_USERS = (10, 10000, 100000)
+ITERATIONS = 200        # Timed calls per operation
+STORE_ITERATIONS = 5    # Whole-store loads and writes are much slower; fewer calls
+BATTLE_SHARE = 0.1      # Share of fixture users with an open battle
+REGRESSION_THRESHOLD = 0.2  # --compare flags ops/sec drops larger than this fraction
+
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+# --- Measurement ---
+
+def _io_counters():
+    """(bytes read, bytes written) by this process so far, or None without /proc/self/io"""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Recorder:
+    """Latency and I/O samples per operation name"""
+
+    def __init__(self):
+        self.samples = {}
+        # Reading /proc/self/io is itself a read; measure it once to leave it out of the counts
+        first, second = _io_counters(), _io_counters()
+        self._probe_bytes = second[0] - first[0] if first and second else 0
+
+    @contextmanager
+    def measure(self, op):
+        """Time the block; set outcome['ok'] = False inside it to count an error"""
+        outcome = {'ok': True}
+        io_before = _io_counters()
+        started = time.perf_counter()
+        yield outcome
+        elapsed = time.perf_counter() - started
+        io_after = _io_counters()
+        read = written = None
+        if io_before and io_after:
+            read = max(0, io_after[0] - io_before[0] - self._probe_bytes)
+            written = io_after[1] - io_before[1]
+        self.samples.setdefault(op, []).append((elapsed, read, written, outcome['ok']))
+
+    def summary(self):
+        report = {}
+        for op, samples in sorted(self.samples.items()):
+            times = [sample[0] for sample in samples]
+            reads = [sample[1] for sample in samples if sample[1] is not None]
+            writes = [sample[2] for sample in samples if sample[2] is not None]
+            report[op] = {
+                'count': len(samples),
+                'errors': sum(1 for sample in samples if not sample[3]),
+                'ops_per_sec': round(len(times) / sum(times), 1) if sum(times) else None,
+                'p50_ms': round(_percentile(times, 0.5) * 1000, 3),
+                'p99_ms': round(_percentile(times, 0.99) * 1000, 3),
+                'read_bytes': round(sum(reads) / len(reads)) if reads else None,
+                'written_bytes': round(sum(writes) / len(writes)) if writes else None,
+            }
+        return report
+
+
+# --- Fixtures ---
+
+def write_fixture(path, catalog, users, battle_share=BATTLE_SHARE, seed=0):
+    """Write an accounts.json with `users` players; returns the ids of those left mid-battle"""
+    import engine
+
+    rng = random.Random(seed)
+    characters = catalog.characters
+    materials = sorted({material for mission in catalog.missions for material in mission['materials']})
+    password = hashlib.sha256(b'bench').hexdigest()
+    data = {'users': {}, 'player_states': {}, 'next_user_id': users + 1}
+    in_battle = []
+    for n in range(1, users + 1):
+        user_id = str(n)
+        progress = {str(c['id']): {'level': rng.randint(1, 100), 'xp': rng.randint(0, 100)}
+                    for c in rng.sample(characters, rng.randint(1, len(characters)))}
+        data['users'][f'user{n}'] = {
+            'id': user_id,
+            'password': password,
+            'total_xp': rng.randint(0, 100000),
+            'player_characters': progress,
+            'inventory': {material: rng.randint(0, 50) for material in rng.sample(materials, min(3, len(materials)))},
+        }
+        if rng.random() < battle_share:
+            stage_id = rng.choice(sorted(engine.STAGE_CONFIGS))
+            team = rng.sample(characters, min(4, len(characters)))
+            level = rng.randint(1, 100)
+            roster = {t['id']: dict(engine.scaled_stats(t, level), level=level) for t in team}
+            data['player_states'][user_id] = {
+                'current_stage': stage_id, 'seed': f'{seed}:{n}', 'game_data': engine.new_battle(stage_id, team, roster),
+                'version': 1, 'snapshot_version': 1, 'log': [],
+            }
+            in_battle.append(user_id)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+    return in_battle
+
+
+def _free_neighbour(battle, unit):
+    for dx, dy in NEIGHBOURS:
+        if not battle.grid.is_blocked(unit.x + dx, unit.y + dy):
+            return unit.x + dx, unit.y + dy
+    return None
+
+
+def _attack_setup(engine, catalog, template, ability, stage_id):
+    """A battle where `template` is active with full energy and SP and a target in reach.
+
+    Enemies get enough HP that the attack cannot end the mission.
+    Returns (game_data, /attack body).
+    """
+    from battle import Battle
+
+    team = [template] + [c for c in catalog.characters if c['id'] != template['id']][:3]
+    roster = {t['id']: dict(engine.scaled_stats(t, 20), level=20) for t in team}
+    game_data = engine.new_battle(stage_id, team, roster)
+    game_data['team_sp'] = game_data['max_team_sp'] = 5
+    battle = Battle(game_data)
+    attacker = next(c for c in battle.characters if c.char_id == template['id'])
+    game_data['active_character_id'] = attacker.id
+    attacker.energy = attacker.max_energy = max(100, ability.energy_cost)
+    for enemy in battle.enemies:
+        enemy.hp = enemy.max_hp = 10 ** 6
+
+    if ability.is_heal:
+        target = attacker
+        attacker.hp = max(1, attacker.max_hp // 2)
+    else:
+        target = battle.enemies.first()
+        tile = _free_neighbour(battle, attacker)
+        if tile:
+            battle.grid.move('enemies', target, *tile)
+    body = {'attacker_id': attacker.id, 'attack_type': ability.attack_type,
+            'target_id': target.id, 'target_x': target.x, 'target_y': target.y}
+    return game_data, body
+
+
+# --- Suites ---
+
+def bench_routes(app_module, recorder, iterations, rng):
+    """select_stage, move and end_turn through the test client"""
+    from battle import Battle
+
+    store = app_module.get_account_store()
+    client = app_module.app.test_client()
+    client.post('/register', json={'username': 'bench', 'password': 'bench'})
+    client.post('/login', json={'username': 'bench', 'password': 'bench'})
+    team = [{'id': c['id']} for c in app_module.catalog.snapshot().characters[:4]]
+    stages = sorted(app_module.engine.STAGE_CONFIGS)
+
+    for _ in range(iterations):
+        with recorder.measure('select_stage') as outcome:
+            response = client.post('/select_stage', json={'stage_id': rng.choice(stages), 'team': team})
+            store.flush()
+            outcome['ok'] = response.status_code == 200
+
+        state = client.get('/game_state').get_json()
+        battle = Battle(state)
+        active = battle.characters.get(state['active_character_id'])
+        tile = _free_neighbour(battle, active)
+        if tile:
+            with recorder.measure('move') as outcome:
+                response = client.post('/move', json={'character_id': active.id, 'x': tile[0], 'y': tile[1]})
+                store.flush()
+                outcome['ok'] = response.status_code == 200
+
+        # End turns until the enemy phase has run
+        for _ in range(len(state['characters']) + 1):
+            with recorder.measure('end_turn') as outcome:
+                response = client.post('/end_turn', json={})
+                store.flush()
+                outcome['ok'] = response.status_code == 200
+            if response.status_code != 200 or 'enemy_actions' in response.get_json():
+                break
+
+
+def bench_attacks(app_module, recorder, iterations, rng):
+    """/attack once per ability, grouped by the ability's pattern"""
+    store = app_module.get_account_store()
+    client = app_module.app.test_client()
+    client.post('/register', json={'username': 'bench_attacks', 'password': 'bench'})
+    client.post('/login', json={'username': 'bench_attacks', 'password': 'bench'})
+    user_id = store.get_user('bench_attacks')['id']
+    catalog = app_module.catalog.snapshot()
+    stages = sorted(app_module.engine.STAGE_CONFIGS)
+
+    for template in catalog.characters:
+        for ability in catalog.abilities[template['id']].values():
+            for _ in range(iterations):
+                stage_id = rng.choice(stages)
+                game_data, body = _attack_setup(app_module.engine, catalog, template, ability, stage_id)
+                app_module.battle_log.start(user_id, stage_id, game_data)
+                store.flush()
+                with recorder.measure(f'attack:{ability.pattern}') as outcome:
+                    response = client.post('/attack', json=body)
+                    store.flush()
+                    outcome['ok'] = response.status_code == 200
+
+
+def bench_engine(app_module, recorder, iterations, rng):
+    """enemy_turn and process_status_effects on fresh stage battles"""
+    from battle import Battle
+    from delta import capture
+
+    engine = app_module.engine
+    catalog = app_module.catalog.snapshot()
+    team = catalog.characters[:4]
+    roster = {t['id']: dict(engine.scaled_stats(t, 20), level=20) for t in team}
+    battles = {stage_id: engine.new_battle(stage_id, team, roster) for stage_id in sorted(engine.STAGE_CONFIGS)}
+    effects = ['burn', 'poison', 'chaos', 'regeneration', 'vulnerability', 'blessed', 'frozen', 'adrenaline']
+
+    for _ in range(iterations):
+        stage_id = rng.choice(sorted(battles))
+        battle = Battle(capture(battles[stage_id]))
+        battle.state['turn'] = 'enemy'
+        with recorder.measure('enemy_turn'):
+            engine.enemy_turn(battle, rng=rng)
+
+        battle = Battle(capture(battles[stage_id]))
+        for unit in list(battle.characters) + list(battle.enemies):
+            unit.status_effects = {effect: rng.randint(1, 3) for effect in rng.sample(effects, 3)}
+        with recorder.measure('process_status_effects'):
+            engine.process_status_effects(battle, rng)
+
+
+def bench_rewards(app_module, recorder, in_battle, rng):
+    """award_mission_rewards for fixture users that are mid-battle"""
+    from battle import Battle
+    from delta import capture
+
+    store = app_module.get_account_store()
+    for user_id in in_battle:
+        player_state = store.get_player_state(user_id)
+        if not player_state:
+            continue
+        game_state = Battle(capture(player_state['game_data'])).state
+        with recorder.measure('award_mission_rewards') as outcome:
+            rewards = app_module.award_mission_rewards(user_id, player_state['current_stage'], game_state, rng)
+            store.flush()
+            outcome['ok'] = rewards is not None
+
+
+def bench_store(app_module, recorder, iterations):
+    """Load the whole account store from disk and write it back as one snapshot"""
+    import storage
+
+    for _ in range(iterations):
+        with recorder.measure('accounts_load'):
+            # The flusher thread is left idle and the copy is closed before the next load
+            store = storage.JsonAccountStore(app_module.ACCOUNTS_FILE, app_module.ACCOUNTS_JOURNAL_FILE)
+        store.close()
+    store = app_module.get_account_store()
+    for _ in range(iterations):
+        with recorder.measure('accounts_save'):
+            store.compact()
+
+
+def run_fixture(users, backend, iterations, store_iterations, battle_share, seed):
+    """Generate a fixture in a scratch directory and run every suite against it"""
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    try:
+        for name in DATA_FILES:
+            if os.path.exists(os.path.join(REPO_DIR, name)):
+                shutil.copy(os.path.join(REPO_DIR, name), workdir)
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_DIR)
+        from catalog import Catalog
+
+        started = time.perf_counter()
+        in_battle = write_fixture('accounts.json', Catalog().snapshot(), users, battle_share, seed)
+        if backend == 'sqlite':
+            from storage import migrate_json_to_sqlite
+            migrate_json_to_sqlite('accounts.json', 'accounts.db', 'accounts.journal')
+        fixture_seconds = time.perf_counter() - started
+        fixture_bytes = os.path.getsize('accounts.db' if backend == 'sqlite' else 'accounts.json')
+
+        os.environ['ACCOUNTS_BACKEND'] = backend
+        os.environ['ACCOUNTS_DB'] = 'accounts.db'
+        import app as app_module
+
+        rng = random.Random(seed)
+        recorder = Recorder()
+        bench_routes(app_module, recorder, iterations, rng)
+        bench_attacks(app_module, recorder, max(1, iterations // 10), rng)
+        bench_engine(app_module, recorder, iterations, rng)
+        bench_rewards(app_module, recorder, rng.sample(in_battle, min(iterations, len(in_battle))), rng)
+        if backend == 'json':
+            bench_store(app_module, recorder, store_iterations)
+        app_module.get_account_store().close()
+        return {
+            'users': users,
+            'backend': backend,
+            'open_battles': len(in_battle),
+            'fixture_bytes': fixture_bytes,
+            'fixture_seconds': round(fixture_seconds, 2),
+            'ops': recorder.summary(),
+        }
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- Reporting ---
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _fmt(value):
+    return '-' if value is None else str(value)
+
+
+def print_results(results):
+    for fixture in results:
+        print(f'\n{fixture["backend"]} store, {fixture["users"]} users, {fixture["open_battles"]} open battles '
+              f'({fixture["fixture_bytes"] / 1e6:.1f} MB)')
+        print(f'{"operation":<28} {"ops/s":>10} {"p50 ms":>9} {"p99 ms":>9} {"read B":>11} {"written B":>11} {"errors":>6}')
+        for op, stats in fixture['ops'].items():
+            print(f'{op:<28} {_fmt(stats["ops_per_sec"]):>10} {stats["p50_ms"]:>9} {stats["p99_ms"]:>9} '
+                  f'{_fmt(stats["read_bytes"]):>11} {_fmt(stats["written_bytes"]):>11} {stats["errors"]:>6}')
+
+
+def compare(previous, results, threshold=REGRESSION_THRESHOLD):
+    """Print ops/sec changes against an earlier run; returns the regressions found"""
+    earlier = {(fixture['backend'], fixture['users']): fixture['ops'] for fixture in previous['results']}
+    regressions = []
+    print(f'\nCompared with {previous.get("commit") or "previous run"}:')
+    for fixture in results:
+        old_ops = earlier.get((fixture['backend'], fixture['users']))
+        if old_ops is None:
+            continue
+        for op, stats in fixture['ops'].items():
+            old = old_ops.get(op)
+            if not old or not old['ops_per_sec'] or not stats['ops_per_sec']:
+                continue
+            change = stats['ops_per_sec'] / old['ops_per_sec'] - 1
+            flag = ''
+            if change < -threshold:
+                flag = '  REGRESSION'
+                regressions.append((fixture['backend'], fixture['users'], op, change))
+            print(f'{fixture["backend"]:<7} {fixture["users"]:>7} {op:<28} {change * 100:+7.1f}%{flag}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the combat and persistence hot paths')
+    parser.add_argument('--users', action='append', type=int, default=[],
+                        help=f'Fixture size in users; repeat for several (default: {", ".join(map(str, DEFAULT_USERS))})')
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--store-iterations', type=int, default=STORE_ITERATIONS)
+    parser.add_argument('--battle-share', type=float, default=BATTLE_SHARE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='PATH', help='Write the results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='Earlier --json output to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    # Every fixture gets a fresh interpreter, so app.py's module state starts clean each time
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for users in args.users or DEFAULT_USERS:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_fixture, (users, args.backend, args.iterations, args.store_iterations,
+                                                    args.battle_share, args.seed)))
+    print_results(results)
+
+    report = {'commit': _commit(), 'python': platform.python_version(), 'timestamp': time.time(), 'results': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=4)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), results, args.threshold):
+                sys.exit(1)
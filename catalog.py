@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+
+from abilities import compile_abilities
+from gacha import compile_banners
+from metrics import CATALOG_LOADS, CATALOG_READ_BYTES
+from tracing import span
+
+CHARACTERS_FILE = 'characters.json'
+MISSIONS_FILE = 'missions.json'
+ELEMENTS_FILE = 'elements.json'
+BANNERS_FILE = 'banners.json'
+
+CHECK_INTERVAL = 2.0  # Seconds between mtime checks on the catalog files
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _load_list(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        text = f.read()
+    name = os.path.basename(path)
+    CATALOG_LOADS.inc(name)
+    CATALOG_READ_BYTES.inc(name, amount=len(text))
+    return json.loads(text)
+
+
+class CatalogSnapshot:
+    """Immutable view of the parsed catalog files with lookups by id"""
+
+    def __init__(self, characters, missions, elements, banners, mtimes):
+        self.characters = characters
+        self.missions = missions
+        self.elements = elements
+        self.banners = banners
+        self.characters_by_id = {c['id']: c for c in characters}
+        self.missions_by_id = {m['id']: m for m in missions}
+        self.elements_by_id = {e['id']: e for e in elements}
+        # {char_id: {attack_type: Ability}}, compiled once per catalog load
+        self.abilities = compile_abilities(characters)
+        # {banner_id: Banner} with alias tables built over the current roster
+        self.banners_by_id = compile_banners(banners, self.characters_by_id)
+        self.mtimes = mtimes
+
+
+class Catalog:
+    """Parsed characters, missions, elements and banners kept in memory.
+
+    Readers get the current CatalogSnapshot; a changed file is picked up on the
+    first access after CHECK_INTERVAL and a new snapshot swapped in whole, so a
+    request never sees half of an update. Between checks no file I/O happens.
+    """
+
+    def __init__(self, characters_file=CHARACTERS_FILE, missions_file=MISSIONS_FILE,
+                 elements_file=ELEMENTS_FILE, banners_file=BANNERS_FILE, check_interval=CHECK_INTERVAL):
+        self.paths = {'characters': characters_file, 'missions': missions_file, 'elements': elements_file,
+                      'banners': banners_file}
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._snapshot = self._build({})
+
+    def _build(self, previous):
+        """Parse files whose mtime differs from the previous snapshot, reusing the rest"""
+        data = {}
+        mtimes = {}
+        for name, path in self.paths.items():
+            mtimes[name] = _mtime(path)
+            if previous and previous['mtimes'].get(name) == mtimes[name]:
+                data[name] = previous[name]
+            else:
+                data[name] = _load_list(path)
+        return CatalogSnapshot(data['characters'], data['missions'], data['elements'], data['banners'], mtimes)
+
+    def snapshot(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with span('catalog.load'), self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    current = self._snapshot
+                    if any(_mtime(path) != current.mtimes[name] for name, path in self.paths.items()):
+                        self._snapshot = self._build({
+                            'characters': current.characters, 'missions': current.missions,
+                            'elements': current.elements, 'banners': current.banners, 'mtimes': current.mtimes,
+                        })
+        return self._snapshot
+
+    def replace_characters(self, characters):
+        """Write a new characters file and swap it into the catalog"""
+        path = self.paths['characters']
+        with self._lock:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(characters, f, indent=4)
+            os.replace(tmp_path, path)
+            current = self._snapshot
+            mtimes = dict(current.mtimes, characters=_mtime(path))
+            self._snapshot = CatalogSnapshot(characters, current.missions, current.elements, current.banners, mtimes)
@@ -0,0 +1,60 @@
+import json
+
+from units import json_default, wire_unit
+
+# Lists of units that are diffed per unit id rather than sent whole
+UNIT_LISTS = ('characters', 'enemies')
+
+_MISSING = object()
+
+
+def capture(game_state):
+    """Take an independent copy of a battle, in its wire form, to diff against after an action"""
+    return json.loads(json.dumps(game_state, default=json_default))
+
+
+def _diff_units(before, after):
+    before_by_id = {unit['id']: unit for unit in before}
+    changed = []
+    for unit in after:
+        old = before_by_id.pop(unit['id'], None)
+        if old is None:
+            # A unit that did not exist before is sent in full
+            changed.append(unit)
+            continue
+        fields = {key: value for key, value in unit.items() if old.get(key, _MISSING) != value}
+        removed_fields = [key for key in old if key not in unit]
+        if fields or removed_fields:
+            fields['id'] = unit['id']
+            if removed_fields:
+                fields['_unset'] = removed_fields
+            changed.append(fields)
+    entry = {}
+    if changed:
+        entry['changed'] = changed
+    if before_by_id:
+        entry['removed'] = list(before_by_id)
+    return entry
+
+
+def diff_state(before, after, base_version, version):
+    """Build a patch that turns `before` (at base_version) into `after` (at version).
+
+    Units are matched by id and only changed fields are listed; other
+    top-level keys are sent whole when their value changed.
+    """
+    patch = {'base_version': base_version, 'version': version}
+    changed = {}
+    for key, value in after.items():
+        if key in UNIT_LISTS:
+            units = _diff_units(before.get(key, []), [wire_unit(unit) for unit in value])
+            if units:
+                patch[key] = units
+        elif before.get(key, _MISSING) != value:
+            changed[key] = value
+    if changed:
+        patch['set'] = changed
+    unset = [key for key in before if key not in after]
+    if unset:
+        patch['unset'] = unset
+    return patch
@@ -0,0 +1,434 @@
+"""Battle rules, independent of Flask and of account storage.
+
+Everything that changes a battle lives here: building a battle for a stage
+and team, the player actions (move, attack, end turn), turn order, the enemy
+phase and end-of-round status effects. Functions work on a battle.Battle
+and raise ActionError for an action the rules do not allow, before changing
+anything. app.py wraps them in routes with sessions, locking and storage;
+simulate.py drives them directly for balance runs.
+
+Randomness comes from the `rng` argument (the random module by default), so
+a seeded random.Random makes a whole battle reproducible.
+"""
+
+import json
+import random
+import time
+
+from abilities import AbilityError, element_multiplier
+from metrics import ENEMY_PHASE_SECONDS
+from pathfinding import DistanceField
+from progression import calculate_character_stats
+from status import modified_damage
+from tracing import span, traced
+from vectorized import EnemyTargeting, batching_available
+
+
+class ActionError(Exception):
+    """A player action is not allowed in the current battle state"""
+
+
+# --- Stats and stages ---
+
+def scaled_stats(template, level):
+    """HP and damage of a character template at a level"""
+    calculated_stats = calculate_character_stats(template['max_hp'], template['basic_attack_damage'], level)
+    return {
+        'hp': calculated_stats['hp'],
+        'max_hp': calculated_stats['max_hp'],
+        'damage': calculated_stats['damage'],
+        'skill_damage': int(template['skill_attack_damage'] * (calculated_stats['damage'] / template['basic_attack_damage']))
+    }
+
+def new_battle(stage_id, team_templates, roster):
+    """Build the game_state for a stage with a team.
+
+    roster maps each template's id to its resolved 'level', 'hp', 'max_hp',
+    'damage' and 'skill_damage'.
+    """
+    if stage_id not in STAGE_CONFIGS:
+        raise ActionError('Invalid stage ID')
+
+    team_characters = []
+    for i, char_template in enumerate(team_templates):
+        resolved = roster[char_template['id']]
+        team_char = {
+            'id': i + 1,  # Use sequential IDs for the game
+            'char_id': char_template['id'],  # Keep reference to original character
+            'name': char_template['name'],
+            'x': 1, 'y': 1 + (i * 2),  # Position characters in starting positions
+            'hp': resolved['hp'],
+            'max_hp': resolved['max_hp'],
+            'attack_range': char_template['basic_attack_range'],
+            'skill_attack_range': char_template['skill_attack_range'],
+            'move_range': char_template['move_range'],
+            'has_acted': False,
+            'damage': resolved['damage'],
+            'skill_damage': resolved['skill_damage'],
+            'element': char_template.get('element', 'air'),  # Add element
+            'level': resolved['level'],  # Track level for display and reference
+            'energy': 0,  # Start with 0 energy
+            'max_energy': 100,  # All characters have 100 max energy
+            'status_effects': {}  # Track status effects
+        }
+        team_characters.append(team_char)
+
+    initial_game_data = json.loads(json.dumps(STAGE_CONFIGS[stage_id]))
+    initial_game_data['characters'] = team_characters  # Replace with selected team
+    initial_game_data['turn'] = 'player'
+    if team_characters:
+        initial_game_data['active_character_id'] = team_characters[0]['id']
+    
+    # Ensure team SP is initialized
+    if 'team_sp' not in initial_game_data:
+        initial_game_data['team_sp'] = 0
+    if 'max_team_sp' not in initial_game_data:
+        initial_game_data['max_team_sp'] = 5
+    return initial_game_data
+
+def check_mission_complete(game_state):
+    """Check if the mission is complete (all enemies defeated)"""
+    return len(game_state.get('enemies', [])) == 0
+
+# Define element effectiveness system
+# ELEMENT_EFFECTIVENESS = {
+#     'fire': {'weak_to': ['water'], 'strong_vs': ['grass', 'ice']},
+#     'water': {'weak_to': ['grass', 'lightning'], 'strong_vs': ['fire', 'earth']},
+#     'earth': {'weak_to': ['grass', 'water'], 'strong_vs': ['lightning', 'fire']},
+#     'air': {'weak_to': ['lightning'], 'strong_vs': ['earth']},
+#     'lightning': {'weak_to': ['earth'], 'strong_vs': ['water', 'air']},
+#     'grass': {'weak_to': ['fire', 'ice'], 'strong_vs': ['water', 'earth']},
+#     'ice': {'weak_to': ['fire'], 'strong_vs': ['grass', 'air']},
+#     'dark': {'weak_to': ['grass'], 'strong_vs': ['air']}
+# }
+
+# Stage configurations with more detailed stats
+STAGE_CONFIGS = {
+    1: {
+        'enemies': [
+            {
+                'id': 1, 'x': 8, 'y': 4, 'hp': 50, 'max_hp': 50, 'attack_range': 1, 'move_range': 2, 'damage': 10,
+                'element': 'fire', 'shield_hp': 30, 'max_shield_hp': 30, 'shield_weak_to': ['water', 'ice'],
+                'status_effects': {}
+            },
+        ],
+        'grid_size': {'width': 15, 'height': 15},
+        'characters': [
+            {'id': 1, 'x': 1, 'y': 1, 'hp': 100, 'max_hp': 100, 'attack_range': 2, 'move_range': 3, 'has_acted': False, 'damage': 25},
+            {'id': 2, 'x': 1, 'y': 3, 'hp': 100, 'max_hp': 100, 'attack_range': 2, 'move_range': 3, 'has_acted': False, 'damage': 25},
+            {'id': 3, 'x': 1, 'y': 5, 'hp': 100, 'max_hp': 100, 'attack_range': 2, 'move_range': 3, 'has_acted': False, 'damage': 25},
+            {'id': 4, 'x': 1, 'y': 7, 'hp': 100, 'max_hp': 100, 'attack_range': 2, 'move_range': 3, 'has_acted': False, 'damage': 25},
+        ],
+        'team_sp': 3,
+        'max_team_sp': 5
+    },
+    2: {
+        'enemies': [
+            {
+                'id': 1, 'x': 7, 'y': 3, 'hp': 60, 'max_hp': 60, 'attack_range': 2, 'move_range': 2, 'damage': 15,
+                'element': 'earth', 'shield_hp': 40, 'max_shield_hp': 40, 'shield_weak_to': ['grass', 'water'],
+                'status_effects': {}
+            },
+            {
+                'id': 2, 'x': 9, 'y': 5, 'hp': 45, 'max_hp': 45, 'attack_range': 1, 'move_range': 3, 'damage': 12,
+                'element': 'lightning', 'shield_hp': 25, 'max_shield_hp': 25, 'shield_weak_to': ['earth'],
+                'status_effects': {}
+            },
+        ],
+        'grid_size': {'width': 15, 'height': 15},
+        'characters': [],  # Will be filled with selected team
+        'team_sp': 2,
+        'max_team_sp': 5
+    },
+    3: {
+        'enemies': [
+            {
+                'id': 1, 'x': 8, 'y': 4, 'hp': 80, 'max_hp': 80, 'attack_range': 3, 'move_range': 1, 'damage': 20,
+                'element': 'dark', 'shield_hp': 60, 'max_shield_hp': 60, 'shield_weak_to': ['grass'],
+                'status_effects': {}
+            },
+            {
+                'id': 2, 'x': 6, 'y': 6, 'hp': 50, 'max_hp': 50, 'attack_range': 2, 'move_range': 2, 'damage': 14,
+                'element': 'ice', 'shield_hp': 35, 'max_shield_hp': 35, 'shield_weak_to': ['fire'],
+                'status_effects': {}
+            },
+            {
+                'id': 3, 'x': 10, 'y': 2, 'hp': 40, 'max_hp': 40, 'attack_range': 1, 'move_range': 3, 'damage': 10,
+                'element': 'air', 'shield_hp': 20, 'max_shield_hp': 20, 'shield_weak_to': ['lightning'],
+                'status_effects': {}
+            },
+        ],
+        'grid_size': {'width': 15, 'height': 15},
+        'characters': [],  # Will be filled with selected team
+        'team_sp': 1,
+        'max_team_sp': 5
+    },
+}
+
+# --- Player actions ---
+
+def move_character(battle, char_id, new_x, new_y):
+    """Move the active character and end its action"""
+    game_state = battle.state
+    char = battle.characters.get(char_id)
+
+    if not char or char.has_acted or char.id != game_state.get('active_character_id'):
+        raise ActionError('Character cannot move now')
+
+    if abs(new_x - char.x) + abs(new_y - char.y) > char.move_range:
+        raise ActionError('Move is out of range')
+
+    grid = battle.grid
+    if not grid.in_bounds(new_x, new_y):
+        raise ActionError('Move is out of bounds')
+
+    if grid.is_wall(new_x, new_y):
+        raise ActionError('Tile is blocked')
+
+    # Check if the destination tile is occupied
+    if grid.is_occupied(new_x, new_y):
+        raise ActionError('Tile is occupied')
+
+    grid.move('characters', char, new_x, new_y)
+    char.has_acted = True
+
+def attack(battle, catalog, attacker_id, attack_type='basic', target_id=None, target_x=None, target_y=None):
+    """Use the active character's basic, skill or ultimate attack.
+
+    catalog is a CatalogSnapshot; its compiled abilities do the targeting.
+    target_id may be an ally for heals; target_x/target_y aim area attacks.
+    """
+    game_state = battle.state
+    attacker = battle.characters.get(attacker_id)
+    
+    if not attacker or attacker.has_acted or attacker.id != game_state.get('active_character_id'):
+        raise ActionError('Invalid action')
+
+    # Get character template to determine attack type
+    char_template = catalog.characters_by_id.get(attacker.char_id if attacker.char_id is not None else attacker_id)
+    if not char_template:
+        raise ActionError('Character template not found')
+
+    # Abilities are compiled once per catalog load; see abilities.py
+    abilities = catalog.abilities[char_template['id']]
+    ability = abilities.get(attack_type) or abilities['basic']
+
+    # Initialize team SP if not present
+    if 'team_sp' not in game_state:
+        game_state['team_sp'] = 0
+    if 'max_team_sp' not in game_state:
+        game_state['max_team_sp'] = 5
+
+    # Check energy requirement for ultimate attacks
+    if attack_type == 'ultimate':
+        if attacker.energy < ability.energy_cost:
+            raise ActionError('Not enough energy for ultimate attack')
+
+    # Check skill point requirement
+    if attack_type == 'skill':
+        if game_state['team_sp'] <= 0:
+            raise ActionError('Not enough skill points')
+
+    # Select targets and apply damage, heals and status effects for the ability's pattern
+    try:
+        with span('ability.resolve'):
+            ability.resolve(battle, attacker, target_id, target_x, target_y)
+    except AbilityError as e:
+        raise ActionError(str(e)) from e
+
+    # Handle energy and SP changes
+    if attack_type == 'ultimate':
+        attacker.energy -= ability.energy_cost
+    elif attack_type == 'skill':
+        game_state['team_sp'] -= 1
+    else:
+        # Increase team SP for basic attacks (up to max), but only for non-healing attacks
+        if not ability.is_heal and game_state['team_sp'] < game_state['max_team_sp']:
+            game_state['team_sp'] += 1
+
+    # Gain energy based on damage dealt
+    energy_gain = ability.energy_gain(len(battle.enemies))
+    if energy_gain:
+        attacker.energy = min(attacker.max_energy, attacker.energy + energy_gain)
+
+    # Special character effects (e.g. Rex the Berserker's rage costs HP)
+    if ability.self_damage:
+        attacker.hp = max(1, attacker.hp - ability.self_damage)
+
+    attacker.has_acted = True
+
+def end_turn(battle):
+    """Skip the rest of the active character's action"""
+    active_char = battle.characters.get(battle.state.get('active_character_id'))
+    if active_char:
+        active_char.has_acted = True
+
+# --- Turn order and enemy phase ---
+
+@traced('process_status_effects')
+def process_status_effects(battle, rng=random):
+    """Process status effects for all characters and enemies; see status.StatusSchedule"""
+    battle.status.end_round(rng)
+
+@traced('advance_turn')
+def advance_turn(battle, defer_enemy_phase=False, rng=random):
+    """
+    Advances the turn to the next character or triggers the enemy turn.
+
+    With defer_enemy_phase the round is left in the 'enemy' turn for the caller
+    to resolve in the background; returns True when that happened.
+    """
+    game_state = battle.state
+    active_char_id = game_state.get('active_character_id')
+    if not active_char_id:
+        return False
+
+    characters = list(battle.characters)
+    char_ids = [c.id for c in characters]
+    if not char_ids:
+        enemy_turn(battle, rng=rng) # No characters left, just run enemy turn
+        return False
+
+    try:
+        current_index = char_ids.index(active_char_id)
+    except ValueError:
+        current_index = -1
+
+    # Find the next character who hasn't acted
+    next_char_found = False
+    for i in range(1, len(char_ids) + 1):
+        check_index = (current_index + i) % len(char_ids)
+        if not characters[check_index].has_acted:
+            game_state['active_character_id'] = char_ids[check_index]
+            next_char_found = True
+            break
+    
+    if not next_char_found:
+        # All characters have acted, start enemy turn
+        game_state['turn'] = 'enemy'
+        if defer_enemy_phase:
+            return True
+        run_enemy_phase(battle, rng=rng)
+    return False
+
+def run_enemy_phase(battle, on_action=None, rng=random):
+    """Resolve the enemy turn and end-of-round effects, then start the next player round"""
+    game_state = battle.state
+    started = time.perf_counter()
+    enemy_turn(battle, on_action, rng)
+    # Process status effects at the end of the round
+    process_status_effects(battle, rng)
+    ENEMY_PHASE_SECONDS.observe(time.perf_counter() - started)
+    game_state['turn'] = 'player'
+    # Reset all characters for the next round
+    for char in battle.characters:
+        char.has_acted = False
+    # Set active character to the first one
+    if len(battle.characters):
+        game_state['active_character_id'] = battle.characters.first().id
+
+@traced('enemy_turn')
+def enemy_turn(battle, on_action=None, rng=random):
+    """Move and attack with every enemy; on_action is called with each action as it resolves"""
+    game_state = battle.state
+    grid = battle.grid
+    actions = []  # collect enemy move/attack actions
+
+    def record(action):
+        actions.append(action)
+        if on_action:
+            on_action(action)
+
+    if not len(battle.enemies) or not len(battle.characters):
+        game_state['enemy_actions'] = actions
+        return
+
+    # Shared by every enemy that moves; built once, on the first move of the phase
+    field = None
+    status = battle.status
+
+    # Large encounters compute distances, targets and damage for all pairs at once
+    enemies = list(battle.enemies)
+    targeting = None
+    if batching_available(len(enemies), len(battle.characters)):
+        targeting = EnemyTargeting(enemies, list(battle.characters), element_multiplier, status)
+
+    for row, enemy in enumerate(enemies):
+        # Skip if enemy is frozen
+        if status.modifiers('enemies', enemy).skips_turn:
+            continue
+            
+        # Find the closest character(s)
+        if targeting:
+            min_dist, closest_chars = targeting.closest(row)
+        else:
+            min_dist = float('inf')
+            closest_chars = []
+            for char in battle.characters:
+                dist = abs(char.x - enemy.x) + abs(char.y - enemy.y)
+                if dist < min_dist:
+                    min_dist = dist
+                    closest_chars = [char]
+                elif dist == min_dist:
+                    closest_chars.append(char)
+        
+        if not closest_chars:
+            continue
+
+        target_char = rng.choice(closest_chars)
+
+        # Attack if in range
+        in_range = targeting.in_range[row] if targeting else min_dist <= enemy.attack_range
+        if in_range:
+            if targeting:
+                final_damage = targeting.damage_to(row, target_char)
+            else:
+                # Calculate element effectiveness for enemy attack
+                base_damage = int(enemy.damage * element_multiplier(enemy.element, target_char.element))
+
+                # Apply status effect modifications
+                final_damage = modified_damage(base_damage, status.modifiers('enemies', enemy),
+                                               status.modifiers('characters', target_char))
+            
+            target_char.hp -= final_damage
+            
+            # Character gains energy when taking damage
+            energy_gain = min(15, max(3, int(final_damage * 0.15)))  # 3-15 energy when taking damage
+            target_char.energy = min(target_char.max_energy, target_char.energy + energy_gain)
+            
+            if target_char.hp <= 0:
+                # Stays on its tile until the phase ends, then leaves the battle
+                battle.characters.kill(target_char)
+                if targeting:
+                    targeting.kill(target_char)
+            # record attack action
+            record({
+                'type': 'attack',
+                'enemy_id': enemy.id,
+                'target_id': target_char.id,
+                'target_pos': {'x': target_char.x, 'y': target_char.y}
+            })
+        # Otherwise, walk down the distance field towards the nearest character
+        else:
+            if field is None:
+                field = DistanceField(grid, [(c.x, c.y) for c in battle.characters])
+            start_x, start_y = enemy.x, enemy.y
+            path = []
+            for _ in range(enemy.move_range):
+                step = field.next_step(enemy.x, enemy.y)
+                if step is None:
+                    break # No free tile gets closer
+                grid.move('enemies', enemy, *step)
+                path.append(step)
+
+            if path:
+                record({
+                    'type': 'move',
+                    'enemy_id': enemy.id,
+                    'from': {'x': start_x, 'y': start_y},
+                    'path': [{'x': pos[0], 'y': pos[1]} for pos in path]
+                })
+
+    battle.end_step()
+    # attach collected actions to game state
+    game_state['enemy_actions'] = actions
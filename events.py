@@ -0,0 +1,68 @@
+import json
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from units import json_default
+
+KEEPALIVE_INTERVAL = 15  # Seconds between keepalive comments on an idle stream
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Enemy phases run here, off the request thread that finished the round
+enemy_phase_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='enemy-phase')
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"), default=json_default)}\n\n'
+
+
+class BattleEventBroker:
+    """Fan-out of battle events to the server-sent event streams of each user.
+
+    Subscribers are per-process queues, so events only reach streams held by
+    the worker that resolved them; clients poll /game_state as a fallback.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[user_id].add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                # A stalled client drops events; the final battle_state resyncs it
+                pass
+
+    def stream(self, user_id, keepalive=KEEPALIVE_INTERVAL):
+        """Generate SSE-formatted text for one user's events until the client disconnects"""
+        q = self.subscribe(user_id)
+        try:
+            yield 'retry: 2000\n\n'
+            while True:
+                try:
+                    event, data = q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(event, data)
+        finally:
+            self.unsubscribe(user_id, q)
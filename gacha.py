@@ -0,0 +1,157 @@
+"""Banner pulls: rarity tiers over weighted character pools, with pity.
+
+Each banner in banners.json lists rarity tiers, each with a pull rate and a
+weighted pool of character ids. Tiers and pools are compiled into alias
+tables once per catalog load, so a draw costs O(1) whatever the pool size.
+A multi-pull draws all of its tiers in one batch, applies pity in a single
+pass over them, then draws the characters of each tier in one batch.
+
+NumPy is optional; with it the batches are vectorized, without it they are
+drawn one by one from the same tables.
+"""
+
+import random
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; pulls fall back to plain Python draws
+    np = None
+
+MAX_PULLS = 100  # Largest multi-pull accepted in one request
+
+
+class GachaError(Exception):
+    """A pull cannot be made, e.g. an unknown banner or not enough currency"""
+
+
+class AliasTable:
+    """Vose's alias method over a list of weights: O(n) to build, O(1) per draw"""
+
+    def __init__(self, weights):
+        count = len(weights)
+        total = float(sum(weights))
+        if not count or total <= 0 or any(weight < 0 for weight in weights):
+            raise ValueError('AliasTable needs non-negative weights with a positive sum')
+        scaled = [weight * count / total for weight in weights]
+        prob = [1.0] * count
+        alias = list(range(count))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left over is 1.0 up to rounding error
+        self.prob = prob
+        self.alias = alias
+        if np is not None:
+            self._prob = np.array(prob, dtype=np.float64)
+            self._alias = np.array(alias, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.prob)
+
+    def draw(self, rng=random):
+        column = int(rng.random() * len(self.prob))
+        return column if rng.random() < self.prob[column] else self.alias[column]
+
+    def draw_many(self, count, rng=random):
+        """`count` independent draws; vectorized when NumPy is available"""
+        if np is None:
+            return [self.draw(rng) for _ in range(count)]
+        generator = np.random.default_rng(rng.getrandbits(64))
+        columns = generator.integers(0, len(self.prob), size=count)
+        coins = generator.random(count)
+        return np.where(coins < self._prob[columns], columns, self._alias[columns]).tolist()
+
+
+class Banner:
+    """A compiled banner: tier and pool alias tables, cost, pity and duplicate rewards"""
+
+    def __init__(self, template, characters_by_id):
+        self.id = template['id']
+        self.name = template.get('name', str(self.id))
+        cost = template.get('cost', {})
+        self.cost_material = cost.get('material')
+        self.cost_amount = cost.get('amount', 0)
+        pity = template.get('pity') or {}
+        self.pity_rarity = pity.get('rarity')
+        self.pity_hard = pity.get('hard')
+        self.duplicate_xp = {int(rarity): xp for rarity, xp in template.get('duplicate_xp', {}).items()}
+
+        # Highest rarity first; tiers whose pool names no known character are dropped
+        self.rarities = []
+        self.rates = []
+        self.pools = []
+        self._pool_tables = []
+        for tier in sorted(template.get('tiers', []), key=lambda tier: -tier['rarity']):
+            pool = [entry for entry in tier.get('pool', []) if entry['id'] in characters_by_id]
+            if not pool or tier.get('rate', 0) <= 0:
+                continue
+            self.rarities.append(tier['rarity'])
+            self.rates.append(tier['rate'])
+            self.pools.append([entry['id'] for entry in pool])
+            self._pool_tables.append(AliasTable([entry.get('weight', 1) for entry in pool]))
+        if not self.pools:
+            raise ValueError(f'Banner {self.id} has no pullable tiers')
+        self._tier_table = AliasTable(self.rates)
+        # The lowest tier at or above the pity rarity; tiers before it count as pity hits too
+        self._pity_tier = None
+        if self.pity_rarity is not None:
+            for i, rarity in enumerate(self.rarities):
+                if rarity >= self.pity_rarity:
+                    self._pity_tier = i
+
+    def cost(self, count):
+        """{material: amount} for `count` pulls"""
+        if not self.cost_material or not self.cost_amount:
+            return {}
+        return {self.cost_material: self.cost_amount * count}
+
+    def pull(self, count, pity=0, rng=random):
+        """Draw `count` characters; returns ([(char_id, rarity), ...], pity after the pulls).
+
+        `pity` counts pulls since the last result at or above the pity
+        rarity; the pull that reaches the hard limit is raised to that tier.
+        """
+        tiers = self._tier_table.draw_many(count, rng)
+        if self._pity_tier is not None and self.pity_hard:
+            for i, tier in enumerate(tiers):
+                pity += 1
+                if tier > self._pity_tier and pity >= self.pity_hard:
+                    tiers[i] = tier = self._pity_tier
+                if tier <= self._pity_tier:
+                    pity = 0
+
+        # One batch per tier, in tier order, so a seeded rng gives the same pulls every time
+        picks = [None] * count
+        for tier, table in enumerate(self._pool_tables):
+            slots = [i for i, drawn in enumerate(tiers) if drawn == tier]
+            if slots:
+                pool = self.pools[tier]
+                for slot, column in zip(slots, table.draw_many(len(slots), rng)):
+                    picks[slot] = (pool[column], self.rarities[tier])
+        return picks, pity
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'cost': {'material': self.cost_material, 'amount': self.cost_amount},
+            'pity': {'rarity': self.pity_rarity, 'hard': self.pity_hard},
+            'tiers': [{'rarity': rarity, 'rate': rate, 'pool': pool}
+                      for rarity, rate, pool in zip(self.rarities, self.rates, self.pools)],
+        }
+
+
+def compile_banners(banners, characters_by_id):
+    """{banner_id: Banner} for every banner with at least one pullable tier"""
+    compiled = {}
+    for template in banners:
+        try:
+            compiled[template['id']] = Banner(template, characters_by_id)
+        except ValueError:
+            continue
+    return compiled
@@ -0,0 +1,122 @@
+"""Occupancy grid and spatial index for the units of one battle.
+
+The grid mirrors the positions stored in the battle's units: a count of
+units per tile for O(1) occupancy checks, and per side (characters or
+enemies) buckets from tile to the units standing on it, so area queries only
+look at the tiles inside the queried diamond. Every move, death and spawn must
+go through the grid to keep it in step with the units. Walls from the stage's
+'walls' list are fixed for the whole battle and block movement.
+"""
+
+SIDES = ('characters', 'enemies')
+DEFAULT_GRID_SIZE = {'width': 15, 'height': 15}
+
+
+class OccupancyGrid:
+    """Tile occupancy plus tile -> unit buckets for a width x height battle map"""
+
+    def __init__(self, width, height, walls=()):
+        self.width = width
+        self.height = height
+        self._occupancy = bytearray(width * height)
+        self._walls = bytearray(width * height)
+        for x, y in walls:
+            if self.in_bounds(x, y):
+                self._walls[y * width + x] = 1
+        self._buckets = {side: {} for side in SIDES}
+        self._counts = dict.fromkeys(SIDES, 0)
+
+    @classmethod
+    def from_game_state(cls, game_state):
+        size = game_state.get('grid_size') or DEFAULT_GRID_SIZE
+        walls = [(wall['x'], wall['y']) for wall in game_state.get('walls', ())]
+        grid = cls(size['width'], size['height'], walls)
+        for side in SIDES:
+            for unit in game_state.get(side, ()):
+                grid.add(side, unit)
+        return grid
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_occupied(self, x, y):
+        """True if a unit stands on the tile; tiles off the map count as blocked"""
+        if not self.in_bounds(x, y):
+            return True
+        return self._occupancy[y * self.width + x] > 0
+
+    def is_wall(self, x, y):
+        return self.in_bounds(x, y) and self._walls[y * self.width + x] == 1
+
+    def is_blocked(self, x, y):
+        """True if a unit cannot step onto the tile: off the map, a wall or occupied"""
+        if not self.in_bounds(x, y):
+            return True
+        index = y * self.width + x
+        return self._walls[index] == 1 or self._occupancy[index] > 0
+
+    def blocked_mask(self):
+        """Flat per-tile copy of is_blocked (row-major), for whole-grid passes"""
+        return bytearray(wall | (count > 0) for wall, count in zip(self._walls, self._occupancy))
+
+    def add(self, side, unit):
+        """Place a unit that has just spawned (or was loaded) at its x, y"""
+        index = self._index(unit.x, unit.y)
+        if index is None:
+            return
+        self._occupancy[index] += 1
+        self._buckets[side].setdefault(index, []).append(unit)
+        self._counts[side] += 1
+
+    def remove(self, side, unit):
+        """Take a unit off the map, e.g. when it is defeated"""
+        index = self._index(unit.x, unit.y)
+        bucket = self._buckets[side].get(index) if index is not None else None
+        if not bucket or not any(u is unit for u in bucket):
+            return
+        bucket[:] = [u for u in bucket if u is not unit]
+        if not bucket:
+            del self._buckets[side][index]
+        self._occupancy[index] -= 1
+        self._counts[side] -= 1
+
+    def move(self, side, unit, x, y):
+        """Move a unit to (x, y), updating both the unit and the index"""
+        self.remove(side, unit)
+        unit.x, unit.y = x, y
+        self.add(side, unit)
+
+    def units_at(self, side, x, y):
+        index = self._index(x, y)
+        if index is None:
+            return []
+        return list(self._buckets[side].get(index, ()))
+
+    def within(self, side, x, y, radius):
+        """Units of one side within Manhattan distance `radius` of (x, y).
+
+        Walks the tiles of the diamond; when the diamond holds more tiles than
+        the side has units (huge ranges such as ultimates) the units are
+        checked directly instead.
+        """
+        if radius < 0:
+            return []
+        buckets = self._buckets[side]
+        if 2 * radius * (radius + 1) + 1 > self._counts[side]:
+            return [unit for bucket in buckets.values() for unit in bucket
+                    if abs(unit.x - x) + abs(unit.y - y) <= radius]
+
+        found = []
+        for ty in range(max(0, y - radius), min(self.height - 1, y + radius) + 1):
+            span = radius - abs(ty - y)
+            row = ty * self.width
+            for tx in range(max(0, x - span), min(self.width - 1, x + span) + 1):
+                bucket = buckets.get(row + tx)
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    def _index(self, x, y):
+        if not self.in_bounds(x, y):
+            return None
+        return y * self.width + x
@@ -0,0 +1,126 @@
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+LOCK_DIR = 'locks'
+
+
+class _KeyLock:
+    """Re-entrant lock for one key: a thread lock plus an advisory file lock.
+
+    The thread lock orders requests inside one worker; the flock on
+    locks/<key>.lock orders workers. flock is taken only by the outermost
+    acquisition, since a second flock from the same process would block on
+    itself.
+
+    Lock files are removed by the last local holder while it still has the
+    flock, so the directory only holds the keys in use. A worker that waited
+    on a file which was removed meanwhile sees that the path no longer
+    names the file it locked, and locks the new one instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+        self.users = 0  # user_lock() calls holding or waiting for this lock; guarded by _locks_guard
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        if self.depth == 0 and fcntl is not None:
+            try:
+                self.fd = self._lock_file()
+            except BaseException:
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+
+    def _lock_file(self):
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)  # Removed or replaced while we waited; lock the file now at the path
+
+    def release(self, remove_file=False):
+        self.depth -= 1
+        if self.depth == 0 and self.fd is not None:
+            if remove_file:
+                try:
+                    os.unlink(self.path)
+                except FileNotFoundError:
+                    pass
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        self.thread_lock.release()
+
+
+# Only keys with a holder or waiter in this process have an entry
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _key_lock(key):
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            Path(LOCK_DIR).mkdir(exist_ok=True)
+            safe_key = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(key))
+            lock = _locks[key] = _KeyLock(os.path.join(LOCK_DIR, f'{safe_key}.lock'))
+        lock.users += 1
+        return lock
+
+
+def _release_key_lock(key, lock):
+    # Under the guard, so that nobody takes a new lock for the key until this one is released
+    with _locks_guard:
+        lock.users -= 1
+        last = lock.users == 0
+        if last:
+            del _locks[key]
+        lock.release(remove_file=last)
+
+
+@contextmanager
+def user_lock(key):
+    """Hold the lock for a user (or any other key) across threads and worker processes"""
+    lock = _key_lock(key)
+    try:
+        lock.acquire()
+    except BaseException:
+        with _locks_guard:
+            lock.users -= 1
+            if lock.users == 0:
+                del _locks[key]
+        raise
+    try:
+        yield
+    finally:
+        _release_key_lock(key, lock)
+
+
+def locked_for_user(get_key):
+    """Decorator running a route under user_lock(get_key())"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with user_lock(get_key()):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
@@ -0,0 +1,167 @@
+"""In-process metrics exported in the Prometheus text format.
+
+Counters, gauges and histograms are plain Python objects keyed by their
+label values; recording one is a dict update under a lock, cheap enough to
+leave on under load. The module-level metrics below are shared by the
+routes, the account stores, the catalog and the engine, and REGISTRY
+renders all of them for /metrics.
+"""
+
+import bisect
+import threading
+
+# Seconds; from a cached read to a slow enemy phase or whole-store write
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per combination of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in sorted(items):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    """A value read from a callback whenever the metrics are rendered"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def samples(self):
+        yield self.name, '', self.callback()
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, with their sum, per label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, *label_values):
+        counts = self._values.get(label_values)
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(label_values, list(counts)) for label_values, counts in self._values.items()]
+        for label_values, counts in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _format_labels(self.labels, label_values, [('le', _format_value(bound))]), cumulative)
+            yield f'{self.name}_sum', _format_labels(self.labels, label_values), counts[-1]
+            yield f'{self.name}_count', _format_labels(self.labels, label_values), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, callback):
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                # A failing gauge callback should not take the other metrics down with it
+                continue
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status', ('endpoint', 'method', 'status'))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time spent handling HTTP requests', ('endpoint', 'method'))
+
+STORE_OPERATIONS = REGISTRY.counter(
+    'account_store_operations_total', 'Account store loads and writes by backend and operation',
+    ('backend', 'operation'))
+STORE_READ_BYTES = REGISTRY.counter(
+    'account_store_read_bytes_total', 'Bytes of account data read by backend and target', ('backend', 'target'))
+STORE_WRITTEN_BYTES = REGISTRY.counter(
+    'account_store_written_bytes_total', 'Bytes of account data written by backend and target', ('backend', 'target'))
+
+CATALOG_LOADS = REGISTRY.counter(
+    'catalog_file_loads_total', 'Catalog files parsed from disk (characters, missions, ...)', ('file',))
+CATALOG_READ_BYTES = REGISTRY.counter(
+    'catalog_read_bytes_total', 'Bytes read from catalog files', ('file',))
+
+ENEMY_PHASE_SECONDS = REGISTRY.histogram(
+    'enemy_phase_duration_seconds', 'Time to resolve one enemy phase and its end-of-round effects')
@@ -0,0 +1,80 @@
+"""Distance-field pathfinding shared by all enemies in an enemy phase.
+
+Instead of each enemy searching for its own path, one breadth-first pass
+from every living character's tile labels each reachable tile with its
+step count to the nearest character. Walls and tiles occupied at the start
+of the phase are not walked through. Each enemy then walks downhill on the
+field one tile at a time, checking the live grid before every step so it
+never moves onto a tile that filled up during the phase.
+"""
+
+from collections import deque
+
+UNREACHABLE = 1 << 30
+
+# Neighbour order also decides ties between equally good steps
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class DistanceField:
+    """Steps from every tile to the nearest source tile over an OccupancyGrid"""
+
+    def __init__(self, grid, sources):
+        self.grid = grid
+        self.width = grid.width
+        self.height = grid.height
+        self.distances = self._build(grid.blocked_mask(), sources)
+
+    def _build(self, blocked, sources):
+        width, height = self.width, self.height
+        distances = [UNREACHABLE] * (width * height)
+        queue = deque()
+        for x, y in sources:
+            if 0 <= x < width and 0 <= y < height:
+                index = y * width + x
+                if distances[index] == UNREACHABLE:
+                    distances[index] = 0
+                    queue.append(index)
+
+        while queue:
+            index = queue.popleft()
+            step = distances[index] + 1
+            x, y = index % width, index // width
+            if x + 1 < width and distances[index + 1] == UNREACHABLE and not blocked[index + 1]:
+                distances[index + 1] = step
+                queue.append(index + 1)
+            if x > 0 and distances[index - 1] == UNREACHABLE and not blocked[index - 1]:
+                distances[index - 1] = step
+                queue.append(index - 1)
+            if y + 1 < height and distances[index + width] == UNREACHABLE and not blocked[index + width]:
+                distances[index + width] = step
+                queue.append(index + width)
+            if y > 0 and distances[index - width] == UNREACHABLE and not blocked[index - width]:
+                distances[index - width] = step
+                queue.append(index - width)
+        return distances
+
+    def at(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return UNREACHABLE
+        return self.distances[y * self.width + x]
+
+    def distance_from(self, x, y):
+        """Distance of (x, y), derived from its neighbours if the tile was occupied when the field was built"""
+        distance = self.at(x, y)
+        if distance != UNREACHABLE:
+            return distance
+        nearest = min(self.at(x + dx, y + dy) for dx, dy in NEIGHBOURS)
+        return nearest + 1 if nearest != UNREACHABLE else UNREACHABLE
+
+    def next_step(self, x, y):
+        """The free neighbouring tile that gets closest to a source, or None if no step gets closer"""
+        best = None
+        best_distance = self.distance_from(x, y)
+        for dx, dy in NEIGHBOURS:
+            nx, ny = x + dx, y + dy
+            distance = self.at(nx, ny)
+            if distance < best_distance and not self.grid.is_blocked(nx, ny):
+                best = (nx, ny)
+                best_distance = distance
+        return best
@@ -0,0 +1,61 @@
+"""Character levels, XP and level-scaled stats as tables built at import.
+
+Levelling from level L to L + 1 costs 100 + L XP, up to MAX_LEVEL. Instead
+of paying that one level at a time, CUMULATIVE_XP[L] holds the XP it takes
+to reach level L from level 1, so granting any amount of XP is one binary
+search. Stat multipliers are likewise looked up per level instead of being
+recomputed for every roster view and battle.
+"""
+
+from bisect import bisect_right
+
+MAX_LEVEL = 100
+BASE_STATS_LEVEL = 20  # characters.json holds level 20 stats
+
+
+def calculate_level_up_cost(current_level):
+    """Calculate XP needed to level up from current level"""
+    return 100 + current_level
+
+
+def _stat_multiplier(level):
+    # Level 1 = 1/20th of level 20 stats, Level 20 = level 20 stats, Level 100 = 5x level 20 stats
+    if level <= BASE_STATS_LEVEL:
+        return level / 20.0
+    # After level 20, stats continue to grow to 5x base at level 100
+    return 1.0 + (4.0 * (level - 20) / 80.0)
+
+
+# Index = level; index 0 is a placeholder so levels index directly
+CUMULATIVE_XP = [0, 0]
+for _level in range(1, MAX_LEVEL):
+    CUMULATIVE_XP.append(CUMULATIVE_XP[-1] + calculate_level_up_cost(_level))
+STAT_MULTIPLIERS = [_stat_multiplier(level) for level in range(MAX_LEVEL + 1)]
+
+
+def xp_to_next_level(level):
+    """XP needed for the next level, or 0 at the level cap"""
+    return calculate_level_up_cost(level) if level < MAX_LEVEL else 0
+
+
+def apply_character_xp(char_data, xp_amount):
+    """Add XP to a character progress record and apply level ups; returns the number of levels gained"""
+    level = char_data['level']
+    if level >= MAX_LEVEL or level < 1:
+        char_data['xp'] += xp_amount
+        return 0
+    total = CUMULATIVE_XP[level] + char_data['xp'] + xp_amount
+    new_level = max(level, min(bisect_right(CUMULATIVE_XP, total) - 1, MAX_LEVEL))
+    char_data['level'] = new_level
+    char_data['xp'] = total - CUMULATIVE_XP[new_level]
+    return new_level - level
+
+
+def calculate_character_stats(base_hp, base_damage, level):
+    """Calculate character stats based on level (current stats are level 20 stats, max level 100)"""
+    multiplier = STAT_MULTIPLIERS[level] if 0 <= level <= MAX_LEVEL else _stat_multiplier(level)
+    return {
+        'hp': int(base_hp * multiplier),
+        'max_hp': int(base_hp * multiplier),
+        'damage': int(base_damage * multiplier)
+    }
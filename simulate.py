@@ -0,0 +1,265 @@
+"""Headless battle simulator for balancing characters.json and STAGE_CONFIGS.
+
+Plays many battles per team and stage through the engine, with no Flask or
+account storage involved, spread over a multiprocessing pool. Reports win
+rate, rounds to clear and damage per battle for every team/stage pair.
+
+    python simulate.py --team 1,2,3,4 --stage 1 --stage 3 --battles 2000
+    python simulate.py --all-teams 3 --level 40 --policy random --json out.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import random
+import time
+
+import engine
+from battle import Battle
+from catalog import CHARACTERS_FILE, ELEMENTS_FILE, MISSIONS_FILE, Catalog
+from engine import STAGE_CONFIGS, ActionError
+
+MAX_ROUNDS = 100  # A battle still running after this many rounds counts as a timeout
+CHUNK_SIZE = 50   # Battles per pool task
+
+# Loaded once per worker process by _init_worker
+_catalog = None
+
+
+def _init_worker(characters_file):
+    global _catalog
+    _catalog = Catalog(characters_file, MISSIONS_FILE, ELEMENTS_FILE).snapshot()
+
+
+def _distance(a, b):
+    return abs(a.x - b.x) + abs(a.y - b.y)
+
+
+# --- Player policies ---
+# A policy takes one action for the active character through the engine.
+
+def _try_attack(battle, catalog, actor, attack_type, target):
+    try:
+        engine.attack(battle, catalog, actor.id, attack_type, target.id, target.x, target.y)
+        return True
+    except ActionError:
+        return False
+
+
+def _approach(battle, actor, goal, rng=None):
+    """Move towards `goal` as far as the move range allows; returns False if no tile is better"""
+    grid = battle.grid
+    best = None
+    best_distance = _distance(actor, goal)
+    reach = actor.move_range
+    for dy in range(-reach, reach + 1):
+        span = reach - abs(dy)
+        for dx in range(-span, span + 1):
+            x, y = actor.x + dx, actor.y + dy
+            if (dx or dy) and not grid.is_blocked(x, y):
+                distance = abs(x - goal.x) + abs(y - goal.y)
+                if distance < best_distance or (rng and distance == best_distance and rng.random() < 0.5):
+                    best, best_distance = (x, y), distance
+    if best is None:
+        return False
+    engine.move_character(battle, actor.id, *best)
+    return True
+
+
+def _shielded_against(actor, enemy):
+    """True if the enemy's shield blocks the actor's hits without breaking"""
+    return enemy.shield_hp > 0 and actor.element not in enemy.shield_weak_to
+
+
+def scripted_policy(battle, catalog, actor, rng):
+    """Strongest usable attack on the nearest enemy it can hurt (or the most injured ally for heals), else close in"""
+    abilities = catalog.abilities[actor.char_id]
+    nearest = min(battle.enemies, key=lambda enemy: (_shielded_against(actor, enemy), _distance(actor, enemy)))
+    injured = min(battle.characters, key=lambda ally: ally.hp / ally.max_hp)
+    for attack_type in ('ultimate', 'skill', 'basic'):
+        ability = abilities[attack_type]
+        if ability.is_heal:
+            if injured.hp < injured.max_hp and _try_attack(battle, catalog, actor, attack_type, injured):
+                return
+        elif _try_attack(battle, catalog, actor, attack_type, nearest):
+            return
+    if not _approach(battle, actor, nearest):
+        engine.end_turn(battle)
+
+
+def random_policy(battle, catalog, actor, rng):
+    """Any legal action, picked uniformly: an attack on a random unit, a step, or passing"""
+    options = ['ultimate', 'skill', 'basic', 'move', 'end']
+    rng.shuffle(options)
+    for option in options:
+        if option == 'end':
+            engine.end_turn(battle)
+            return
+        if option == 'move':
+            if _approach(battle, actor, rng.choice(list(battle.enemies)), rng):
+                return
+            continue
+        units = list(battle.characters) if catalog.abilities[actor.char_id][option].is_heal else list(battle.enemies)
+        if _try_attack(battle, catalog, actor, option, rng.choice(units)):
+            return
+
+
+POLICIES = {'scripted': scripted_policy, 'random': random_policy}
+
+
+# --- Battles ---
+
+def _hp(registry):
+    return {unit.id: unit.hp for unit in registry}
+
+
+def _hp_lost(before, registry):
+    """HP lost since `before`; units that left the battle count down to 0"""
+    after = _hp(registry)
+    lost = 0
+    for unit_id, hp in before.items():
+        drop = max(0, hp) - max(0, after.get(unit_id, 0))
+        if drop > 0:
+            lost += drop
+    return lost
+
+
+def play_battle(catalog, stage_id, team_ids, level, policy, seed, max_rounds=MAX_ROUNDS):
+    """Play one battle to the end; returns its outcome, rounds and damage totals"""
+    rng = random.Random(seed)
+    templates = [catalog.characters_by_id[char_id] for char_id in team_ids]
+    roster = {t['id']: dict(engine.scaled_stats(t, level), level=level) for t in templates}
+    state = engine.new_battle(stage_id, templates, roster)
+    battle = Battle(state)
+    act = POLICIES[policy]
+
+    rounds = 1
+    damage_dealt = damage_taken = 0
+    while True:
+        if engine.check_mission_complete(state):
+            outcome = 'win'
+            break
+        if not len(battle.characters):
+            outcome = 'loss'
+            break
+        if rounds > max_rounds:
+            outcome = 'timeout'
+            break
+
+        enemies_before, characters_before = _hp(battle.enemies), _hp(battle.characters)
+        actor = battle.characters.get(state['active_character_id'])
+        act(battle, catalog, actor, rng)
+        if not engine.check_mission_complete(state):
+            state.pop('enemy_actions', None)
+            engine.advance_turn(battle, rng=rng)
+            if 'enemy_actions' in state:
+                rounds += 1
+        damage_dealt += _hp_lost(enemies_before, battle.enemies)
+        damage_taken += _hp_lost(characters_before, battle.characters)
+
+    return {'outcome': outcome, 'rounds': rounds, 'damage_dealt': damage_dealt, 'damage_taken': damage_taken}
+
+
+def _run_chunk(task):
+    stage_id, team_ids, level, policy, seeds, max_rounds = task
+    results = [play_battle(_catalog, stage_id, team_ids, level, policy, seed, max_rounds) for seed in seeds]
+    return stage_id, team_ids, results
+
+
+# --- Reporting ---
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _distribution(values):
+    if not values:
+        return None
+    return {'mean': round(sum(values) / len(values), 2), 'p10': _percentile(values, 0.1),
+            'p50': _percentile(values, 0.5), 'p90': _percentile(values, 0.9)}
+
+
+def summarize(results):
+    outcomes = [r['outcome'] for r in results]
+    clears = [r['rounds'] for r in results if r['outcome'] == 'win']
+    return {
+        'battles': len(results),
+        'win_rate': round(outcomes.count('win') / len(results), 4),
+        'losses': outcomes.count('loss'),
+        'timeouts': outcomes.count('timeout'),
+        'rounds_to_clear': _distribution(clears),
+        'damage_dealt': _distribution([r['damage_dealt'] for r in results]),
+        'damage_taken': _distribution([r['damage_taken'] for r in results]),
+    }
+
+
+def simulate(teams, stages, battles, level, policy, seed, workers=None, characters_file=CHARACTERS_FILE,
+             max_rounds=MAX_ROUNDS, chunk_size=CHUNK_SIZE):
+    """Run `battles` battles for every team/stage pair; returns {(team, stage): summary}"""
+    tasks = []
+    for team_ids, stage_id in itertools.product(teams, stages):
+        seeds = [f'{seed}:{",".join(map(str, team_ids))}:{stage_id}:{n}' for n in range(battles)]
+        for start in range(0, battles, chunk_size):
+            tasks.append((stage_id, team_ids, level, policy, seeds[start:start + chunk_size], max_rounds))
+
+    collected = {}
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(characters_file,)) as pool:
+        for stage_id, team_ids, results in pool.imap_unordered(_run_chunk, tasks):
+            collected.setdefault((team_ids, stage_id), []).extend(results)
+    return {key: summarize(results) for key, results in collected.items()}
+
+
+def _fmt(distribution, key='p50'):
+    return '-' if distribution is None else str(distribution[key])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate battles headlessly to balance teams and stages')
+    parser.add_argument('--team', action='append', default=[],
+                        help='Comma-separated character ids; repeat for several teams (default: first 4 characters)')
+    parser.add_argument('--all-teams', type=int, metavar='SIZE', help='Every team of SIZE characters from the roster')
+    parser.add_argument('--stage', action='append', type=int, default=[], help='Stage id; repeat for several (default: all)')
+    parser.add_argument('--battles', type=int, default=500, help='Battles per team and stage')
+    parser.add_argument('--level', type=int, default=20)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='scripted')
+    parser.add_argument('--seed', default='0')
+    parser.add_argument('--workers', type=int, help='Pool size (default: CPU count)')
+    parser.add_argument('--max-rounds', type=int, default=MAX_ROUNDS)
+    parser.add_argument('--characters', default=CHARACTERS_FILE)
+    parser.add_argument('--json', metavar='PATH', help='Also write the full results as JSON')
+    args = parser.parse_args()
+
+    roster = Catalog(args.characters, MISSIONS_FILE, ELEMENTS_FILE).snapshot()
+    if args.all_teams:
+        teams = list(itertools.combinations(sorted(roster.characters_by_id), args.all_teams))
+    elif args.team:
+        teams = [tuple(int(char_id) for char_id in team.split(',')) for team in args.team]
+    else:
+        teams = [tuple(c['id'] for c in roster.characters[:4])]
+    unknown = {char_id for team in teams for char_id in team} - set(roster.characters_by_id)
+    if unknown:
+        parser.error(f'Unknown character ids: {sorted(unknown)}')
+    stages = args.stage or sorted(STAGE_CONFIGS)
+
+    started = time.perf_counter()
+    summaries = simulate(teams, stages, args.battles, args.level, args.policy, args.seed, args.workers,
+                         args.characters, args.max_rounds)
+    elapsed = time.perf_counter() - started
+
+    print(f'{"team":<16} {"stage":>5} {"win%":>7} {"rounds p50/p90":>15} {"dealt p50":>10} {"taken p50":>10}')
+    for (team_ids, stage_id), summary in sorted(summaries.items()):
+        rounds = summary['rounds_to_clear']
+        print(f'{",".join(map(str, team_ids)):<16} {stage_id:>5} {summary["win_rate"] * 100:>6.1f}% '
+              f'{_fmt(rounds) + "/" + _fmt(rounds, "p90"):>15} '
+              f'{_fmt(summary["damage_dealt"]):>10} {_fmt(summary["damage_taken"]):>10}')
+    total = sum(summary['battles'] for summary in summaries.values())
+    print(f'{total} battles in {elapsed:.1f}s ({total / elapsed:.0f}/s)')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([{'team': list(team_ids), 'stage': stage_id, 'level': args.level, 'policy': args.policy, **summary}
+                       for (team_ids, stage_id), summary in sorted(summaries.items())], f, indent=4)
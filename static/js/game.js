@@ -176,6 +176,100 @@ async function fetchCharacterData() {
     }
 }
 
+// Battle actions answer with a patch against the version we sent as known_version.
+// If our copy is not the patch's base we are out of sync and reload the full state.
+function applyUnitPatch(units, entry) {
+    if (!entry) return units;
+    const removed = new Set(entry.removed || []);
+    const result = units.filter(u => !removed.has(u.id));
+    (entry.changed || []).forEach(change => {
+        const unit = result.find(u => u.id === change.id);
+        if (!unit) {
+            result.push(change);
+            return;
+        }
+        (change._unset || []).forEach(key => delete unit[key]);
+        Object.entries(change).forEach(([key, value]) => {
+            if (key !== '_unset') unit[key] = value;
+        });
+    });
+    return result;
+}
+
+async function applyBattleResponse(data) {
+    if (!data.patch) {
+        gameState = data;
+        return;
+    }
+    const patch = data.patch;
+    if (gameState.version !== patch.base_version) {
+        const response = await fetch('/game_state');
+        gameState = await response.json();
+        return;
+    }
+    gameState.characters = applyUnitPatch(gameState.characters || [], patch.characters);
+    gameState.enemies = applyUnitPatch(gameState.enemies || [], patch.enemies);
+    Object.assign(gameState, patch.set || {});
+    (patch.unset || []).forEach(key => delete gameState[key]);
+    gameState.version = patch.version;
+}
+
+function battleRequest(body) {
+    // With the event stream open the server resolves the enemy phase in the background
+    // and streams it to us instead of blocking this request on it
+    const streaming = battleEvents !== null && battleEvents.readyState === EventSource.OPEN;
+    return {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...body, known_version: gameState.version, stream_enemy_phase: streaming })
+    };
+}
+
+// --- Enemy phase event stream ---
+let battleEvents = null;
+let enemyPhaseFallbackTimer = null;
+
+function connectBattleEvents() {
+    if (typeof EventSource === 'undefined') return;
+    battleEvents = new EventSource('/battle/events');
+    battleEvents.addEventListener('enemy_action', (event) => {
+        const action = JSON.parse(event.data);
+        animateEnemyAction(action);
+        // Move the enemy right away so the board follows the animation
+        if (action.type === 'move' && action.path.length) {
+            const enemy = gameState.enemies?.find(e => e.id === action.enemy_id);
+            const last = action.path[action.path.length - 1];
+            if (enemy) {
+                enemy.x = last.x;
+                enemy.y = last.y;
+            }
+        }
+        draw();
+    });
+    battleEvents.addEventListener('battle_state', (event) => {
+        clearTimeout(enemyPhaseFallbackTimer);
+        gameState = JSON.parse(event.data);
+        delete gameState.enemy_actions;  // Already animated as they streamed in
+        resetSelection();
+    });
+}
+
+function watchEnemyPhase() {
+    // If the stream is served by another worker we never hear back; poll instead
+    if (gameState.turn !== 'enemy') return;
+    clearTimeout(enemyPhaseFallbackTimer);
+    enemyPhaseFallbackTimer = setTimeout(async () => {
+        if (gameState.turn !== 'enemy') return;
+        const response = await fetch('/game_state');
+        if (response.ok) {
+            gameState = await response.json();
+            processEnemyActions();
+            resetSelection();
+        }
+        watchEnemyPhase();
+    }, 3000);
+}
+
 function showMissionCompleteDialog(rewards) {
     // Update XP display
     document.getElementById('xp-amount').textContent = `+${rewards.xp}`;
@@ -213,6 +307,15 @@ function drawGrid() {
             ctx.strokeRect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE);
         }
     }
+    // Walls block movement for both sides
+    ctx.fillStyle = '#555';
+    (gameState.walls || []).forEach(wall => {
+        ctx.fillRect(wall.x * TILE_SIZE, wall.y * TILE_SIZE, TILE_SIZE, TILE_SIZE);
+    });
+}
+
+function isWall(x, y) {
+    return (gameState.walls || []).some(wall => wall.x === x && wall.y === y);
 }
 
 function drawHighlights() {
@@ -531,12 +634,13 @@ function updateTeamSPDisplay() {
 
 // --- Event Handlers ---
 endTurnBtn.addEventListener('click', async () => {
+    if (gameState.turn === 'enemy') return;
     
     hideActionWheel();
     const prevChars = gameState.characters ? gameState.characters.map(c => ({ id: c.id, x: c.x, y: c.y, hp: c.hp })) : [];
-    const response = await fetch('/end_turn', { method: 'POST' });
+    const response = await fetch('/end_turn', battleRequest({}));
     if (response.ok) {
-        gameState = await response.json();
+        await applyBattleResponse(await response.json());
         // Detect damage and spawn particles
         if (prevChars.length) {
             gameState.characters.forEach(newChar => {
@@ -549,6 +653,7 @@ endTurnBtn.addEventListener('click', async () => {
             });
         }
         processEnemyActions();
+        watchEnemyPhase();
         resetSelection();
         draw();
     } else {
@@ -647,13 +752,14 @@ ultimateAttackBtn.addEventListener('mouseleave', () => {
 });
 
 async function handleEndTurnForCharacter() {
-    if (!selectedCharacter) return;
+    if (!selectedCharacter || gameState.turn === 'enemy') return;
     
     // Mark character as having acted and advance turn
-    const response = await fetch('/end_turn', { method: 'POST' });
+    const response = await fetch('/end_turn', battleRequest({}));
     if (response.ok) {
-        gameState = await response.json();
+        await applyBattleResponse(await response.json());
         processEnemyActions();
+        watchEnemyPhase();
         resetSelection();
         draw();
     } else {
@@ -888,7 +994,7 @@ function hideActionWheel() {
 function selectCharacter(char, mouseEvent) {
     selectedCharacter = char;
     isAttackMode = null;
-    walkableRange = calculateRange(char, char.move_range);
+    walkableRange = calculateRange(char, char.move_range).filter(tile => !isWall(tile.x, tile.y));
     attackableRange = [];
     
     // Don't automatically show action wheel - it will show on hover
@@ -923,6 +1029,7 @@ function calculateRange(unit, range) {
 }
 
 async function move(characterId, x, y) {
+    if (gameState.turn === 'enemy') return;
     const char = gameState.characters.find(c => c.id === characterId);
     if (char) {
         const startX = char.x * TILE_SIZE + TILE_SIZE / 2;
@@ -934,15 +1041,12 @@ async function move(characterId, x, y) {
         spawnTrail(startX, startY, endX, endY, 'green', 0.5, 3);
     }
     
-    const response = await fetch('/move', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ character_id: characterId, x, y })
-    });
+    const response = await fetch('/move', battleRequest({ character_id: characterId, x, y }));
     
     if (response.ok) {
-        gameState = await response.json();
+        await applyBattleResponse(await response.json());
         processEnemyActions();
+        watchEnemyPhase();
         resetSelection();
     } else {
         const error = await response.json();
@@ -952,7 +1056,7 @@ async function move(characterId, x, y) {
 }
 
 async function attack(attackType, targetId, targetX, targetY) {
-    if (!selectedCharacter) return;
+    if (!selectedCharacter || gameState.turn === 'enemy') return;
     
     // Get character template data for attack type
     const charData = characterData[selectedCharacter.id];
@@ -1055,20 +1159,17 @@ async function attack(attackType, targetId, targetX, targetY) {
         spawnParticles(spawnX, spawnY, color, 20);
     }
     
-    const response = await fetch('/attack', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(requestData)
-    });
+    const response = await fetch('/attack', battleRequest(requestData));
     
     if (response.ok) {
-        gameState = await response.json();
+        await applyBattleResponse(await response.json());
         
         if (gameState.mission_complete && gameState.rewards) {
             showMissionCompleteDialog(gameState.rewards);
         }
         
         processEnemyActions();
+        watchEnemyPhase();
         resetSelection();
     } else {
         const error = await response.json();
@@ -1079,34 +1180,37 @@ async function attack(attackType, targetId, targetX, targetY) {
 
 function processEnemyActions() {
     if (!gameState.enemy_actions) return;
-    gameState.enemy_actions.forEach(action => {
-        if (action.type === 'move') {
-            let start = action.from;
-            let sx = start.x * TILE_SIZE + TILE_SIZE / 2;
-            let sy = start.y * TILE_SIZE + TILE_SIZE / 2;
-            action.path.forEach(step => {
-                let ex = step.x * TILE_SIZE + TILE_SIZE / 2;
-                let ey = step.y * TILE_SIZE + TILE_SIZE / 2;
-                spawnTrail(sx, sy, ex, ey, 'yellow', 0.6, 4);
-                spawnParticles(ex, ey, 'orange', 8);
-                sx = ex; sy = ey;
-            });
-        } else if (action.type === 'attack') {
-            let pos = action.target_pos;
-            let cx = pos.x * TILE_SIZE + TILE_SIZE / 2;
-            let cy = pos.y * TILE_SIZE + TILE_SIZE / 2;
-            spawnParticles(cx, cy, 'red', 20);
-        }
-    });
+    gameState.enemy_actions.forEach(animateEnemyAction);
     delete gameState.enemy_actions;
 }
 
+function animateEnemyAction(action) {
+    if (action.type === 'move') {
+        let start = action.from;
+        let sx = start.x * TILE_SIZE + TILE_SIZE / 2;
+        let sy = start.y * TILE_SIZE + TILE_SIZE / 2;
+        action.path.forEach(step => {
+            let ex = step.x * TILE_SIZE + TILE_SIZE / 2;
+            let ey = step.y * TILE_SIZE + TILE_SIZE / 2;
+            spawnTrail(sx, sy, ex, ey, 'yellow', 0.6, 4);
+            spawnParticles(ex, ey, 'orange', 8);
+            sx = ex; sy = ey;
+        });
+    } else if (action.type === 'attack') {
+        let pos = action.target_pos;
+        let cx = pos.x * TILE_SIZE + TILE_SIZE / 2;
+        let cy = pos.y * TILE_SIZE + TILE_SIZE / 2;
+        spawnParticles(cx, cy, 'red', 20);
+    }
+}
+
 // --- Initial Load ---
 window.onload = () => {
     currentUserId = localStorage.getItem('user_id');
     if (currentUserId) {
         fetchCharacterData(); // Load character data for tooltips
         fetchGameState();
+        connectBattleEvents();
     } else {
         window.location.href = '/login_page';
     }
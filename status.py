@@ -0,0 +1,241 @@
+"""Status effects as registered handlers, scheduled per battle.
+
+A unit's effects stay in its status_effects dict of {name: rounds left},
+which is what is stored and sent to the client. Each effect name maps to an
+Effect handler: tick effects (regeneration, burn, poison, chaos) act at the
+end of every round, the others change damage or turns while they last.
+Names without a handler simply count down.
+
+A battle's StatusSchedule indexes only the units that have effects.
+Expirations sit in a min-heap keyed by the round they run out, tick effects
+in one list, and each unit's combined damage and turn modifiers are worked
+out once when its effects change, so the damage path reads fields instead
+of probing effect names on every hit.
+"""
+
+import heapq
+import itertools
+
+from grid import SIDES
+
+
+class Effect:
+    """A status effect that only counts down; subclasses add behaviour"""
+
+    ticks = False
+    sides = SIDES  # The sides on which the effect ticks
+    damage_multiplier = 1  # Applied to damage the unit deals
+    guard = None  # (multiplier, absorbed) applied to damage the unit takes
+    guard_priority = 0  # Lower wins when a unit has several guards
+    skips_turn = False
+
+    def __init__(self, name):
+        self.name = name
+
+    def tick(self, unit, rng):
+        """End-of-round action; returns the name of an effect to grant the unit, or None"""
+        return None
+
+
+class Regeneration(Effect):
+    ticks = True
+    sides = ('characters',)
+
+    def __init__(self, name, amount):
+        super().__init__(name)
+        self.amount = amount
+
+    def tick(self, unit, rng):
+        unit.hp = min(unit.max_hp, unit.hp + self.amount)
+
+
+class DamageOverTime(Effect):
+    ticks = True
+    sides = ('enemies',)
+
+    def __init__(self, name, damage):
+        super().__init__(name)
+        self.damage = damage
+
+    def tick(self, unit, rng):
+        unit.hp -= self.damage
+
+
+class Chaos(Effect):
+    """Grants a random effect for the next round, every round"""
+
+    ticks = True
+    sides = ('enemies',)
+
+    def __init__(self, name, choices):
+        super().__init__(name)
+        self.choices = choices
+
+    def tick(self, unit, rng):
+        return rng.choice(self.choices)
+
+
+class Modifier(Effect):
+    def __init__(self, name, damage_multiplier=1, guard=None, guard_priority=0, skips_turn=False):
+        super().__init__(name)
+        self.damage_multiplier = damage_multiplier
+        self.guard = guard
+        self.guard_priority = guard_priority
+        self.skips_turn = skips_turn
+
+
+EFFECTS = {}
+
+
+def register(effect):
+    EFFECTS[effect.name] = effect
+    return effect
+
+
+def effect_handler(name):
+    effect = EFFECTS.get(name)
+    return effect if effect is not None else Effect(name)
+
+
+register(Regeneration('regeneration', 15))
+register(DamageOverTime('burn', 10))
+register(DamageOverTime('poison', 8))
+register(Chaos('chaos', ('burn', 'poison', 'vulnerability')))
+register(Modifier('adrenaline', damage_multiplier=2))
+# Only the highest priority guard applies: vulnerability, then blessed, immunity, divine shield
+register(Modifier('vulnerability', guard=(1.5, 0), guard_priority=0))
+register(Modifier('blessed', guard=(0.5, 0), guard_priority=1))
+register(Modifier('immunity', guard=(0, 0), guard_priority=2))
+register(Modifier('divine_shield', guard=(1, 50), guard_priority=3))
+register(Modifier('frozen', skips_turn=True))
+
+
+class Modifiers:
+    """The combined effect of a unit's statuses on damage and turns"""
+
+    __slots__ = ('damage_multiplier', 'guard', 'skips_turn')
+
+    def __init__(self, names=()):
+        effects = [effect_handler(name) for name in names]
+        self.damage_multiplier = 1
+        for effect in effects:
+            self.damage_multiplier *= effect.damage_multiplier
+        guards = [effect for effect in effects if effect.guard is not None]
+        self.guard = min(guards, key=lambda effect: effect.guard_priority).guard if guards else None
+        self.skips_turn = any(effect.skips_turn for effect in effects)
+
+
+NO_MODIFIERS = Modifiers()
+
+
+def unit_modifiers(unit):
+    return Modifiers(unit.status_effects) if unit.status_effects else NO_MODIFIERS
+
+
+def modified_damage(base_damage, attacker, defender):
+    """Damage after the attacker's and defender's Modifiers"""
+    damage = base_damage * attacker.damage_multiplier
+    if defender.guard is not None:
+        multiplier, absorbed = defender.guard
+        damage = int(damage * multiplier) - absorbed
+    return max(0, int(damage))
+
+
+class StatusSchedule:
+    """The status effects of one battle's units, indexed for the end-of-round pass.
+
+    Built from the battle JSON when first needed and kept with its Battle,
+    which BattleLog holds between requests, so each end_round() only visits
+    the units that have effects. After that effects must be added through
+    apply() so that the schedule sees them.
+    """
+
+    def __init__(self, battle):
+        self._battle = battle
+        self.round = 0
+        self._expiries = []  # heap of (round, seq, (side, unit_id, name))
+        self._expires_at = {}  # (side, unit_id, name) -> round the effect runs out
+        self._ticking = {}  # (side, unit_id, name) -> Effect
+        self._tick_order = []
+        self._units = {}  # (side, unit_id) -> unit with effects
+        self._modifiers = {}  # (side, unit_id) -> Modifiers
+        self._seq = itertools.count()
+        for side in SIDES:
+            for unit in battle.registry(side):
+                for name, rounds in unit.status_effects.items():
+                    self._schedule(side, unit, name, rounds)
+
+    def apply(self, side, unit, name, rounds):
+        """Give a unit an effect for `rounds` end-of-round passes, replacing any it has"""
+        unit.status_effects[name] = rounds
+        self._schedule(side, unit, name, rounds)
+        self._modifiers.pop((side, unit.id), None)
+
+    def modifiers(self, side, unit):
+        key = (side, unit.id)
+        modifiers = self._modifiers.get(key)
+        if modifiers is None:
+            modifiers = self._modifiers[key] = unit_modifiers(unit)
+        return modifiers
+
+    def end_round(self, rng):
+        """Tick, count down and expire effects; enemies the ticks defeat leave at the end of the step"""
+        battle = self._battle
+        self.round += 1
+        for (side, unit_id), unit in list(self._units.items()):
+            if not battle.registry(side).alive(unit):
+                self._forget(side, unit_id)
+
+        # Ticks run in a fixed order so that chaos draws from the rng the same way however the schedule was built
+        grants = []
+        for key in self._tick_order:
+            side, unit_id, _ = key
+            unit = self._units[(side, unit_id)]
+            granted = self._ticking[key].tick(unit, rng)
+            if granted is not None:
+                grants.append((side, unit, granted))
+            if side == 'enemies' and unit.hp <= 0:
+                battle.enemies.kill(unit)
+
+        while self._expiries and self._expiries[0][0] <= self.round:
+            expires, _, key = heapq.heappop(self._expiries)
+            if self._expires_at.get(key) != expires:
+                continue  # Replaced by a later apply(), or the unit is gone
+            side, unit_id, name = key
+            del self._expires_at[key]
+            del self._units[(side, unit_id)].status_effects[name]
+            self._modifiers.pop((side, unit_id), None)
+            if self._ticking.pop(key, None) is not None:
+                self._tick_order.remove(key)
+        for (side, unit_id, name), expires in self._expires_at.items():
+            self._units[(side, unit_id)].status_effects[name] = expires - self.round
+
+        # A granted effect lasts through the next round's tick; it never shortens one the unit already has
+        for side, unit, name in grants:
+            if name not in unit.status_effects:
+                self.apply(side, unit, name, 1)
+        battle.end_step()
+
+    def _schedule(self, side, unit, name, rounds):
+        key = (side, unit.id, name)
+        expires = self.round + rounds
+        self._expires_at[key] = expires
+        heapq.heappush(self._expiries, (expires, next(self._seq), key))
+        self._units[(side, unit.id)] = unit
+        effect = effect_handler(name)
+        if effect.ticks and side in effect.sides and key not in self._ticking:
+            self._ticking[key] = effect
+            self._tick_order = sorted(self._ticking, key=_tick_key)
+
+    def _forget(self, side, unit_id):
+        del self._units[(side, unit_id)]
+        self._modifiers.pop((side, unit_id), None)
+        for key in [key for key in self._expires_at if key[0] == side and key[1] == unit_id]:
+            del self._expires_at[key]
+            if self._ticking.pop(key, None) is not None:
+                self._tick_order.remove(key)
+
+
+def _tick_key(key):
+    side, unit_id, name = key
+    return SIDES.index(side), str(unit_id), name
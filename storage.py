@@ -0,0 +1,749 @@
+import argparse
+import atexit
+import copy
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from metrics import STORE_OPERATIONS, STORE_READ_BYTES, STORE_WRITTEN_BYTES
+from progression import apply_character_xp
+
+ACCOUNTS_FILE = 'accounts.json'
+JOURNAL_FILE = 'accounts.journal'
+ACCOUNTS_DB = 'accounts.db'
+
+FLUSH_INTERVAL = 1.0      # Seconds between background journal flushes
+FLUSH_RECORDS = 64        # Flush early once this many records are pending
+COMPACT_RECORDS = 5000    # Fold the journal into a new snapshot after this many records
+
+
+class StaleStateError(Exception):
+    """Raised when a battle write is based on a version that is no longer current"""
+
+    def __init__(self, user_id, expected_version, current_version):
+        super().__init__(f'Battle state for user {user_id} is at version {current_version}, not {expected_version}')
+        self.user_id = user_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+def _encode(record):
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+class JsonAccountStore:
+    """Resident account store: accounts.json is loaded once and kept in memory.
+
+    Every mutation is appended to a write-behind journal as a small record
+    holding only the touched user or battle, so the cost of a write is the size
+    of one player's state. The journal is flushed on a timer or after
+    FLUSH_RECORDS records, folded back into the snapshot in the background once
+    it grows past COMPACT_RECORDS, and replayed on top of the snapshot at start.
+    A stored user or battle record is replaced on each write, never changed in
+    place, so a compaction can serialize its copy of the maps without the lock.
+    """
+
+    def __init__(self, snapshot_path=ACCOUNTS_FILE, journal_path=JOURNAL_FILE,
+                 flush_interval=FLUSH_INTERVAL, flush_records=FLUSH_RECORDS,
+                 compact_records=COMPACT_RECORDS):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = Path(journal_path)
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.compact_records = compact_records
+
+        self._lock = threading.RLock()
+        self._pending = []
+        self._journal_records = 0
+        self._compacting = False
+        self._closed = False
+
+        self._data = self._load_snapshot()
+        # id -> username index and the id counter are rebuilt from the snapshot
+        # here and kept current by _apply, including during journal replay
+        self._usernames_by_id = {udata['id']: username for username, udata in self._data['users'].items()}
+        if 'next_user_id' not in self._data:
+            self._data['next_user_id'] = max([int(uid) for uid in self._usernames_by_id] or [0]) + 1
+        # A journal left behind by an interrupted compaction is replayed first and
+        # folded into the snapshot straight away; records are whole-value writes,
+        # so replaying one that already reached the snapshot is harmless.
+        if self._replay(self._rotated_path()):
+            self._write_snapshot(json.dumps(self._data, indent=4))
+        self._rotated_path().unlink(missing_ok=True)
+        self._journal_records = self._replay(self.journal_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+        self._wakeup = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='account-journal', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # --- Loading ---
+
+    def _load_snapshot(self):
+        if not self.snapshot_path.exists():
+            self.snapshot_path.write_text(json.dumps({"users": {}, "player_states": {}}))
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        STORE_OPERATIONS.inc('json', 'load_snapshot')
+        STORE_READ_BYTES.inc('json', 'snapshot', amount=len(text))
+        data = json.loads(text)
+        data.setdefault('users', {})
+        data.setdefault('player_states', {})
+        return data
+
+    def _rotated_path(self):
+        return self.journal_path.with_name(self.journal_path.name + '.compacting')
+
+    def _replay(self, path):
+        """Apply a journal's records; returns how many were applied.
+
+        A torn final line from a crash mid-write is cut off the file, so that
+        records appended after restart do not land on the fragment.
+        """
+        if not path.exists():
+            return 0
+        count = 0
+        read = 0
+        good = 0  # Byte offset just past the last intact record
+        torn = False
+        with open(path, 'rb') as f:
+            for line in f:
+                read += len(line)
+                if not line.endswith(b'\n'):
+                    # Every record is written with its newline, so an unterminated line is torn
+                    torn = True
+                    break
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        torn = True
+                        break
+                    self._apply(record)
+                    count += 1
+                good += len(line)
+        if torn:
+            with open(path, 'r+b') as f:
+                f.truncate(good)
+                f.flush()
+                os.fsync(f.fileno())
+        STORE_OPERATIONS.inc('json', 'replay_journal')
+        STORE_READ_BYTES.inc('json', 'journal', amount=read)
+        return count
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'set_user':
+            self._set_user(record['key'], record['value'])
+        elif op == 'set_state':
+            self._data['player_states'][record['key']] = record['value']
+        elif op == 'battle_action':
+            player_state = self._data['player_states'].get(record['key'])
+            if player_state is not None:
+                player_state.setdefault('log', []).append(record['action'])
+                player_state['version'] = record['version']
+        elif op == 'del_state':
+            self._data['player_states'].pop(record['key'], None)
+        elif op == 'commit_user':
+            self._set_user(record['key'], record['value'])
+            if record.get('del_state'):
+                self._data['player_states'].pop(record['del_state'], None)
+        elif op == 'commit_users':
+            for username, user_data in record['users']:
+                self._set_user(username, user_data)
+
+    # --- Journal ---
+
+    def _append(self, record):
+        """Queue a journal record; the caller must hold the lock"""
+        self._pending.append(_encode(record))
+        self._journal_records += 1
+        if len(self._pending) >= self.flush_records:
+            self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write pending journal records to disk and start a compaction if due"""
+        with self._lock:
+            if self._journal.closed:
+                return
+            self._write_pending()
+            if self._journal_records >= self.compact_records and not self._compacting and not self._closed:
+                self._compacting = True
+                threading.Thread(target=self.compact, name='account-compaction', daemon=True).start()
+
+    def compact(self):
+        """Fold the journal into a fresh accounts.json snapshot.
+
+        Only the record maps are copied under the lock; they are serialized
+        and written after it is released, while writes carry on.
+        """
+        try:
+            with self._lock:
+                self._write_pending()
+                data = {**self._data, 'users': dict(self._data['users']),
+                        'player_states': dict(self._data['player_states'])}
+                self._journal.close()
+                os.replace(self.journal_path, self._rotated_path())
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+                self._journal_records = 0
+
+            self._write_snapshot(json.dumps(data, indent=4))
+            self._rotated_path().unlink(missing_ok=True)
+        finally:
+            self._compacting = False
+
+    def _write_snapshot(self, text):
+        STORE_OPERATIONS.inc('json', 'write_snapshot')
+        STORE_WRITTEN_BYTES.inc('json', 'snapshot', amount=len(text))
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _write_pending(self):
+        """Write queued records to the journal; the caller must hold the lock"""
+        if self._pending:
+            text = ''.join(self._pending)
+            STORE_OPERATIONS.inc('json', 'journal_flush')
+            STORE_WRITTEN_BYTES.inc('json', 'journal', amount=len(text))
+            self._journal.write(text)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending.clear()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        with self._lock:
+            self._write_pending()
+            self._journal.close()
+
+    # --- Users ---
+
+    def get_user(self, username):
+        return self._data['users'].get(username)
+
+    def find_user_by_id(self, user_id):
+        """Return (username, user record) for a user id, or (None, None)"""
+        username = self._usernames_by_id.get(user_id)
+        if username is None:
+            return None, None
+        return username, self._data['users'][username]
+
+    def create_user(self, username, password):
+        """Create a user with the next id from the counter; returns the id, or None if the name is taken"""
+        with self._lock:
+            if username in self._data['users']:
+                return None
+            user_id = str(self._data['next_user_id'])
+            self.save_user(username, {'id': user_id, 'password': password})
+            return user_id
+
+    def iter_users(self):
+        return iter(self._data['users'].items())
+
+    def iter_player_states(self):
+        return iter(self._data['player_states'].items())
+
+    def save_user(self, username, user_data):
+        with self._lock:
+            self._set_user(username, user_data)
+            self._append({'op': 'set_user', 'key': username, 'value': user_data})
+
+    def _set_user(self, username, user_data):
+        self._data['users'][username] = user_data
+        self._usernames_by_id[user_data['id']] = username
+        # The counter only moves forward, so ids are never handed out twice
+        self._data['next_user_id'] = max(self._data['next_user_id'], int(user_data['id']) + 1)
+
+    # --- Battle state ---
+
+    def get_player_state(self, user_id):
+        return self._data['player_states'].get(user_id)
+
+    def count_player_states(self):
+        return len(self._data['player_states'])
+
+    def save_player_state(self, user_id, player_state, expected_version=None):
+        """Store a battle snapshot and bump its version.
+
+        game_data becomes the snapshot at the new version and the action log is
+        cleared. When expected_version is given the write only goes through if
+        the stored battle is still at that version; otherwise StaleStateError
+        is raised.
+        """
+        with self._lock:
+            current = self._data['player_states'].get(user_id)
+            current_version = current.get('version', 0) if current else 0
+            if expected_version is not None and current_version != expected_version:
+                raise StaleStateError(user_id, expected_version, current_version)
+            player_state['version'] = current_version + 1
+            player_state['snapshot_version'] = player_state['version']
+            player_state['log'] = []
+            self._data['player_states'][user_id] = player_state
+            self._append({'op': 'set_state', 'key': user_id, 'value': player_state})
+
+    def append_battle_action(self, user_id, action, expected_version):
+        """Append one action to a battle's log and bump its version; returns the new version.
+
+        Only the action is journaled, not the battle. Raises StaleStateError
+        unless the battle is at expected_version.
+        """
+        with self._lock:
+            current = self._data['player_states'].get(user_id)
+            current_version = current.get('version', 0) if current else 0
+            if current is None or current_version != expected_version:
+                raise StaleStateError(user_id, expected_version, current_version)
+            # A new record rather than an in-place append, for compact() to serialize its copy unlocked
+            version = current_version + 1
+            self._data['player_states'][user_id] = {**current, 'log': current.get('log', []) + [action],
+                                                    'version': version}
+            self._append({'op': 'battle_action', 'key': user_id, 'action': action, 'version': version})
+            return version
+
+    def delete_player_state(self, user_id):
+        with self._lock:
+            if self._data['player_states'].pop(user_id, None) is not None:
+                self._append({'op': 'del_state', 'key': user_id})
+
+    def commit_user(self, username, user_data, delete_state_for=None):
+        """Write a user record and optionally drop a battle as a single journal record"""
+        with self._lock:
+            self._set_user(username, user_data)
+            record = {'op': 'commit_user', 'key': username, 'value': user_data}
+            if delete_state_for is not None:
+                self._data['player_states'].pop(delete_state_for, None)
+                record['del_state'] = delete_state_for
+            self._append(record)
+
+    def commit_users(self, users):
+        """Write many (username, user record) pairs as a single journal record"""
+        users = list(users)
+        if not users:
+            return
+        with self._lock:
+            for username, user_data in users:
+                self._set_user(username, user_data)
+            self._append({'op': 'commit_users', 'users': users})
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    total_xp INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS character_progress (
+    user_id TEXT NOT NULL REFERENCES users(id),
+    char_id TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    xp INTEGER NOT NULL,
+    PRIMARY KEY (user_id, char_id)
+);
+CREATE TABLE IF NOT EXISTS inventory (
+    user_id TEXT NOT NULL REFERENCES users(id),
+    material TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    PRIMARY KEY (user_id, material)
+);
+CREATE TABLE IF NOT EXISTS pity (
+    user_id TEXT NOT NULL REFERENCES users(id),
+    banner_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, banner_id)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS battles (
+    user_id TEXT PRIMARY KEY REFERENCES users(id),
+    current_stage INTEGER NOT NULL,
+    game_data TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    seed TEXT,
+    snapshot_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS battle_actions (
+    user_id TEXT NOT NULL REFERENCES users(id),
+    version INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    PRIMARY KEY (user_id, version)
+);
+"""
+
+
+class SqliteAccountStore:
+    """Account store backed by SQLite in WAL mode with one row set per user.
+
+    Users, character progress, inventory counters and the active battle live in
+    separate tables keyed by user id, so a battle action rewrites a single row in
+    one short transaction and different players never contend on the same data.
+    Records are returned as fresh dicts in the same shape the JSON store uses.
+    """
+
+    def __init__(self, db_path=ACCOUNTS_DB):
+        self.db_path = str(db_path)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) "
+                "SELECT 'next_user_id', COALESCE(MAX(CAST(id AS INTEGER)), 0) + 1 FROM users")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly in _transaction
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Users ---
+
+    def _user_record(self, conn, row):
+        user_id, password, total_xp = row
+        STORE_OPERATIONS.inc('sqlite', 'load_user')
+        user_data = {'id': user_id, 'password': password, 'total_xp': total_xp}
+        user_data['player_characters'] = {
+            char_id: {'level': level, 'xp': xp}
+            for char_id, level, xp in conn.execute(
+                'SELECT char_id, level, xp FROM character_progress WHERE user_id = ?', (user_id,))
+        }
+        user_data['inventory'] = dict(conn.execute(
+            'SELECT material, amount FROM inventory WHERE user_id = ?', (user_id,)))
+        pity = dict(conn.execute('SELECT banner_id, count FROM pity WHERE user_id = ?', (user_id,)))
+        if pity:
+            user_data['pity'] = pity
+        return user_data
+
+    def get_user(self, username):
+        conn = self._conn()
+        row = conn.execute('SELECT id, password, total_xp FROM users WHERE username = ?', (username,)).fetchone()
+        return self._user_record(conn, row) if row else None
+
+    def find_user_by_id(self, user_id):
+        """Return (username, user record) for a user id, or (None, None)"""
+        conn = self._conn()
+        row = conn.execute('SELECT username, id, password, total_xp FROM users WHERE id = ?', (user_id,)).fetchone()
+        if not row:
+            return None, None
+        return row[0], self._user_record(conn, row[1:])
+
+    def create_user(self, username, password):
+        """Create a user with the next id from the counter; returns the id, or None if the name is taken"""
+        with self._transaction() as conn:
+            if conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone():
+                return None
+            user_id = str(conn.execute("SELECT value FROM meta WHERE key = 'next_user_id'").fetchone()[0])
+            self._write_user(conn, username, {'id': user_id, 'password': password})
+            return user_id
+
+    def iter_users(self):
+        conn = self._conn()
+        for row in conn.execute('SELECT username, id, password, total_xp FROM users').fetchall():
+            yield row[0], self._user_record(conn, row[1:])
+
+    def save_user(self, username, user_data):
+        with self._transaction() as conn:
+            self._write_user(conn, username, user_data)
+
+    def _write_user(self, conn, username, user_data):
+        user_id = user_data['id']
+        STORE_OPERATIONS.inc('sqlite', 'save_user')
+        conn.execute(
+            'INSERT INTO users (id, username, password, total_xp) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET username = excluded.username, '
+            'password = excluded.password, total_xp = excluded.total_xp',
+            (user_id, username, user_data['password'], user_data.get('total_xp', 0)))
+        conn.execute(
+            "UPDATE meta SET value = MAX(value, ?) WHERE key = 'next_user_id'", (int(user_id) + 1,))
+        conn.executemany(
+            'INSERT INTO character_progress (user_id, char_id, level, xp) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(user_id, char_id) DO UPDATE SET level = excluded.level, xp = excluded.xp',
+            [(user_id, str(char_id), progress['level'], progress['xp'])
+             for char_id, progress in user_data.get('player_characters', {}).items()])
+        conn.executemany(
+            'INSERT INTO inventory (user_id, material, amount) VALUES (?, ?, ?) '
+            'ON CONFLICT(user_id, material) DO UPDATE SET amount = excluded.amount',
+            [(user_id, material, amount) for material, amount in user_data.get('inventory', {}).items()])
+        conn.executemany(
+            'INSERT INTO pity (user_id, banner_id, count) VALUES (?, ?, ?) '
+            'ON CONFLICT(user_id, banner_id) DO UPDATE SET count = excluded.count',
+            [(user_id, str(banner_id), count) for banner_id, count in user_data.get('pity', {}).items()])
+
+    # --- Battle state ---
+
+    def _player_state(self, conn, user_id, row):
+        current_stage, game_data, version, seed, snapshot_version = row
+        actions = [action for (action,) in conn.execute(
+            'SELECT action FROM battle_actions WHERE user_id = ? AND version > ? ORDER BY version',
+            (user_id, snapshot_version))]
+        STORE_OPERATIONS.inc('sqlite', 'load_battle')
+        STORE_READ_BYTES.inc('sqlite', 'battles', amount=len(game_data) + sum(map(len, actions)))
+        log = [json.loads(action) for action in actions]
+        return {'current_stage': current_stage, 'game_data': json.loads(game_data), 'version': version,
+                'seed': seed, 'snapshot_version': snapshot_version, 'log': log}
+
+    def get_player_state(self, user_id):
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT current_stage, game_data, version, seed, snapshot_version FROM battles WHERE user_id = ?',
+            (user_id,)).fetchone()
+        if not row:
+            return None
+        return self._player_state(conn, user_id, row)
+
+    def count_player_states(self):
+        return self._conn().execute('SELECT COUNT(*) FROM battles').fetchone()[0]
+
+    def iter_player_states(self):
+        conn = self._conn()
+        for row in conn.execute(
+                'SELECT user_id, current_stage, game_data, version, seed, snapshot_version FROM battles').fetchall():
+            yield row[0], self._player_state(conn, row[0], row[1:])
+
+    def save_player_state(self, user_id, player_state, expected_version=None):
+        """Store a battle snapshot and bump its version.
+
+        game_data becomes the snapshot at the new version and the logged
+        actions are dropped. When expected_version is given the row is only
+        updated if it is still at that version (a compare-and-set); otherwise
+        StaleStateError is raised.
+        """
+        game_data = json.dumps(player_state['game_data'], separators=(',', ':'))
+        STORE_OPERATIONS.inc('sqlite', 'save_battle')
+        STORE_WRITTEN_BYTES.inc('sqlite', 'battles', amount=len(game_data))
+        with self._transaction() as conn:
+            if expected_version is None:
+                conn.execute(
+                    'INSERT INTO battles (user_id, current_stage, game_data, version, seed, snapshot_version) '
+                    'VALUES (?, ?, ?, 1, ?, 1) '
+                    'ON CONFLICT(user_id) DO UPDATE SET current_stage = excluded.current_stage, '
+                    'game_data = excluded.game_data, version = battles.version + 1, seed = excluded.seed, '
+                    'snapshot_version = battles.version + 1',
+                    (user_id, player_state['current_stage'], game_data, player_state.get('seed')))
+                version = conn.execute('SELECT version FROM battles WHERE user_id = ?', (user_id,)).fetchone()[0]
+            else:
+                updated = conn.execute(
+                    'UPDATE battles SET current_stage = ?, game_data = ?, seed = ?, '
+                    'version = version + 1, snapshot_version = version + 1 '
+                    'WHERE user_id = ? AND version = ?',
+                    (player_state['current_stage'], game_data, player_state.get('seed'),
+                     user_id, expected_version)).rowcount
+                if not updated:
+                    row = conn.execute('SELECT version FROM battles WHERE user_id = ?', (user_id,)).fetchone()
+                    raise StaleStateError(user_id, expected_version, row[0] if row else 0)
+                version = expected_version + 1
+            conn.execute('DELETE FROM battle_actions WHERE user_id = ?', (user_id,))
+        player_state['version'] = player_state['snapshot_version'] = version
+        player_state['log'] = []
+
+    def append_battle_action(self, user_id, action, expected_version):
+        """Append one action to a battle's log and bump its version; returns the new version.
+
+        The battle row only has its version bumped; the action is one small
+        insert. Raises StaleStateError unless the battle is at expected_version.
+        """
+        version = expected_version + 1
+        encoded = json.dumps(action, separators=(',', ':'))
+        STORE_OPERATIONS.inc('sqlite', 'append_battle_action')
+        STORE_WRITTEN_BYTES.inc('sqlite', 'battle_actions', amount=len(encoded))
+        with self._transaction() as conn:
+            updated = conn.execute(
+                'UPDATE battles SET version = ? WHERE user_id = ? AND version = ?',
+                (version, user_id, expected_version)).rowcount
+            if not updated:
+                row = conn.execute('SELECT version FROM battles WHERE user_id = ?', (user_id,)).fetchone()
+                raise StaleStateError(user_id, expected_version, row[0] if row else 0)
+            conn.execute(
+                'INSERT OR REPLACE INTO battle_actions (user_id, version, action) VALUES (?, ?, ?)',
+                (user_id, version, encoded))
+        return version
+
+    def _write_player_state(self, conn, user_id, player_state):
+        version = player_state.get('version', 0)
+        log = player_state.get('log', [])
+        snapshot_version = player_state.get('snapshot_version', version - len(log))
+        conn.execute(
+            'INSERT INTO battles (user_id, current_stage, game_data, version, seed, snapshot_version) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(user_id) DO UPDATE SET current_stage = excluded.current_stage, '
+            'game_data = excluded.game_data, version = excluded.version, seed = excluded.seed, '
+            'snapshot_version = excluded.snapshot_version',
+            (user_id, player_state['current_stage'],
+             json.dumps(player_state['game_data'], separators=(',', ':')),
+             version, player_state.get('seed'), snapshot_version))
+        conn.execute('DELETE FROM battle_actions WHERE user_id = ?', (user_id,))
+        conn.executemany(
+            'INSERT INTO battle_actions (user_id, version, action) VALUES (?, ?, ?)',
+            [(user_id, snapshot_version + n, json.dumps(action, separators=(',', ':')))
+             for n, action in enumerate(log, start=1)])
+
+    def delete_player_state(self, user_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM battles WHERE user_id = ?', (user_id,))
+            conn.execute('DELETE FROM battle_actions WHERE user_id = ?', (user_id,))
+
+    def commit_user(self, username, user_data, delete_state_for=None):
+        """Write a user record and optionally drop a battle in one transaction"""
+        with self._transaction() as conn:
+            self._write_user(conn, username, user_data)
+            if delete_state_for is not None:
+                conn.execute('DELETE FROM battles WHERE user_id = ?', (delete_state_for,))
+                conn.execute('DELETE FROM battle_actions WHERE user_id = ?', (delete_state_for,))
+
+    def commit_users(self, users):
+        """Write many (username, user record) pairs in one transaction"""
+        with self._transaction() as conn:
+            for username, user_data in users:
+                self._write_user(conn, username, user_data)
+
+    def import_accounts(self, users, player_states):
+        """Bulk-load (username, record) and (user_id, state) pairs in one transaction"""
+        with self._transaction() as conn:
+            for username, user_data in users:
+                self._write_user(conn, username, user_data)
+            for user_id, player_state in player_states:
+                self._write_player_state(conn, user_id, player_state)
+
+
+class UserUnitOfWork:
+    """Batch changes to one user's progress and battle into a single store commit.
+
+    The user record is read once; XP, inventory and character progress are
+    applied to a private copy of it and written back by commit() together with
+    the optional removal of the active battle, so none of them can overwrite
+    another. Working on a copy keeps the resident JSON store's records whole
+    until the commit swaps the new one in under the store lock.
+    """
+
+    def __init__(self, store, user_id):
+        self.store = store
+        self.user_id = user_id
+        self.username, user = store.find_user_by_id(user_id)
+        self.user = copy.deepcopy(user)
+        self._delete_battle = False
+
+    def __bool__(self):
+        return self.user is not None
+
+    def add_total_xp(self, amount):
+        self.user['total_xp'] = self.user.get('total_xp', 0) + amount
+
+    def add_materials(self, materials):
+        inventory = self.user.setdefault('inventory', {})
+        for material_type, amount in materials.items():
+            inventory[material_type] = inventory.get(material_type, 0) + amount
+
+    def spend_materials(self, materials):
+        """Debit materials from the inventory; returns False, changing nothing, if any is short"""
+        inventory = self.user.setdefault('inventory', {})
+        if any(inventory.get(material_type, 0) < amount for material_type, amount in materials.items()):
+            return False
+        for material_type, amount in materials.items():
+            inventory[material_type] -= amount
+        return True
+
+    def banner_pity(self, banner_id):
+        return self.user.get('pity', {}).get(str(banner_id), 0)
+
+    def set_banner_pity(self, banner_id, pity):
+        self.user.setdefault('pity', {})[str(banner_id)] = pity
+
+    def has_character(self, char_id):
+        return str(char_id) in self.user.get('player_characters', {})
+
+    def character_progress(self, char_id):
+        """Return the mutable progress record for a character, starting at level 1"""
+        return self.user.setdefault('player_characters', {}).setdefault(str(char_id), {'level': 1, 'xp': 0})
+
+    def grant_character_xp(self, grants):
+        """Apply {char_id: xp_amount} to the user's characters; returns {char_id: levels gained}"""
+        return {char_id: apply_character_xp(self.character_progress(char_id), xp_amount)
+                for char_id, xp_amount in grants.items()}
+
+    def clear_battle(self):
+        self._delete_battle = True
+
+    def commit(self):
+        self.store.commit_user(self.username, self.user, self.user_id if self._delete_battle else None)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolling back if the block raises"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def open_account_store(backend='json', accounts_file=ACCOUNTS_FILE, journal_file=JOURNAL_FILE, db_path=ACCOUNTS_DB):
+    """Open the account store for a backend name ('json' for dev, 'sqlite' for deployments)"""
+    if backend == 'json':
+        return JsonAccountStore(accounts_file, journal_file)
+    if backend == 'sqlite':
+        return SqliteAccountStore(db_path)
+    raise ValueError(f'Unknown accounts backend: {backend}')
+
+
+def migrate_json_to_sqlite(accounts_file=ACCOUNTS_FILE, db_path=ACCOUNTS_DB, journal_file=JOURNAL_FILE):
+    """One-shot copy of accounts.json (plus any pending journal) into a SQLite database"""
+    source = JsonAccountStore(accounts_file, journal_file)
+    try:
+        target = SqliteAccountStore(db_path)
+        target.import_accounts(source.iter_users(), source.iter_player_states())
+        target.close()
+    finally:
+        source.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Account storage maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help='Copy accounts.json into a SQLite database')
+    migrate.add_argument('--accounts', default=ACCOUNTS_FILE)
+    migrate.add_argument('--journal', default=JOURNAL_FILE)
+    migrate.add_argument('--db', default=ACCOUNTS_DB)
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate_json_to_sqlite(args.accounts, args.db, args.journal)
+        print(f'Migrated {args.accounts} into {args.db}')
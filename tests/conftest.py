@@ -0,0 +1,22 @@
+import pytest
+
+import app as app_module
+import locking
+from battlelog import BattleLog
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A logged-in test client over a scratch JSON account store"""
+    monkeypatch.setattr(locking, 'LOCK_DIR', str(tmp_path / 'locks'))
+    monkeypatch.setattr(app_module, 'ACCOUNTS_BACKEND', 'json')
+    monkeypatch.setattr(app_module, 'ACCOUNTS_FILE', str(tmp_path / 'accounts.json'))
+    monkeypatch.setattr(app_module, 'ACCOUNTS_JOURNAL_FILE', str(tmp_path / 'accounts.journal'))
+    monkeypatch.setattr(app_module, '_account_store', None)
+    monkeypatch.setattr(app_module, 'battle_log', BattleLog(app_module.get_account_store))
+    client = app_module.app.test_client()
+    client.post('/register', json={'username': 'player', 'password': 'pw'})
+    client.post('/login', json={'username': 'player', 'password': 'pw'})
+    yield client
+    if app_module._account_store is not None:
+        app_module._account_store.close()
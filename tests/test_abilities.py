@@ -0,0 +1,230 @@
+import pytest
+
+import engine
+from battle import Battle
+from catalog import CatalogSnapshot
+from delta import capture
+
+TEMPLATE = {
+    'id': 10, 'name': 'tester', 'hp': 120, 'max_hp': 120, 'move_range': 3, 'element': 'electricity',
+    'basic_attack_range': 2, 'basic_attack_damage': 30, 'skill_attack_range': 3, 'skill_attack_damage': 25,
+    'ultimate_attack_range': 3, 'ultimate_attack_damage': 40, 'ultimate_energy_cost': 80,
+}
+
+# name: (template overrides, attack type, attack target)
+CASES = {
+    'single-basic': ({'basic_attack_type': 'single'}, 'basic', {'target_id': 2}),
+    'single-skill': ({'skill_attack_type': 'single'}, 'skill', {'target_id': 1}),
+    'single-out-of-range': ({'basic_attack_type': 'single'}, 'basic', {'target_id': 4}),
+    'area-skill': ({'skill_attack_type': 'area', 'skill_attack_area_range': 1},
+                   'skill', {'target_x': 6, 'target_y': 5}),
+    'area-without-target': ({'skill_attack_type': 'area'}, 'skill', {}),
+    'full-area-skill': ({'skill_attack_type': 'full-area'}, 'skill', {}),
+    'shield-break': ({'ultimate_attack_type': 'shield-break'}, 'ultimate', {}),
+    'shield-break-everywhere': ({'ultimate_attack_type': 'shield-break', 'ultimate_attack_range': 99},
+                                'ultimate', {}),
+    'all-enemies': ({'ultimate_attack_type': 'all-enemies', 'ultimate_status_effect': 'burn'}, 'ultimate', {}),
+    'debuff': ({'ultimate_attack_type': 'debuff', 'ultimate_status_effect': 'vulnerability'}, 'ultimate', {}),
+    'lifesteal-area': ({'ultimate_attack_type': 'lifesteal-area', 'ultimate_attack_area_range': 1,
+                        'ultimate_status_effect': 'poison'}, 'ultimate', {'target_x': 7, 'target_y': 5}),
+    'poison-area': ({'ultimate_attack_type': 'poison-area', 'ultimate_status_effect': 'poison'},
+                    'ultimate', {'target_x': 6, 'target_y': 5}),
+    'chaos-area': ({'ultimate_attack_type': 'chaos-area', 'ultimate_status_effect': 'chaos'},
+                   'ultimate', {'target_x': 6, 'target_y': 5}),
+    'buff': ({'ultimate_attack_type': 'buff', 'ultimate_status_effect': 'adrenaline'}, 'ultimate', {}),
+    'heal-single': ({'skill_attack_type': 'healing', 'skill_attack_pattern': 'single'}, 'skill', {'target_id': 2}),
+    'heal-self': ({'skill_attack_type': 'healing', 'skill_attack_pattern': 'single'}, 'skill', {}),
+    'heal-invalid-target': ({'skill_attack_type': 'healing', 'skill_attack_pattern': 'single'},
+                            'skill', {'target_id': 9}),
+    'heal-area': ({'skill_attack_type': 'healing', 'skill_attack_pattern': 'area', 'skill_attack_area_range': 1},
+                  'skill', {'target_x': 5, 'target_y': 4}),
+    'mass-heal-team-wide': ({'ultimate_attack_type': 'mass-heal', 'ultimate_attack_pattern': 'team-wide',
+                             'ultimate_status_effect': 'regeneration'}, 'ultimate', {}),
+    'buff-heal-full-area': ({'ultimate_attack_type': 'buff-heal', 'ultimate_attack_pattern': 'full-area',
+                             'ultimate_status_effect': 'blessed'}, 'ultimate', {}),
+    'revive-heal-team-wide': ({'ultimate_attack_type': 'revive-heal', 'ultimate_attack_pattern': 'team-wide'},
+                              'ultimate', {}),
+    'berserker-skill': ({'id': 5, 'skill_attack_type': 'single'}, 'skill', {'target_id': 1}),
+    'unknown-pattern': ({'skill_attack_type': 'mystery'}, 'skill', {}),
+}
+
+# Recorded by posting each case to /attack before abilities were compiled, when the
+# patterns were resolved by one if/elif chain in the route.
+# characters: {id: [hp, energy, status_effects]}, enemies: {id: [hp, shield_hp, status_effects]}
+EXPECTED = {
+    'single-basic': {
+        'team_sp': 3,
+        'characters': {1: [60, 100, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [80, 0, {}], 2: [77, 0, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'single-skill': {
+        'team_sp': 1,
+        'characters': {1: [60, 100, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [55, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'single-out-of-range': {'error': 'Target is out of range'},
+    'area-skill': {
+        'team_sp': 1,
+        'characters': {1: [60, 100, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [55, 0, {}], 2: [78, 5, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'area-without-target': {'error': 'No target coordinates specified'},
+    'full-area-skill': {
+        'team_sp': 1,
+        'characters': {1: [60, 100, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [55, 0, {}], 2: [78, 5, {}], 3: [38, 20, {}], 4: [15, 0, {}]},
+    },
+    'shield-break': {
+        'team_sp': 2,
+        'characters': {1: [60, 32, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [40, 0, {}], 2: [40, 0, {}], 4: [15, 0, {}]},
+    },
+    'shield-break-everywhere': {
+        'team_sp': 2,
+        'characters': {1: [60, 28, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [40, 0, {}], 2: [40, 0, {}]},
+    },
+    'all-enemies': {
+        'team_sp': 2,
+        'characters': {1: [60, 32, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [40, 0, {'burn': 3}], 2: [76, 0, {'burn': 3}], 3: [36, 20, {'burn': 3}]},
+    },
+    'debuff': {
+        'team_sp': 2,
+        'characters': {1: [60, 20, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {
+            1: [80, 0, {'vulnerability': 2}],
+            2: [80, 30, {'vulnerability': 2}],
+            3: [40, 20, {'vulnerability': 2}],
+            4: [15, 0, {'vulnerability': 2}],
+        },
+    },
+    'lifesteal-area': {
+        'team_sp': 2,
+        'characters': {1: [71, 28, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [40, 0, {'poison': 4}], 2: [76, 0, {'poison': 4}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'poison-area': {
+        'team_sp': 2,
+        'characters': {1: [60, 28, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [40, 0, {'poison': 4}], 2: [76, 0, {'poison': 4}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'chaos-area': {
+        'team_sp': 2,
+        'characters': {1: [60, 28, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [40, 0, {'chaos': 4}], 2: [40, 0, {'chaos': 4}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'buff': {
+        'team_sp': 2,
+        'characters': {
+            1: [60, 20, {'adrenaline': 3}],
+            2: [30, 0, {'adrenaline': 3, 'burn': 1}],
+            3: [10, 0, {'adrenaline': 3}],
+        },
+        'enemies': {1: [80, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'heal-single': {
+        'team_sp': 1,
+        'characters': {1: [60, 100, {}], 2: [55, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [80, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'heal-self': {
+        'team_sp': 1,
+        'characters': {1: [85, 100, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [80, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'heal-invalid-target': {'error': 'Invalid healing target'},
+    'heal-area': {
+        'team_sp': 1,
+        'characters': {1: [85, 100, {}], 2: [55, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [80, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'mass-heal-team-wide': {
+        'team_sp': 2,
+        'characters': {
+            1: [100, 20, {'regeneration': 3}],
+            2: [70, 0, {'burn': 1, 'regeneration': 3}],
+            3: [50, 0, {'regeneration': 3}],
+        },
+        'enemies': {1: [80, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'buff-heal-full-area': {
+        'team_sp': 2,
+        'characters': {1: [60, 20, {}], 2: [70, 0, {'blessed': 3, 'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [80, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'revive-heal-team-wide': {
+        'team_sp': 2,
+        'characters': {1: [120, 20, {}], 2: [100, 0, {'burn': 1}], 3: [90, 0, {}]},
+        'enemies': {1: [80, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'berserker-skill': {
+        'team_sp': 1,
+        'characters': {1: [50, 100, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [55, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+    'unknown-pattern': {
+        'team_sp': 1,
+        'characters': {1: [60, 100, {}], 2: [30, 0, {'burn': 1}], 3: [10, 0, {}]},
+        'enemies': {1: [80, 0, {}], 2: [80, 30, {}], 3: [40, 20, {}], 4: [15, 0, {}]},
+    },
+}
+
+
+def case_template(name):
+    overrides, _, _ = CASES[name]
+    return {**TEMPLATE, **overrides}
+
+
+def case_state(name):
+    template = case_template(name)
+    character = {'move_range': 3, 'has_acted': False, 'max_energy': 100, 'element': 'electricity',
+                 'attack_range': 2, 'skill_attack_range': 3, 'damage': 30, 'skill_damage': 25, 'level': 20}
+    enemy = {'attack_range': 1, 'move_range': 2, 'damage': 10}
+    return {
+        'grid_size': {'width': 15, 'height': 15},
+        'team_sp': 2,
+        'max_team_sp': 5,
+        'turn': 'player',
+        'active_character_id': 1,
+        'characters': [
+            {**character, 'id': 1, 'char_id': template['id'], 'name': 'tester', 'x': 5, 'y': 5,
+             'hp': 60, 'max_hp': 120, 'energy': 100, 'status_effects': {}},
+            {**character, 'id': 2, 'char_id': 2, 'name': 'near', 'x': 5, 'y': 4,
+             'hp': 30, 'max_hp': 100, 'energy': 0, 'status_effects': {'burn': 1}},
+            {**character, 'id': 3, 'char_id': 3, 'name': 'far', 'x': 9, 'y': 9,
+             'hp': 10, 'max_hp': 90, 'energy': 0, 'status_effects': {}},
+        ],
+        'enemies': [
+            {**enemy, 'id': 1, 'x': 6, 'y': 5, 'status_effects': {}, 'hp': 80, 'max_hp': 80, 'element': 'water',
+             'shield_hp': 0, 'max_shield_hp': 0, 'shield_weak_to': []},
+            {**enemy, 'id': 2, 'x': 7, 'y': 5, 'status_effects': {}, 'hp': 80, 'max_hp': 80, 'element': 'fire',
+             'shield_hp': 30, 'max_shield_hp': 30, 'shield_weak_to': ['electricity']},
+            {**enemy, 'id': 3, 'x': 5, 'y': 7, 'status_effects': {}, 'hp': 40, 'max_hp': 40, 'element': 'grass',
+             'shield_hp': 20, 'max_shield_hp': 20, 'shield_weak_to': ['ice']},
+            {**enemy, 'id': 4, 'x': 12, 'y': 12, 'status_effects': {}, 'hp': 15, 'max_hp': 15, 'element': 'moon',
+             'shield_hp': 0, 'max_shield_hp': 0, 'shield_weak_to': []},
+        ],
+    }
+
+
+def summarize(state):
+    return {
+        'team_sp': state['team_sp'],
+        'characters': {c['id']: [c['hp'], c['energy'], c['status_effects']] for c in state['characters']},
+        'enemies': {e['id']: [e['hp'], e['shield_hp'], e['status_effects']] for e in state['enemies']},
+    }
+
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_compiled_ability_matches_old_attack_chain(name):
+    _, attack_type, target = CASES[name]
+    catalog = CatalogSnapshot([case_template(name)], [], [], [], {})
+    battle = Battle(case_state(name))
+    try:
+        engine.attack(battle, catalog, 1, attack_type, **target)
+    except engine.ActionError as e:
+        result = {'error': str(e)}
+    else:
+        result = summarize(capture(battle.state))
+    assert result == EXPECTED[name]
@@ -0,0 +1,31 @@
+import random
+
+from battlelog import BattleLog
+from storage import JsonAccountStore
+
+
+def test_loaded_battle_keeps_its_status_schedule(tmp_path):
+    store = JsonAccountStore(tmp_path / 'accounts.json', tmp_path / 'accounts.journal', flush_interval=60)
+    battle_log = BattleLog(lambda: store)
+    try:
+        loaded = battle_log.start('1', 1, {
+            'turn': 'player',
+            'characters': [{'id': 'c1', 'x': 0, 'y': 0, 'hp': 50, 'max_hp': 100,
+                            'status_effects': {'regeneration': 3}}],
+            'enemies': [{'id': 'e1', 'x': 5, 'y': 5, 'hp': 30, 'status_effects': {'burn': 2}}],
+        })
+        battle = loaded['battle']
+        schedule = battle.status
+        schedule.end_round(random.Random(1))
+        battle_log.record('1', loaded, {'type': 'enemy_phase'})
+
+        reloaded = battle_log.load('1', None)
+        assert reloaded['battle'] is battle
+        assert reloaded['battle'].status is schedule
+        schedule.end_round(random.Random(2))
+        character, = battle.characters
+        enemy, = battle.enemies
+        assert character.hp == 80 and character.status_effects == {'regeneration': 1}
+        assert enemy.hp == 10 and enemy.status_effects == {}
+    finally:
+        store.close()
@@ -0,0 +1,58 @@
+import copy
+
+from delta import capture, diff_state
+
+
+def apply_patch(state, patch):
+    """What static/js/game.js does with a patch"""
+    assert state['version'] == patch['base_version']
+    state = copy.deepcopy(state)
+    for side in ('characters', 'enemies'):
+        entry = patch.get(side)
+        if not entry:
+            continue
+        removed = set(entry.get('removed', ()))
+        units = [unit for unit in state.get(side, []) if unit['id'] not in removed]
+        by_id = {unit['id']: unit for unit in units}
+        for change in entry.get('changed', ()):
+            unit = by_id.get(change['id'])
+            if unit is None:
+                units.append(change)
+                continue
+            for key in change.get('_unset', ()):
+                del unit[key]
+            unit.update({key: value for key, value in change.items() if key != '_unset'})
+        state[side] = units
+    state.update(patch.get('set', {}))
+    for key in patch.get('unset', ()):
+        del state[key]
+    state['version'] = patch['version']
+    return state
+
+
+def test_patch_rebuilds_removed_units_and_keys():
+    before = {'turn': 'player', 'enemy_actions': [], 'version': 3,
+              'characters': [{'id': 1, 'x': 0, 'y': 0, 'hp': 50, 'status_effects': {'blessed': 1}}],
+              'enemies': [{'id': 1, 'x': 4, 'y': 4, 'hp': 5}, {'id': 2, 'x': 6, 'y': 6, 'hp': 9}]}
+    after = {'turn': 'enemy', 'version': 4,
+             'characters': [{'id': 1, 'x': 1, 'y': 0, 'hp': 50}],
+             'enemies': [{'id': 2, 'x': 6, 'y': 5, 'hp': 9}, {'id': 3, 'x': 1, 'y': 1, 'hp': 20}]}
+    patch = diff_state(capture(before), after, 3, 4)
+    assert apply_patch(before, patch) == after
+
+
+def test_action_patches_match_the_full_state(client):
+    client.post('/select_stage', json={'stage_id': 1})
+    state = client.get('/game_state').get_json()
+    for turn in range(12):
+        active = state['active_character_id']
+        character = next(unit for unit in state['characters'] if unit['id'] == active)
+        if turn % 3 == 0:
+            response = client.post('/move', json={'character_id': active, 'x': character['x'] + 1,
+                                                  'y': character['y'], 'known_version': state['version']})
+        else:
+            response = client.post('/end_turn', json={'known_version': state['version']})
+        assert response.status_code == 200
+        patch = response.get_json()['patch']
+        state = apply_patch(state, patch)
+        assert state == client.get('/game_state').get_json()
@@ -0,0 +1,30 @@
+import random
+
+from gacha import Banner
+
+CHARACTERS = {'1': {}, '2': {}, '3': {}}
+
+
+def tiered_banner(pity_rarity, hard):
+    return Banner({
+        'id': 1,
+        'tiers': [
+            {'rarity': 5, 'rate': 1, 'pool': [{'id': '1'}]},
+            {'rarity': 4, 'rate': 10, 'pool': [{'id': '2'}]},
+            {'rarity': 3, 'rate': 89, 'pool': [{'id': '3'}]},
+        ],
+        'pity': {'rarity': pity_rarity, 'hard': hard},
+    }, CHARACTERS)
+
+
+def test_pity_counts_pulls_since_any_result_at_or_above_the_pity_rarity():
+    banner = tiered_banner(4, 10)
+    picks, pity = banner.pull(2000, 0, random.Random(1))
+
+    since = 0
+    for _, rarity in picks:
+        since = 0 if rarity >= 4 else since + 1
+        assert since < 10
+    assert pity == since
+    # The hard limit raises a pull to 4 stars, not to the top tier
+    assert sum(rarity == 5 for _, rarity in picks) < 100
@@ -0,0 +1,29 @@
+import os
+import threading
+
+import locking
+
+
+def test_user_locks_exclude_and_are_evicted_when_idle(tmp_path, monkeypatch):
+    monkeypatch.setattr(locking, 'LOCK_DIR', str(tmp_path / 'locks'))
+    inside = []
+    overlaps = []
+
+    def work(key):
+        for _ in range(50):
+            with locking.user_lock(key):
+                with locking.user_lock(key):  # Re-entrant
+                    inside.append(key)
+                    if inside.count(key) > 1:
+                        overlaps.append(key)
+                    inside.remove(key)
+
+    threads = [threading.Thread(target=work, args=(f'user-{i % 3}',)) for i in range(9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not overlaps
+    assert locking._locks == {}
+    assert os.listdir(tmp_path / 'locks') == []
@@ -0,0 +1,29 @@
+from progression import CUMULATIVE_XP, MAX_LEVEL, apply_character_xp, calculate_level_up_cost
+
+
+def level_up_one_at_a_time(char_data, xp_amount):
+    """The per-level loop that CUMULATIVE_XP replaced"""
+    char_data['xp'] += xp_amount
+    level_ups = 0
+    while char_data['level'] < MAX_LEVEL:
+        xp_needed = calculate_level_up_cost(char_data['level'])
+        if char_data['xp'] < xp_needed:
+            break
+        char_data['xp'] -= xp_needed
+        char_data['level'] += 1
+        level_ups += 1
+    return level_ups
+
+
+def test_table_lookup_matches_the_level_loop_at_boundaries():
+    for level in (1, 2, 19, 20, 21, 50, 98, 99, 100):
+        for xp in (0, 1, calculate_level_up_cost(level) - 1):
+            to_cap = CUMULATIVE_XP[MAX_LEVEL] - CUMULATIVE_XP[level] - xp
+            step = calculate_level_up_cost(level) - xp
+            for amount in {0, 1, step - 1, step, step + 1, 2 * step + 100, to_cap - 1, to_cap, to_cap + 500}:
+                if amount < 0:
+                    continue
+                expected = {'level': level, 'xp': xp}
+                actual = dict(expected)
+                assert apply_character_xp(actual, amount) == level_up_one_at_a_time(expected, amount)
+                assert actual == expected, (level, xp, amount)
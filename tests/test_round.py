@@ -0,0 +1,31 @@
+import copy
+
+import app as app_module
+
+
+def test_rejected_round_commits_nothing(client):
+    client.post('/select_stage', json={'stage_id': 1})
+    state = client.get('/game_state').get_json()
+    store = app_module.get_account_store()
+    user_id = str(store.get_user('player')['id'])
+    stored = copy.deepcopy(store.get_player_state(user_id))
+
+    active = state['active_character_id']
+    character = next(unit for unit in state['characters'] if unit['id'] == active)
+    response = client.post('/round', json={'actions': [
+        {'type': 'move', 'character_id': active, 'x': character['x'] + 1, 'y': character['y']},
+        {'type': 'end_turn'},
+        {'type': 'move', 'character_id': active, 'x': -1, 'y': -1},
+    ]})
+    assert response.status_code == 400
+
+    assert client.get('/game_state').get_json() == state
+    assert store.get_player_state(user_id) == stored
+
+    # The next round builds on the stored battle, not on the actions applied before the rejection
+    response = client.post('/round', json={'actions': [{'type': 'end_turn'}], 'known_version': state['version']})
+    assert response.status_code == 200
+    assert response.get_json()['results'] == [{'type': 'end_turn', 'status': 'ok',
+                                              'active_character_id': state['characters'][1]['id'],
+                                              'turn': 'player'}]
+    assert store.get_player_state(user_id)['version'] == stored['version'] + 1
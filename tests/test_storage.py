@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+import storage
+from storage import JsonAccountStore, SqliteAccountStore, UserUnitOfWork
+
+
+def open_store(tmp_path):
+    return JsonAccountStore(tmp_path / 'accounts.json', tmp_path / 'accounts.journal', flush_interval=60)
+
+
+def test_torn_journal_line_is_cut_before_new_writes(tmp_path):
+    store = open_store(tmp_path)
+    alice = store.create_user('alice', 'pw')
+    store.close()
+
+    # A crash part way through writing the next record
+    journal = tmp_path / 'accounts.journal'
+    with open(journal, 'a', encoding='utf-8') as f:
+        f.write('{"op":"set_user","key":"bob","value":{"id"')
+
+    store = open_store(tmp_path)
+    assert store.get_user('bob') is None
+    carol = store.create_user('carol', 'pw')
+    store.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert store.get_user('alice')['id'] == alice
+        assert store.get_user('carol')['id'] == carol
+        assert store.create_user('dave', 'pw') not in (alice, carol)
+    finally:
+        store.close()
+    for line in journal.read_text(encoding='utf-8').splitlines():
+        json.loads(line)
+
+
+def test_unit_of_work_leaves_resident_record_until_commit(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        user_id = store.create_user('alice', 'pw')
+        unit = UserUnitOfWork(store, user_id)
+        unit.add_materials({'crystal_shard': 5})
+        unit.character_progress('1')['xp'] = 40
+        assert 'inventory' not in store.get_user('alice')
+        unit.commit()
+        assert store.get_user('alice')['inventory'] == {'crystal_shard': 5}
+        assert store.get_user('alice')['player_characters'] == {'1': {'level': 1, 'xp': 40}}
+    finally:
+        store.close()
+
+
+def test_writes_proceed_while_a_compaction_serializes(tmp_path, monkeypatch):
+    store = open_store(tmp_path)
+    try:
+        alice = store.create_user('alice', 'pw')
+        serializing = threading.Event()
+        release = threading.Event()
+        dumps = json.dumps
+
+        def slow_dumps(obj, **kwargs):
+            if kwargs.get('indent') == 4:
+                serializing.set()
+                release.wait(5)
+            return dumps(obj, **kwargs)
+
+        monkeypatch.setattr(storage.json, 'dumps', slow_dumps)
+        compaction = threading.Thread(target=store.compact)
+        compaction.start()
+        assert serializing.wait(5)
+
+        writer = threading.Thread(target=store.create_user, args=('bob', 'pw'))
+        writer.start()
+        writer.join(5)
+        assert not writer.is_alive()
+        store.flush()
+
+        release.set()
+        compaction.join(5)
+        monkeypatch.undo()
+    finally:
+        store.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert store.get_user('alice')['id'] == alice
+        assert store.get_user('bob') is not None
+    finally:
+        store.close()
+
+
+def test_sqlite_rows_must_belong_to_a_user(tmp_path):
+    store = SqliteAccountStore(tmp_path / 'accounts.db')
+    try:
+        user_id = store.create_user('alice', 'pw')
+        store.save_player_state(user_id, {'current_stage': 1, 'seed': 's', 'game_data': {}})
+        store.append_battle_action(user_id, {'type': 'end_turn'}, 1)
+        assert store.get_player_state(user_id)['version'] == 2
+        with pytest.raises(sqlite3.IntegrityError):
+            store.save_player_state('999', {'current_stage': 1, 'seed': 's', 'game_data': {}})
+    finally:
+        store.close()
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import engine
+from catalog import Catalog
+from units import UNIT_TYPES
+
+
+def stored_states():
+    catalog = Catalog().snapshot()
+    with open('accounts.json', 'r') as f:
+        accounts = json.load(f)
+    states = [record['game_data'] for record in accounts.get('player_states', {}).values()
+              if record.get('game_data')]
+    team = catalog.characters[:3]
+    roster = {c['id']: dict(engine.scaled_stats(c, 20), level=20) for c in team}
+    states.extend(engine.new_battle(mission['id'], team, roster) for mission in catalog.missions)
+    return states
+
+
+SPARSE_UNITS = [
+    {'id': 1, 'x': 0, 'y': 0, 'hp': 5},
+    # Defaults written out explicitly stay written out
+    {'id': 1, 'x': 0, 'y': 0, 'hp': 5, 'char_id': None, 'level': None, 'has_acted': False,
+     'element': 'air', 'energy': 0, 'status_effects': {}},
+    {'id': 1, 'x': 0, 'y': 0, 'hp': 5, 'element': 'fire', 'shield_hp': 0, 'shield_weak_to': [], 'damage': 10},
+    # Keys that are not fields come back as they were
+    {'id': 'boss', 'x': 3, 'y': 4, 'hp': 0, 'is_boss': True, 'loot': {'gold': 5}},
+]
+
+
+@pytest.mark.parametrize('side', sorted(UNIT_TYPES))
+def test_stored_units_round_trip(side):
+    unit_type = UNIT_TYPES[side]
+    units = [unit for state in stored_states() for unit in state.get(side, [])]
+    assert units
+    for unit in units + SPARSE_UNITS:
+        assert unit_type.from_wire(unit).to_wire() == unit
@@ -0,0 +1,178 @@
+"""Opt-in per-request tracing and sampled profiling.
+
+While a request is traced, span() and @traced record how long each step
+took (storage load, catalog load, ability resolution, turn advance, enemy
+turn, status effects, the final save) and how they nest. Requests slower
+than the threshold are appended to a JSONL trace file with their spans.
+Separately, 1 in N requests can run under cProfile, each dumped to a .prof
+file named after its endpoint for offline inspection (python -m pstats,
+snakeviz, ...).
+
+Both are off unless configured; with nothing active a span costs one
+context variable lookup. Configured from the environment by Tracer.from_env:
+
+    TRACE_SLOW_MS=50       trace every request, log those over 50 ms
+    TRACE_FILE=traces.jsonl
+    PROFILE_EVERY=100      profile one request in 100
+    PROFILE_DIR=profiles
+"""
+
+import cProfile
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+
+TRACE_FILE = 'traces.jsonl'
+PROFILE_DIR = 'profiles'
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+class Trace:
+    """The spans recorded for one request"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.trace.depth += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self.trace
+        trace.depth -= 1
+        trace.spans.append({
+            'name': self.name,
+            'depth': trace.depth,
+            'start_ms': round((self.started - trace.started) * 1000, 3),
+            'duration_ms': round((time.perf_counter() - self.started) * 1000, 3),
+        })
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """Context manager timing a step of the current request; a no-op when it is not traced"""
+    trace = _current.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+def traced(name):
+    """Decorator recording each call of a function as a span"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            with _Span(trace, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _Request:
+    __slots__ = ('trace', 'token', 'profiler', 'endpoint')
+
+    def __init__(self, trace, token, profiler, endpoint):
+        self.trace = trace
+        self.token = token
+        self.profiler = profiler
+        self.endpoint = endpoint
+
+
+class Tracer:
+    """Starts and finishes request traces and profiles.
+
+    slow_ms=None turns tracing off; profile_every=0 turns profiling off.
+    """
+
+    def __init__(self, slow_ms=None, trace_file=TRACE_FILE, profile_every=0, profile_dir=PROFILE_DIR):
+        self.slow_ms = slow_ms
+        self.trace_file = trace_file
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self._requests = itertools.count(1)
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        slow_ms = environ.get('TRACE_SLOW_MS')
+        return cls(slow_ms=float(slow_ms) if slow_ms else None,
+                   trace_file=environ.get('TRACE_FILE', TRACE_FILE),
+                   profile_every=int(environ.get('PROFILE_EVERY') or 0),
+                   profile_dir=environ.get('PROFILE_DIR', PROFILE_DIR))
+
+    @property
+    def enabled(self):
+        return self.slow_ms is not None or self.profile_every > 0
+
+    def start(self, endpoint):
+        """Begin a request; returns the handle for finish(), or None if nothing is recorded"""
+        if not self.enabled:
+            return None
+        trace = token = profiler = None
+        if self.slow_ms is not None:
+            trace = Trace(endpoint)
+            token = _current.set(trace)
+        if self.profile_every and next(self._requests) % self.profile_every == 0:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already running (e.g. a concurrent sampled request)
+                profiler = None
+        if trace is None and profiler is None:
+            return None
+        return _Request(trace, token, profiler, endpoint)
+
+    def finish(self, request, **fields):
+        """End a request: dump its profile if sampled, log its trace if it was slow"""
+        if request.profiler is not None:
+            request.profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f'{request.endpoint}.{time.time_ns()}.{os.getpid()}.prof')
+            request.profiler.dump_stats(path)
+        trace = request.trace
+        if trace is None:
+            return
+        _current.reset(request.token)
+        duration_ms = trace.elapsed_ms()
+        if duration_ms < self.slow_ms:
+            return
+        record = {'time': time.time(), 'endpoint': trace.name, **fields, 'duration_ms': round(duration_ms, 3),
+                  'spans': sorted(trace.spans, key=lambda s: s['start_ms'])}
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._write_lock:
+            with open(self.trace_file, 'a', encoding='utf-8') as f:
+                f.write(line)
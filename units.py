@@ -0,0 +1,126 @@
+"""Slotted battle units with interned elements.
+
+The battle JSON keeps characters and enemies as dicts of string keys, which
+is what is stored, diffed and sent to the client. While a battle is held in
+memory its units are Character and Enemy objects instead: a fixed set of
+__slots__ fields read as attributes, with elements (and the elements an
+enemy's shield is weak to) interned as small ints. Battle converts the dicts
+with from_wire() when it wraps a game_state; to_wire() and json_default()
+turn the units back into dicts at the edges (snapshots, responses, patches
+and events).
+
+Fields a stored unit lacks take their defaults and are left out of the
+wire dict again while they still hold them, so an unchanged unit is written
+back with the keys it was read with. Keys that are not fields are kept in
+`extra` and written back as they were.
+"""
+
+REQUIRED = object()
+
+ELEMENT_NAMES = []  # element id -> name
+_ELEMENT_IDS = {}
+
+
+def element_id(name):
+    """The interned id of an element name; a new name gets the next id"""
+    interned = _ELEMENT_IDS.get(name)
+    if interned is None:
+        interned = _ELEMENT_IDS[name] = len(ELEMENT_NAMES)
+        ELEMENT_NAMES.append(name)
+    return interned
+
+
+def element_name(interned):
+    return ELEMENT_NAMES[interned]
+
+
+class Unit:
+    """A battle unit; subclasses list their wire fields, in wire order, with defaults"""
+
+    __slots__ = ('extra', 'defaulted')
+    side = None
+    FIELDS = ()  # (name, default); REQUIRED has no default, a callable default is called per unit
+
+    @classmethod
+    def from_wire(cls, data):
+        unit = cls.__new__(cls)
+        rest = dict(data)
+        defaulted = []
+        for field, default in cls.FIELDS:
+            if field in rest:
+                value = rest.pop(field)
+            elif default is REQUIRED:
+                raise KeyError(field)
+            else:
+                value = default() if callable(default) else default
+                defaulted.append(field)
+            if field == 'element':
+                value = element_id(value)
+            elif field == 'shield_weak_to':
+                value = tuple(element_id(name) for name in value)
+            setattr(unit, field, value)
+        unit.extra = rest or None
+        unit.defaulted = frozenset(defaulted) if defaulted else None
+        return unit
+
+    def to_wire(self):
+        data = {}
+        defaulted = self.defaulted
+        for field, default in self.FIELDS:
+            value = getattr(self, field)
+            if field == 'element':
+                value = ELEMENT_NAMES[value]
+            elif field == 'shield_weak_to':
+                value = [ELEMENT_NAMES[interned] for interned in value]
+            if defaulted and field in defaulted and value == (default() if callable(default) else default):
+                continue
+            data[field] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_wire()!r})'
+
+
+class Character(Unit):
+    side = 'characters'
+    FIELDS = (
+        ('id', REQUIRED), ('char_id', None), ('name', None), ('x', REQUIRED), ('y', REQUIRED),
+        ('hp', REQUIRED), ('max_hp', None), ('attack_range', 2), ('skill_attack_range', None),
+        ('move_range', None), ('has_acted', False), ('damage', None), ('skill_damage', None),
+        ('element', 'air'), ('level', None), ('energy', 0), ('max_energy', 100), ('status_effects', dict),
+    )
+    __slots__ = tuple(field for field, _ in FIELDS)
+
+
+class Enemy(Unit):
+    side = 'enemies'
+    FIELDS = (
+        ('id', REQUIRED), ('x', REQUIRED), ('y', REQUIRED), ('hp', REQUIRED), ('max_hp', None),
+        ('attack_range', None), ('move_range', None), ('damage', 10), ('element', 'fire'),
+        ('shield_hp', 0), ('max_shield_hp', 0), ('shield_weak_to', list), ('status_effects', dict),
+    )
+    __slots__ = tuple(field for field, _ in FIELDS)
+
+
+UNIT_TYPES = {'characters': Character, 'enemies': Enemy}
+
+
+def load_units(game_state):
+    """Replace the unit dicts of a game_state with Character and Enemy objects, in place"""
+    for side, unit_type in UNIT_TYPES.items():
+        units = game_state.get(side)
+        if units and not all(isinstance(unit, Unit) for unit in units):
+            game_state[side] = [unit if isinstance(unit, Unit) else unit_type.from_wire(unit) for unit in units]
+
+
+def wire_unit(unit):
+    return unit.to_wire() if isinstance(unit, Unit) else unit
+
+
+def json_default(value):
+    """`default` for json.dumps: writes units as their wire dicts"""
+    if isinstance(value, Unit):
+        return value.to_wire()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
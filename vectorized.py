@@ -0,0 +1,97 @@
+"""Batched targeting for enemy phases with many enemies and characters.
+
+The plain enemy phase compares every enemy with every character in Python
+and works out damage one pair at a time. For large encounters EnemyTargeting
+packs positions, ranges, damage and status flags into NumPy arrays once per
+phase and computes the enemy x character distance matrix, each enemy's
+nearest characters and the damage of every possible hit in bulk. The enemy
+loop then only does the sequential part: random tie-breaks, HP changes,
+deaths (which mask a column out) and movement.
+
+NumPy is optional; without it, or below BATCH_MIN_PAIRS, the plain loop runs.
+"""
+
+from status import unit_modifiers
+from units import ELEMENT_NAMES
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the enemy phase falls back to plain Python
+    np = None
+
+# Below this many enemy x character pairs the plain loop is faster than building arrays
+BATCH_MIN_PAIRS = 256
+
+_FAR = 1 << 40
+
+
+def batching_available(enemy_count, character_count, min_pairs=BATCH_MIN_PAIRS):
+    return np is not None and enemy_count * character_count >= min_pairs
+
+
+class EnemyTargeting:
+    """Distance and damage matrices for one enemy phase.
+
+    Rows follow `enemies`, columns follow `characters`; both lists are
+    taken at the start of the phase. Characters do not move during the
+    enemy phase and each enemy only moves on its own turn, so the distances
+    stay valid for the enemies that have not acted yet.
+    """
+
+    def __init__(self, enemies, characters, element_multiplier, status=None):
+        self.characters = characters
+        self._columns = {char.id: column for column, char in enumerate(characters)}
+
+        ex = np.array([e.x for e in enemies], dtype=np.int64)
+        ey = np.array([e.y for e in enemies], dtype=np.int64)
+        cx = np.array([c.x for c in characters], dtype=np.int64)
+        cy = np.array([c.y for c in characters], dtype=np.int64)
+        self.distances = np.abs(ex[:, None] - cx[None, :]) + np.abs(ey[:, None] - cy[None, :])
+        self.ranges = np.array([e.attack_range for e in enemies], dtype=np.int64)
+        modifiers = status.modifiers if status is not None else lambda side, unit: unit_modifiers(unit)
+        self.damage = self._damage_matrix(enemies, characters, element_multiplier, modifiers)
+
+        self._masked = self.distances.copy()
+        self._refresh()
+
+    @staticmethod
+    def _damage_matrix(enemies, characters, element_multiplier, modifiers):
+        """Vectorized status.modified_damage over every enemy/character pair, after element effectiveness"""
+        # Elements are interned ids (units.py), so they index the effectiveness table directly
+        kinds = range(len(ELEMENT_NAMES))
+        table = np.array([[element_multiplier(a, d) for d in kinds] for a in kinds], dtype=np.float64)
+        enemy_codes = np.array([e.element for e in enemies], dtype=np.int64)
+        char_codes = np.array([c.element for c in characters], dtype=np.int64)
+        multipliers = table[enemy_codes[:, None], char_codes[None, :]]
+
+        base = np.array([e.damage for e in enemies], dtype=np.float64)
+        damage = np.trunc(base[:, None] * multipliers)
+
+        # Attacker multipliers, then each defender's guard, as status.modified_damage does
+        outgoing = np.array([modifiers('enemies', e).damage_multiplier for e in enemies], dtype=np.float64)
+        damage = damage * outgoing[:, None]
+        guards = [modifiers('characters', c).guard or (1, 0) for c in characters]
+        guard_multipliers = np.array([multiplier for multiplier, _ in guards], dtype=np.float64)
+        absorbed = np.array([amount for _, amount in guards], dtype=np.float64)
+        damage = np.trunc(damage * guard_multipliers[None, :]) - absorbed[None, :]
+        return np.maximum(0, damage).astype(np.int64)
+
+    def _refresh(self):
+        self.nearest = self._masked.min(axis=1) if self._masked.shape[1] else np.full(len(self.ranges), _FAR)
+        self.in_range = self.nearest <= self.ranges
+
+    def closest(self, row):
+        """(distance, characters) for the living characters nearest to enemy `row`"""
+        nearest = self.nearest[row]
+        if nearest >= _FAR:
+            return float('inf'), []
+        columns = np.flatnonzero(self._masked[row] == nearest)
+        return int(nearest), [self.characters[column] for column in columns]
+
+    def damage_to(self, row, char):
+        return int(self.damage[row, self._columns[char.id]])
+
+    def kill(self, char):
+        """Drop a defeated character from targeting for the rest of the phase"""
+        self._masked[:, self._columns[char.id]] = _FAR
+        self._refresh()